@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Benchmarks for the confutil helpers against the fake registry.
+
+    python -m bench.benchmark --scale 0.1 --latency 0.0005
+    python -m bench.benchmark --save-baseline bench.json
+    python -m bench.benchmark --baseline bench.json
+
+At scale 1 the dataset has 1000 companies, 50 accounts each (50,000
+accounts) and 500 users.  Each benchmark reports the wall time and the
+number of round trips (model method calls) it made.  Given a baseline,
+benchmarks that now make more round trips, or are more than --tolerance
+slower, are reported as regressions and the exit status is 1.
+
+Add a benchmark by decorating a function taking a Dataset with
+@benchmark('name').
+"""
+
+from collections import OrderedDict
+import json
+import time
+
+from confutil import confutil
+from confutil import account_setup
+from confutil.importer import import_account_settings
+from confutil.company_clone import clone_company_configuration
+from tests.fixtures import Dataset, UID
+
+import logging
+_logger = logging.getLogger(__name__)
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """Register a function taking a Dataset as a benchmark.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+@benchmark('lookup.account_id')
+def bench_account_id(data):
+    lookup = data.lookup()
+    for company in data.companies():
+        for code in data.codes[:5]:
+            lookup.account_id(company, code)
+
+
+@benchmark('lookup.account_ids')
+def bench_account_ids(data):
+    lookup = data.lookup()
+    for company in data.companies():
+        lookup.account_ids(company, data.codes[:5])
+
+
+@benchmark('lookup.account_id cached x2')
+def bench_account_id_cached(data):
+    lookup = data.lookup(cache_size=100000)
+    for _repeat in range(2):
+        for company in data.companies():
+            for code in data.codes[:5]:
+                lookup.account_id(company, code)
+
+
+@benchmark('lookup.account_ids_by_prefix')
+def bench_account_ids_by_prefix(data):
+    lookup = data.lookup()
+    for company in data.companies():
+        for prefix in ('10', '11', '12', '13', '14'):
+            lookup.account_ids_by_prefix(company, prefix)
+        lookup.account_ids_in_range(company, '100000', '12')
+
+
+@benchmark('lookup.account_id deferred')
+def bench_account_id_deferred(data):
+    lookup = data.lookup(deferred=True)
+    pending = [lookup.account_id(company, code)
+               for company in data.companies() for code in data.codes[:5]]
+    lookup.resolve(pending)
+
+
+@benchmark('set_default_taxes')
+def bench_set_default_taxes(data):
+    for company in data.companies(limit=100):
+        confutil.set_default_taxes(data.cr, data.registry, UID, company, 'ST11', 'PT11', context={})
+
+
+@benchmark('set_default_taxes batched')
+def bench_set_default_taxes_batched(data):
+    with confutil.SettingsBatch(data.cr, data.registry, UID, context={}) as batch:
+        for company in data.companies(limit=100):
+            confutil.set_default_taxes(data.cr, data.registry, UID, company, 'ST11', 'PT11',
+                context={}, batch=batch)
+
+
+@benchmark('select_user_levels')
+def bench_select_user_levels(data):
+    for user in data.users():
+        confutil.select_user_levels(data.cr, data.registry, UID, user,
+            changes={'Sales': 'Manager', 'Warehouse': 'User'},
+            context={},
+        )
+
+
+@benchmark('select_users_levels')
+def bench_select_users_levels(data):
+    confutil.select_users_levels(data.cr, data.registry, UID,
+        [(user, {'Sales': 'Manager', 'Warehouse': 'User'}) for user in data.users()],
+        context={},
+    )
+
+
+@benchmark('set_default_customer_sale_pricelist')
+def bench_pricelists(data):
+    pricelist = data.registry['product.pricelist'].browse(data.cr, UID, data.pricelist_id)
+    for company in data.companies(limit=100):
+        confutil.set_default_customer_sale_pricelist(data.cr, data.registry, UID, company, pricelist, context={})
+
+
+@benchmark('set_company_default_properties')
+def bench_bulk_properties(data):
+    pricelist = data.registry['product.pricelist'].browse(data.cr, UID, data.pricelist_id)
+    confutil.set_company_default_properties(data.cr, data.registry, UID, {
+        ('res.partner', 'property_product_pricelist'): dict(
+            (company, pricelist) for company in data.companies(limit=100)
+        ),
+    }, context={})
+
+
+@benchmark('create_consolidation_account')
+def bench_consolidation(data):
+    lookup = data.lookup()
+    for company in data.companies(limit=20):
+        children = lookup.account_ids(company, data.codes).values()
+        confutil.create_consolidation_account(data.cr, data.registry, UID, company,
+            code='999999', name='Consolidation', children=children, context={},
+        )
+
+
+@benchmark('create_consolidation_tree')
+def bench_consolidation_tree(data):
+    confutil.create_consolidation_tree(data.cr, data.registry, UID, data.companies(limit=20), [
+        {'code': '999100', 'name': 'Low accounts', 'prefixes': ['10', '11', '12']},
+        {'code': '999200', 'name': 'High accounts', 'prefixes': ['13', '14']},
+        {'code': '999000', 'name': 'All accounts', 'children': ['999100', '999200']},
+    ], context={})
+
+
+@benchmark('setup_company_accounts')
+def bench_setup_company_accounts(data):
+    template = data.registry['account.chart.template'].browse(data.cr, UID, data.chart_template_id)
+    for company in data.new_companies(10):
+        account_setup.setup_company_accounts(data.cr, data.registry, UID, company, template, context={})
+
+
+@benchmark('setup_companies_accounts')
+def bench_setup_companies_accounts(data):
+    template = data.registry['account.chart.template'].browse(data.cr, UID, data.chart_template_id)
+    account_setup.setup_companies_accounts(data.cr, data.registry, UID,
+        data.companies(limit=10) + data.new_companies(10), template, context={},
+    )
+
+
+@benchmark('create_fiscal_years')
+def bench_create_fiscal_years(data):
+    account_setup.create_fiscal_years(data.cr, data.registry, UID,
+        data.company_ids[:50], range(2010, 2015), context={},
+    )
+
+
+@benchmark('import_account_settings')
+def bench_import_account_settings(data):
+    rows = ((line, {'code': data.codes[line % len(data.codes)], 'reconcile': 'true' if line % 2 else 'false',
+                    'taxes': 'ST11'})
+            for line in xrange(len(data.company_ids) * 20))
+    import_account_settings(data.cr, data.registry, UID, data.companies(limit=1)[0], rows,
+        chunk_size=500, context={},
+    )
+
+
+@benchmark('lookup.period_ids')
+def bench_period_ids(data):
+    company_ids = data.company_ids[:20]
+    account_setup.create_fiscal_years(data.cr, data.registry, UID, company_ids, [2014, 2015], context={})
+    data.registry.reset_counters()
+    lookup = data.lookup()
+    days = ['%d-%02d-%02d' % (year, month, day)
+            for year in (2014, 2015) for month in range(1, 13) for day in (1, 15, 28)]
+    for company_id in company_ids:
+        lookup.period_ids(company_id, days)
+
+
+@benchmark('clone_company_configuration')
+def bench_clone_company_configuration(data):
+    companies = data.companies(limit=50)
+    reference = companies[0]
+    confutil.enable_multi_currency(data.cr, data.registry, UID, reference, data.codes[3], data.codes[4], context={})
+    confutil.set_companies_default_product_taxes(data.cr, data.registry, UID,
+        {reference: ('ST11', 'PT11')}, context={})
+    data.registry.reset_counters()
+    clone_company_configuration(data.cr, data.registry, UID, reference, companies[1:], context={})
+
+
+def run_benchmarks(scale=1.0, latency=0.0, only=None):
+    """Run the benchmarks, each against a freshly built Dataset.
+
+    Returns an ordered dictionary of name: {'seconds': float, 'round_trips': int}.
+    """
+    results = OrderedDict()
+    for name, func in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        data = Dataset(
+            companies=max(1, int(1000 * scale)),
+            users=max(1, int(500 * scale)),
+            latency=latency,
+        )
+        data.registry.reset_counters()
+        started = time.time()
+        func(data)
+        results[name] = {
+            'seconds': time.time() - started,
+            'round_trips': data.registry.round_trips,
+        }
+        _logger.info('benchmark %s: %r' % (name, results[name]))
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Return list of (name, message) for benchmarks that regressed against baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['round_trips'] > base['round_trips']:
+            regressions.append((name, 'round trips %d -> %d' % (base['round_trips'], result['round_trips'])))
+        if result['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append((name, 'time %.3fs -> %.3fs' % (base['seconds'], result['seconds'])))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = ['%-40s %10s %12s %12s' % ('benchmark', 'seconds', 'round trips', 'baseline rt')]
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        lines.append('%-40s %10.3f %12d %12s' % (
+            name, result['seconds'], result['round_trips'],
+            base['round_trips'] if base else '-',
+        ))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark confutil helpers against a fake registry.')
+    parser.add_argument('--scale', type=float, default=1.0,
+        help='Dataset size relative to 1000 companies / 500 users (default 1)')
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='Seconds of simulated latency per round trip')
+    parser.add_argument('--only', action='append', help='Only run this benchmark (repeatable)')
+    parser.add_argument('--baseline', help='JSON file of earlier results to compare against')
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+        help='Allowed fractional slowdown before a time regression is reported')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(scale=args.scale, latency=args.latency, only=args.only)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if baseline:
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        for name, message in regressions:
+            print('REGRESSION %s: %s' % (name, message))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -26,7 +26,11 @@ into a company.
 The function you probably want to use is setup_company_accounts()
 """
 
-from datetime import date
+from collections import OrderedDict
+from datetime import date, timedelta
+import time
+
+from .confutil import invalidate_lookups
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -65,6 +69,39 @@ def setup_company_accounts(cr, registry, uid, company, chart_template, code_digi
             context=context,
         )
 
+def setup_companies_accounts(cr, registry, uid, companies, chart_template, code_digits=None, context=None):
+    """Like setup_company_accounts() but for many companies.
+
+    The unconfigured companies are found with one scan, companies that
+    already have a chart are skipped without any more queries, and this
+    year's fiscal year is created for all the new charts together.
+
+    Returns an ordered dictionary mapping company id: {
+        'status': 'configured' or 'skipped',
+        'seconds': time spent installing that company's chart,
+    }
+    """
+    unconfigured = set(unconfigured_company_ids(cr, registry, uid, context=context))
+    results = OrderedDict()
+    for company in companies:
+        if company.id not in unconfigured:
+            results[company.id] = {'status': 'skipped', 'seconds': 0.0}
+            continue
+        started = time.time()
+        setup_chart_of_accounts(cr, registry, uid,
+            company_id=company.id,
+            chart_template_id=chart_template.id,
+            code_digits=code_digits,
+            context=context,
+        )
+        results[company.id] = {'status': 'configured', 'seconds': time.time() - started}
+
+    configured_ids = [company_id for company_id, result in results.items()
+                      if result['status'] == 'configured']
+    if configured_ids:
+        create_fiscal_years(cr, registry, uid, configured_ids, [date.today().year], context=context)
+    return results
+
 def unconfigured_company_ids(cr, registry, uid, context=None):
     """Return list of ids of companies without a chart of accounts.
     """
@@ -92,6 +129,7 @@ def setup_chart_of_accounts(cr, registry, uid, company_id, chart_template_id, co
 
     conf_id = chart_wizard.create(cr, uid, data, context=context)
     chart_wizard.execute(cr, uid, [conf_id], context=context)
+    invalidate_lookups(cr)
 
 def create_fiscal_year(cr, registry, uid, company_id, name, code, start_date, end_date, context=None):
     fy_model = registry['account.fiscalyear']
@@ -105,5 +143,128 @@ def create_fiscal_year(cr, registry, uid, company_id, name, code, start_date, en
     })
     fy_id = fy_model.create(cr, uid, fy_data, context=context)
     fy_model.create_period(cr, uid, [fy_id], context=context)
+    invalidate_lookups(cr, 'account.fiscalyear')
+    invalidate_lookups(cr, 'account.period')
+
+def create_fiscal_years(cr, registry, uid, company_ids, years, interval=1, start_month=1, use_sql=False, context=None):
+    """Create fiscal years and their periods for many companies and years at once.
+
+    company_ids: ids of the companies to create fiscal years for
+    years: The years to create, e.g. range(2010, 2016).  A year is named
+           after the calendar year it starts in.
+    interval: Length of each period in months (1 for monthly, 3 for quarterly)
+    start_month: Month each fiscal year starts in, default January
+    use_sql: Insert all the periods with one multi-row INSERT rather than
+             one create_period() call.  This skips the ORM, so only use it
+             on a fresh database where nothing else depends on periods.
+
+    Fiscal years overlapping one that already exists for the company are
+    skipped, so this is safe to re-run.  Existing fiscal years are found
+    with a single search_read.
+
+    Returns list of ids of the fiscal years created.
+    """
+    fy_model = registry['account.fiscalyear']
+    existing = fy_model.search_read(cr, uid,
+        [('company_id', 'in', list(company_ids))],
+        fields=['company_id', 'date_start', 'date_stop'],
+        context=context,
+    )
+    existing_ranges = {}
+    for fy in existing:
+        company_id = fy['company_id'][0] if isinstance(fy['company_id'], (list, tuple)) else fy['company_id']
+        existing_ranges.setdefault(company_id, []).append((fy['date_start'], fy['date_stop']))
+
+    defaults = fy_model.default_get(cr, uid, ['state'], context=context)
+    created = []
+    for company_id in company_ids:
+        for year in years:
+            start, stop = fiscal_year_dates(year, start_month)
+            start_date, end_date = start.strftime('%Y-%m-%d'), stop.strftime('%Y-%m-%d')
+            if any(start_date <= other_stop and other_start <= end_date
+                   for other_start, other_stop in existing_ranges.get(company_id, [])):
+                _logger.debug('create_fiscal_years: company %s already has a fiscal year covering %s'
+                              % (company_id, start_date))
+                continue
+            fy_data = dict(defaults)
+            fy_data.update({
+                'company_id': company_id,
+                'name': '%d' % (year,) if start_month == 1 else '%d/%d' % (year, year + 1),
+                'code': 'FY%d' % (year,),
+                'date_start': start_date,
+                'date_stop': end_date,
+            })
+            fy_id = fy_model.create(cr, uid, fy_data, context=context)
+            created.append((fy_id, company_id, start, stop))
+            existing_ranges.setdefault(company_id, []).append((start_date, end_date))
+
+    if created:
+        if use_sql:
+            _insert_periods(cr, uid, created, interval)
+        else:
+            fy_model.create_period(cr, uid, [fy_id for fy_id, _c, _s, _e in created],
+                context=context, interval=interval,
+            )
+    invalidate_lookups(cr, 'account.fiscalyear')
+    invalidate_lookups(cr, 'account.period')
+    return [fy_id for fy_id, _c, _s, _e in created]
+
+def fiscal_year_dates(year, start_month=1):
+    """Return (first day, last day) of the fiscal year starting in year.
+    """
+    start = date(year, start_month, 1)
+    return start, _add_months(start, 12) - timedelta(days=1)
+
+def period_rows(fiscalyear_id, company_id, start, stop, interval=1):
+    """Return list of account.period values for a fiscal year.
+
+    Mirrors account.fiscalyear.create_period(): an opening period on the
+    first day, then one period every interval months.
+    """
+    rows = [{
+        'name': 'Opening Period %s' % (start.strftime('%Y'),),
+        'code': start.strftime('00/%Y'),
+        'date_start': start.strftime('%Y-%m-%d'),
+        'date_stop': start.strftime('%Y-%m-%d'),
+        'special': True,
+        'fiscalyear_id': fiscalyear_id,
+        'company_id': company_id,
+    }]
+    period_start = start
+    while period_start < stop:
+        period_stop = min(_add_months(period_start, interval) - timedelta(days=1), stop)
+        rows.append({
+            'name': period_start.strftime('%m/%Y'),
+            'code': period_start.strftime('%m/%Y'),
+            'date_start': period_start.strftime('%Y-%m-%d'),
+            'date_stop': period_stop.strftime('%Y-%m-%d'),
+            'special': False,
+            'fiscalyear_id': fiscalyear_id,
+            'company_id': company_id,
+        })
+        period_start = period_stop + timedelta(days=1)
+    return rows
+
+def _insert_periods(cr, uid, fiscal_years, interval):
+    columns = ['name', 'code', 'date_start', 'date_stop', 'special', 'fiscalyear_id', 'company_id']
+    rows = [row for fy_id, company_id, start, stop in fiscal_years
+            for row in period_rows(fy_id, company_id, start, stop, interval)]
+    # the columns, then create_uid and write_uid
+    placeholders = "(%s, now() at time zone 'UTC', now() at time zone 'UTC', 'draft')" % (
+        ', '.join(['%s'] * (len(columns) + 2)),
+    )
+    params = []
+    for row in rows:
+        params.extend(row[column] for column in columns)
+        params.extend([uid, uid])
+    cr.execute(
+        'INSERT INTO account_period (%s, create_uid, write_uid, create_date, write_date, state) VALUES %s'
+        % (', '.join(columns), ', '.join([placeholders] * len(rows))),
+        params,
+    )
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Install the same chart of accounts into many companies quickly.
+
+wizard.multi.charts.accounts walks the whole template tree for every
+company.  When many companies get the same chart_template, it's much
+quicker to run the wizard once, take a snapshot of the records it made,
+and replay that snapshot into the other companies with company ids and
+references between the records remapped:
+
+    setup_charts_of_accounts(cr, registry, SUPERUSER_ID,
+        company_ids=[uk1.id, uk2.id, uk3.id],
+        chart_template_id=chart_template.id,
+        context=context.copy(),
+    )
+
+The first company always goes through the wizard, which remains the
+reference implementation.
+
+Records of the models in CHART_MODELS belonging to the reference company
+are copied, plus the company's default ir.property rows, its default
+product taxes in ir.values and the res.company fields in COMPANY_FIELDS,
+which are what the wizard sets up.  Anything else the wizard might touch
+isn't.  Replay writes through create() with
+parent store computation deferred to the end, because writing the
+account tables directly would leave parent_left/parent_right wrong.
+
+Default properties referring to chart records are pointed at the new
+company's copies.  Those referring to other records that belong to the
+reference company, such as a company-specific pricelist, aren't copied:
+they are listed in the snapshot's skipped attribute and logged.  The
+properties, product taxes and company fields of all the replayed
+companies are set together at the end.
+"""
+
+from collections import OrderedDict
+
+from .confutil import (
+    invalidate_lookups, set_company_default_properties, set_product_tax_defaults,
+    _company_owned, _unpickle_default,
+)
+from .account_setup import setup_chart_of_accounts, unconfigured_company_ids
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+# In creation order.  References to models later in the list are
+# written once everything has been created.
+CHART_MODELS = [
+    'account.tax.code',
+    'account.account',
+    'account.tax',
+    'account.journal',
+    'account.fiscal.position',
+    'account.fiscal.position.tax',
+    'account.fiscal.position.account',
+]
+
+# res.company fields the wizard writes
+COMPANY_FIELDS = ['currency_id', 'accounts_code_digits']
+
+# ir.values defaults of product.template the wizard sets for the company
+PRODUCT_TAX_FIELDS = ['taxes_id', 'supplier_taxes_id']
+
+_SKIP_FIELDS = set([
+    'id',
+    'parent_left',
+    'parent_right',
+    'create_uid',
+    'create_date',
+    'write_uid',
+    'write_date',
+])
+
+# Fields not copied because create() makes a fresh one for the new company
+_DROP_FIELDS = {
+    'account.journal': set(['sequence_id']),
+}
+
+
+class ChartSnapshot(object):
+    """The records a chart of accounts installation created for one company.
+
+    records: Dictionary of model name: list of (old id, values) in
+             creation order.  Values still hold the reference company's ids.
+    references: Dictionary of model name: {field name: comodel name} for the
+                relational fields that may need remapping.
+    properties: Dictionary of (model name, field name): value_reference
+                for the company's default many2one ir.property rows
+    company_values: Dictionary of the COMPANY_FIELDS of the company
+    product_taxes: Dictionary of ir.values field name: list of tax ids,
+                   for the company's default product taxes
+    skipped: Dictionary of (model name, field name): value_reference of
+             the default properties left out because they refer to a
+             record of the company outside the chart
+    """
+    def __init__(self, company_id, records, references, properties, company_values=None, product_taxes=None,
+                 skipped=None):
+        self.company_id = company_id
+        self.records = records
+        self.references = references
+        self.properties = properties
+        self.company_values = company_values or {}
+        self.product_taxes = product_taxes or {}
+        self.skipped = skipped or {}
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.records.values())
+
+
+def capture_chart(cr, registry, uid, company_id, context=None):
+    """Return a ChartSnapshot of company_id's chart of accounts.
+    """
+    context = dict(context or {}, active_test=False)
+    records = {}
+    references = {}
+    for model_name in CHART_MODELS:
+        if model_name not in registry:
+            continue
+        model = registry[model_name]
+        fields = _copyable_fields(model)
+        for name in _DROP_FIELDS.get(model_name, ()):
+            fields.pop(name, None)
+        references[model_name] = dict(
+            (name, comodel) for name, (field_type, comodel) in fields.items() if comodel
+        )
+        if 'company_id' in fields:
+            domain = [('company_id', '=', company_id)]
+        else:
+            domain = _parent_domain(model_name, records)
+            if domain is None:
+                continue
+        rows = model.search_read(cr, uid, domain,
+            fields=list(fields),
+            context=context,
+        )
+        records[model_name] = _creation_order(model_name, [
+            (row['id'], _plain_values(row, fields)) for row in rows
+        ], references[model_name])
+
+    properties, skipped = _capture_properties(cr, registry, uid, company_id, records, context=context)
+    company = registry['res.company'].search_read(cr, uid, [('id', '=', company_id)],
+        fields=COMPANY_FIELDS,
+        context=context,
+    )[0]
+    company_values = dict((name, _id_of(company.get(name, False))) for name in COMPANY_FIELDS)
+
+    product_taxes = {}
+    for default in registry['ir.values'].search_read(cr, uid,
+            [
+                ('key', '=', 'default'),
+                ('model', '=', 'product.template'),
+                ('name', 'in', PRODUCT_TAX_FIELDS),
+                ('company_id', '=', company_id),
+                ('user_id', '=', False),
+            ],
+            fields=['name', 'value'],
+            context=context):
+        product_taxes[default['name']] = list(_unpickle_default(default['value']) or [])
+
+    snapshot = ChartSnapshot(company_id, records, references, properties,
+        company_values=company_values,
+        product_taxes=product_taxes,
+        skipped=skipped,
+    )
+    _logger.debug('capture_chart: %d records for company %s' % (len(snapshot), company_id))
+    return snapshot
+
+
+def _capture_properties(cr, registry, uid, company_id, records, context=None):
+    """Return (properties, skipped) for ChartSnapshot.
+    """
+    props = registry['ir.property'].search_read(cr, uid,
+        [('company_id', '=', company_id), ('res_id', '=', False)],
+        fields=['fields_id', 'value_reference'],
+        context=context,
+    )
+    props = [prop for prop in props if prop['value_reference']]
+    if not props:
+        return {}, {}
+    fields_info = dict((info['id'], (info['model'], info['name']))
+        for info in registry['ir.model.fields'].search_read(cr, uid,
+            [('id', 'in', list(set(_id_of(prop['fields_id']) for prop in props)))],
+            fields=['model', 'name'],
+            context=context,
+        ))
+
+    chart_ids = set((model_name, old_id) for model_name, rows in records.items() for old_id, _values in rows)
+    outside = {}
+    for prop in props:
+        reference = _split_reference(prop['value_reference'])
+        if reference and reference not in chart_ids:
+            outside.setdefault(reference[0], set()).add(reference[1])
+    owned = _company_owned(cr, registry, uid, outside, context=context)
+
+    properties = {}
+    skipped = {}
+    for prop in props:
+        key = fields_info[_id_of(prop['fields_id'])]
+        if _split_reference(prop['value_reference']) in owned:
+            _logger.warning('capture_chart: not copying property %s.%s = %s, which belongs to company %s'
+                            % (key[0], key[1], prop['value_reference'], company_id))
+            skipped[key] = prop['value_reference']
+        else:
+            properties[key] = prop['value_reference']
+    return properties, skipped
+
+
+def replay_chart(cr, registry, uid, snapshot, company_id, context=None):
+    """Recreate the records in snapshot for company_id.
+
+    Returns dictionary mapping (model name, old id): new id.
+    """
+    id_map = _replay_records(cr, registry, uid, snapshot, company_id, context=context)
+    _replay_company_defaults(cr, registry, uid, snapshot, {company_id: id_map}, context=context)
+    invalidate_lookups(cr)
+    return id_map
+
+
+def _replay_records(cr, registry, uid, snapshot, company_id, context=None):
+    """Create the snapshot's records for company_id, returning the id map.
+    """
+    create_context = dict(context or {}, defer_parent_store_computation=True)
+    id_map = {}
+    deferred = []
+    for position, model_name in enumerate(CHART_MODELS):
+        rows = snapshot.records.get(model_name)
+        if not rows:
+            continue
+        model = registry[model_name]
+        references = snapshot.references[model_name]
+        later = set(name for name, comodel in references.items()
+                    if comodel in CHART_MODELS[position + 1:])
+        for old_id, values in rows:
+            new_values = _remap(values, references, id_map, snapshot.company_id, company_id)
+            forward = dict((name, values[name]) for name in later if values.get(name))
+            for name in forward:
+                del new_values[name]
+            new_id = model.create(cr, uid, new_values, context=create_context)
+            id_map[model_name, old_id] = new_id
+            if forward:
+                deferred.append((model_name, new_id, forward))
+        if getattr(model, '_parent_store', False):
+            model._parent_store_compute(cr)
+
+    for model_name, new_id, forward in deferred:
+        references = snapshot.references[model_name]
+        registry[model_name].write(cr, uid, [new_id],
+            _remap(forward, dict((name, references[name]) for name in forward),
+                   id_map, snapshot.company_id, company_id),
+            context=context,
+        )
+
+    return id_map
+
+
+def _replay_company_defaults(cr, registry, uid, snapshot, id_maps, context=None):
+    """Give each company in id_maps the snapshot's default properties,
+    product taxes and company fields, with references remapped.
+
+    id_maps: Dictionary of company id: id map from _replay_records()
+    """
+    if snapshot.properties:
+        set_company_default_properties(cr, registry, uid, dict(
+            (key, dict((company_id, _remap_reference(value_reference, id_map))
+                       for company_id, id_map in id_maps.items()))
+            for key, value_reference in snapshot.properties.items()
+        ), context=context)
+    if snapshot.company_values:
+        registry['res.company'].write(cr, uid, list(id_maps), snapshot.company_values, context=context)
+    if snapshot.product_taxes:
+        set_product_tax_defaults(cr, registry, uid, dict(
+            ((company_id, field_name), [id_map.get(('account.tax', tax_id), tax_id) for tax_id in tax_ids])
+            for company_id, id_map in id_maps.items()
+            for field_name, tax_ids in snapshot.product_taxes.items()
+        ), context=context)
+
+
+def setup_charts_of_accounts(cr, registry, uid, company_ids, chart_template_id, code_digits=None, context=None):
+    """Install chart_template_id into each of company_ids that hasn't got a chart.
+
+    The first unconfigured company is set up by the wizard and the rest by
+    replaying a snapshot of its result.
+
+    Returns list of ids of the companies that were set up.
+    """
+    unconfigured = set(unconfigured_company_ids(cr, registry, uid, context=context))
+    todo = [company_id for company_id in company_ids if company_id in unconfigured]
+    if not todo:
+        return []
+    reference_id = todo[0]
+    setup_chart_of_accounts(cr, registry, uid,
+        company_id=reference_id,
+        chart_template_id=chart_template_id,
+        code_digits=code_digits,
+        context=context,
+    )
+    if len(todo) > 1:
+        snapshot = capture_chart(cr, registry, uid, reference_id, context=context)
+        id_maps = OrderedDict(
+            (company_id, _replay_records(cr, registry, uid, snapshot, company_id, context=context))
+            for company_id in todo[1:]
+        )
+        _replay_company_defaults(cr, registry, uid, snapshot, id_maps, context=context)
+        invalidate_lookups(cr)
+    return todo
+
+
+def _copyable_fields(model):
+    """Return dictionary of field name: (type, comodel or None) for stored fields.
+
+    One2many fields are left out, since they're rebuilt by the many2one on
+    the other side; function fields are left out since they're computed.
+    """
+    result = {}
+    for name, column in model._columns.items():
+        if name in _SKIP_FIELDS or hasattr(column, '_fnct'):
+            continue
+        field_type = column._type
+        if field_type == 'many2many' or getattr(column, '_classic_write', False):
+            comodel = getattr(column, '_obj', None) if field_type in ('many2one', 'many2many') else None
+            result[name] = (field_type, comodel)
+    return result
+
+
+def _parent_domain(model_name, records):
+    """Domain for models with no company_id of their own, found via their parent.
+    """
+    parents = {
+        'account.fiscal.position.tax': 'position_id',
+        'account.fiscal.position.account': 'position_id',
+    }
+    field = parents.get(model_name)
+    if field is None:
+        return None
+    position_ids = [old_id for old_id, _values in records.get('account.fiscal.position', [])]
+    return [(field, 'in', position_ids)]
+
+
+def _plain_values(row, fields):
+    values = {}
+    for name, (field_type, _comodel) in fields.items():
+        value = row.get(name, False)
+        if field_type == 'many2one':
+            value = _id_of(value)
+        elif field_type == 'many2many':
+            value = list(value or [])
+        values[name] = value
+    return values
+
+
+def _creation_order(model_name, rows, references):
+    """Sort rows so that records come after any same-model record they refer to.
+    """
+    self_fields = [name for name, comodel in references.items() if comodel == model_name]
+    if not self_fields:
+        return rows
+    by_id = dict(rows)
+    ordered = []
+    done = set()
+
+    def visit(old_id, path):
+        if old_id in done or old_id not in by_id:
+            return
+        if old_id in path:
+            raise ValueError('%s %s refers to itself' % (model_name, old_id))
+        for name in self_fields:
+            targets = by_id[old_id][name]
+            for target in (targets if isinstance(targets, list) else [targets]):
+                if target:
+                    visit(target, path | set([old_id]))
+        done.add(old_id)
+        ordered.append((old_id, by_id[old_id]))
+
+    for old_id, _values in rows:
+        visit(old_id, set())
+    return ordered
+
+
+def _remap(values, references, id_map, old_company_id, new_company_id):
+    new_values = dict(values)
+    for name, comodel in references.items():
+        value = values.get(name)
+        if comodel == 'res.company':
+            remap = lambda v: new_company_id if v == old_company_id else v
+        else:
+            remap = lambda v: id_map.get((comodel, v), v)
+        if isinstance(value, list):
+            new_values[name] = [(6, 0, [remap(v) for v in value])]
+        elif value:
+            new_values[name] = remap(value)
+    return new_values
+
+
+def _remap_reference(value_reference, id_map):
+    reference = _split_reference(value_reference)
+    if reference is None:
+        return value_reference
+    return '%s,%d' % (reference[0], id_map.get(reference, reference[1]))
+
+
+def _split_reference(value_reference):
+    """Return (model name, id) for a 'model,id' reference string, otherwise None.
+    """
+    model_name, _comma, record_id = value_reference.partition(',')
+    try:
+        return model_name, int(record_id)
+    except ValueError:
+        return None
+
+
+def _id_of(value):
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else False
+    return value
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Configure new companies exactly like an existing reference company.
+
+    clone_company_configuration(cr, registry, SUPERUSER_ID,
+        reference=uk_company,
+        targets=[uk2, uk3, uk4],
+        context=context.copy(),
+    )
+
+This copies, from the reference company to each target:
+
+  - the account settings in CLONED_ACCOUNT_SETTINGS (default taxes,
+    multi-currency and its gain and loss accounts)
+  - the default product taxes kept in ir.values
+  - the company's default ir.property values
+
+The targets must already have their charts of accounts and taxes
+(see chart_snapshot.setup_charts_of_accounts()).  Accounts, taxes and
+journals are matched by code and fiscal positions by name.  Properties
+referring to any other record that belongs to a company, such as a
+company-specific pricelist, aren't copied: they are listed in the
+configuration's skipped attribute and logged.  Properties referring to
+shared records are copied as they are.
+
+The reference configuration is read with a handful of search_reads, and
+all the accounts and taxes the targets need are found with one
+search_read each.  The account settings go through a SettingsBatch.
+Odoo's account settings belong to one company, so that's still one
+execute() per target company, but at most one.
+"""
+
+from collections import namedtuple, OrderedDict
+
+from .confutil import (
+    SettingsBatch, set_account_settings, current_settings, set_product_tax_defaults,
+    set_company_default_properties, BulkLookupError, NoRecordsError, TooManyRecordsError,
+    _unpickle_default, _m2o_id, _company_owned, _PROPERTY_VALUE_FIELDS,
+)
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+# account.config.settings fields copied, and the model each refers to
+CLONED_ACCOUNT_SETTINGS = OrderedDict([
+    ('default_sale_tax', 'account.tax'),
+    ('default_purchase_tax', 'account.tax'),
+    ('group_multi_currency', None),
+    ('income_currency_exchange_account_id', 'account.account'),
+    ('expense_currency_exchange_account_id', 'account.account'),
+])
+
+# Company-specific models, with the field their records are matched on
+_CODE_FIELDS = {
+    'account.account': 'code',
+    'account.tax': 'description',
+    'account.journal': 'code',
+    'account.fiscal.position': 'name',
+}
+
+_PRODUCT_TAX_FIELDS = ['taxes_id', 'supplier_taxes_id']
+
+
+# A company-specific record, identified by its code
+CodeRef = namedtuple('CodeRef', ['model', 'code'])
+
+
+class CompanyConfiguration(object):
+    """A company's configuration, with accounts and taxes as CodeRefs.
+
+    account_settings: Dictionary of account.config.settings field: value
+    product_taxes: Dictionary of ir.values field name: list of CodeRefs
+    properties: Dictionary of (model name, field name): value, CodeRefs
+                standing for references to company-specific records
+    skipped: List of ((model name, field name), value reference) of the
+             properties left out because they refer to a record belonging
+             to the company that can't be matched in other companies
+    """
+    def __init__(self, company_id, account_settings, product_taxes, properties, skipped=None):
+        self.company_id = company_id
+        self.account_settings = account_settings
+        self.product_taxes = product_taxes
+        self.properties = properties
+        self.skipped = skipped or []
+
+    def code_refs(self):
+        """Return set of every CodeRef the configuration uses.
+        """
+        values = list(self.account_settings.values()) + list(self.properties.values())
+        values += [ref for refs in self.product_taxes.values() for ref in refs]
+        return set(value for value in values if isinstance(value, CodeRef))
+
+
+def capture_company_configuration(cr, registry, uid, company, settings_fields=None, context=None):
+    """Return the CompanyConfiguration of company.
+
+    settings_fields: Dictionary of account.config.settings field: model it
+                     refers to (or None), defaulting to CLONED_ACCOUNT_SETTINGS
+    """
+    settings_fields = settings_fields if settings_fields is not None else CLONED_ACCOUNT_SETTINGS
+    current = current_settings(cr, registry, uid, 'account.config.settings', list(settings_fields),
+        company=company, context=context,
+    )
+    account_settings = dict(
+        (field, _m2o_id(value) if settings_fields[field] else value)
+        for field, value in current.items()
+    )
+
+    product_taxes = {}
+    for default in registry['ir.values'].search_read(cr, uid,
+            [
+                ('key', '=', 'default'),
+                ('model', '=', 'product.template'),
+                ('name', 'in', _PRODUCT_TAX_FIELDS),
+                ('company_id', '=', company.id),
+                ('user_id', '=', False),
+            ],
+            fields=['name', 'value'],
+            context=context):
+        product_taxes[default['name']] = list(_unpickle_default(default['value']) or [])
+
+    properties = {}
+    props = registry['ir.property'].search_read(cr, uid,
+        [('company_id', '=', company.id), ('res_id', '=', False)],
+        fields=['fields_id', 'type'] + sorted(set(_PROPERTY_VALUE_FIELDS.values())),
+        context=context,
+    )
+    if props:
+        fields_info = dict((info['id'], info) for info in registry['ir.model.fields'].search_read(cr, uid,
+            [('id', 'in', list(set(_m2o_id(prop['fields_id']) for prop in props)))],
+            fields=['model', 'name'],
+            context=context,
+        ))
+        for prop in props:
+            info = fields_info[_m2o_id(prop['fields_id'])]
+            value = prop[_PROPERTY_VALUE_FIELDS.get(prop['type'], 'value_text')]
+            properties[info['model'], info['name']] = value
+
+    # Swap the company's own accounts, taxes etc. for their codes
+    ids_by_model = {}
+    other_ids_by_model = {}
+    for field, value in account_settings.items():
+        if settings_fields[field] in _CODE_FIELDS and value:
+            ids_by_model.setdefault(settings_fields[field], set()).add(value)
+    for tax_ids in product_taxes.values():
+        ids_by_model.setdefault('account.tax', set()).update(tax_ids)
+    for value in properties.values():
+        reference = _split_reference(value)
+        if reference and reference[0] in _CODE_FIELDS:
+            ids_by_model.setdefault(reference[0], set()).add(reference[1])
+        elif reference:
+            other_ids_by_model.setdefault(reference[0], set()).add(reference[1])
+    refs = _code_refs(cr, registry, uid, ids_by_model, context=context)
+    owned = _company_owned(cr, registry, uid, other_ids_by_model, context=context)
+
+    for field, value in account_settings.items():
+        if settings_fields[field] in _CODE_FIELDS and value:
+            account_settings[field] = refs[settings_fields[field], value]
+    for field_name, tax_ids in product_taxes.items():
+        product_taxes[field_name] = [refs['account.tax', tax_id] for tax_id in tax_ids]
+    skipped = []
+    for key, value in sorted(properties.items()):
+        reference = _split_reference(value)
+        if reference in refs:
+            properties[key] = refs[reference]
+        elif reference and (reference[0] in _CODE_FIELDS or reference in owned):
+            _logger.warning('capture_company_configuration: not copying property %s.%s = %s,'
+                            ' which belongs to a company' % (key[0], key[1], value))
+            skipped.append((key, value))
+            del properties[key]
+
+    return CompanyConfiguration(company.id, account_settings, product_taxes, properties, skipped=skipped)
+
+
+def apply_company_configuration(cr, registry, uid, configuration, companies, context=None):
+    """Give each of companies the configuration captured from another company.
+
+    Raises BulkLookupError listing every (company id, CodeRef) that a
+    target company doesn't have exactly one of, before changing anything.
+
+    Returns dictionary mapping company id: account settings changes.
+    """
+    found = _resolve_code_refs(cr, registry, uid, configuration.code_refs(), companies, context=context)
+
+    def value_for(company, value):
+        return found[company.id, value] if isinstance(value, CodeRef) else value
+
+    result = {}
+    with SettingsBatch(cr, registry, uid, context=context) as batch:
+        for company in companies:
+            changes = dict((field, value_for(company, value))
+                           for field, value in configuration.account_settings.items())
+            if changes:
+                set_account_settings(cr, registry, uid, changes=changes, company=company,
+                    context=context, batch=batch)
+            result[company.id] = changes
+
+    if configuration.product_taxes:
+        set_product_tax_defaults(cr, registry, uid, dict(
+            ((company.id, field_name), [value_for(company, ref) for ref in refs])
+            for company in companies
+            for field_name, refs in configuration.product_taxes.items()
+        ), context=context)
+
+    if configuration.properties:
+        set_company_default_properties(cr, registry, uid, dict(
+            (key, dict((company, _property_value(value_for(company, value), value))
+                       for company in companies))
+            for key, value in configuration.properties.items()
+        ), context=context)
+    return result
+
+
+def clone_company_configuration(cr, registry, uid, reference, targets, settings_fields=None, context=None):
+    """Configure each of targets like reference.  See the module docstring.
+
+    Returns the CompanyConfiguration that was copied.
+    """
+    configuration = capture_company_configuration(cr, registry, uid, reference,
+        settings_fields=settings_fields, context=context,
+    )
+    apply_company_configuration(cr, registry, uid, configuration, targets, context=context)
+    return configuration
+
+
+def _code_refs(cr, registry, uid, ids_by_model, context=None):
+    """Return dictionary mapping (model name, id): CodeRef.
+    """
+    refs = {}
+    for model_name, ids in ids_by_model.items():
+        code_field = _CODE_FIELDS[model_name]
+        for record in registry[model_name].search_read(cr, uid, [('id', 'in', list(ids))],
+                fields=[code_field], context=dict(context or {}, active_test=False)):
+            refs[model_name, record['id']] = CodeRef(model_name, record[code_field])
+    return refs
+
+
+def _resolve_code_refs(cr, registry, uid, code_refs, companies, context=None):
+    """Return dictionary mapping (company id, CodeRef): id in that company.
+    """
+    company_ids = [company.id for company in companies]
+    matches = OrderedDict(((company_id, ref), []) for company_id in company_ids
+                          for ref in sorted(code_refs))
+    for model_name, code_field in _CODE_FIELDS.items():
+        codes = list(set(ref.code for ref in code_refs if ref.model == model_name))
+        if not codes or not company_ids:
+            continue
+        for record in registry[model_name].search_read(cr, uid,
+                [('company_id', 'in', company_ids), (code_field, 'in', codes)],
+                fields=['company_id', code_field],
+                context=context):
+            key = (_m2o_id(record['company_id']), CodeRef(model_name, record[code_field]))
+            if key in matches:
+                matches[key].append(record['id'])
+
+    results = OrderedDict()
+    errors = OrderedDict()
+    for (company_id, ref), ids in matches.items():
+        domain = [('company_id', '=', company_id), (_CODE_FIELDS[ref.model], '=', ref.code)]
+        if len(ids) > 1:
+            errors[company_id, ref] = TooManyRecordsError("More than one record matching %r" % domain)
+        elif not ids:
+            errors[company_id, ref] = NoRecordsError("No records matching %r" % domain)
+        else:
+            results[company_id, ref] = ids[0]
+    if errors:
+        raise BulkLookupError(errors, results)
+    return results
+
+
+def _split_reference(value):
+    """Return (model name, id) for a 'model,id' reference string, otherwise None.
+    """
+    if not isinstance(value, basestring) or ',' not in value:
+        return None
+    model_name, _comma, record_id = value.partition(',')
+    try:
+        return model_name, int(record_id)
+    except ValueError:
+        return None
+
+
+def _property_value(value, original):
+    """Turn a resolved CodeRef back into a reference string for ir.property.
+    """
+    if isinstance(original, CodeRef):
+        return '%s,%d' % (original.model, value)
+    return value
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
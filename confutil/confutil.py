@@ -27,9 +27,20 @@ ones where dependent records don't have external IDs, or changes to Settings ->
 screens need to be made (so execute() has to be called afterwards).
 """
 
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+import pickle
+import weakref
+
+from .metacache import metadata_cache, forget_signature
+
 import logging
 _logger = logging.getLogger(__name__)
 
+# Same as openerp.SUPERUSER_ID
+SUPERUSER_ID = 1
+
 class Lookup(object):
     """Implements common lookups.
 
@@ -40,12 +51,53 @@ class Lookup(object):
     Then you can do things like:
 
         map(lookup.tax_id_by_code, ['UKST1', 'USST1', 'FRST1'])
+
+    If you're going to repeat the same lookups many times, pass cache_size
+    to remember the results of exactly_one_id() and maybe_id() (and so
+    everything built on them):
+
+        lookup = Lookup(cr, registry, SUPERUSER_ID, context=context.copy(), cache_size=1000)
+
+    Cached results are thrown away whenever a helper in this module writes
+    to the model they came from on the same cursor.  The same goes for the
+    indexes built by account_index(), period_index() and fiscalyear_index().
+
+    Pass use_sql=True to let simple equality lookups run as direct SQL when
+    uid is the superuser; see get_maybe_id().
+
+    Pass deferred=True to have lookups whose domains are all '=' tests on
+    plain fields, or on many2one fields against ids, return PendingId
+    placeholders instead of searching straight away:
+
+        lookup = Lookup(cr, registry, SUPERUSER_ID, context=context.copy(), deferred=True)
+        set_account_settings(cr, registry, SUPERUSER_ID, company=company, changes={
+            'income_currency_exchange_account_id': lookup.account_id(company, '7700'),
+            'expense_currency_exchange_account_id': lookup.account_id(company, '7701'),
+        }, context=context.copy())
+
+    The helpers in this module resolve placeholders in their arguments
+    before writing, and the first one to need a value resolves every
+    pending lookup, with one search_read per model and set of fields.  Use
+    lookup.resolve(values) before calling create() or write() yourself.
+    A lookup that failed raises its NoRecordsError or TooManyRecordsError
+    when its value is needed.
     """
-    def __init__(self, cr, registry, uid, context=None):
+    # Every live Lookup, so invalidate_lookups() can reach their indexes
+    _instances = weakref.WeakSet()
+
+    def __init__(self, cr, registry, uid, context=None, cache_size=None, use_sql=False, deferred=False):
         self._cr = cr
         self._registry = registry
         self._uid = uid
-        self._context = context
+        self._context = context if context is not None else {}
+        self._cache = LookupCache(cr, cache_size) if cache_size else None
+        self._xmlid_index = {}
+        self._use_sql = use_sql
+        self._deferred = deferred
+        self._pending = []
+        self._account_indexes = {}
+        self._date_indexes = {}
+        Lookup._instances.add(self)
 
 
     def tax_id_by_code(self, code):
@@ -70,6 +122,115 @@ class Lookup(object):
         ])
 
 
+    def tax_ids_by_codes(self, codes):
+        """Return an ordered mapping of tax_code: account.tax id for many codes.
+
+        Like tax_id_by_code() but uses a single search for all the codes.
+
+        Raises BulkLookupError if any code doesn't have precisely one match.
+        """
+        return self.exactly_one_ids('account.tax', 'description', codes)
+
+
+    def account_ids(self, company, codes):
+        """Return an ordered mapping of code: account id for the company's accounts.
+
+        Like account_id() but uses a single search for all the codes.
+
+        Raises BulkLookupError if any code doesn't have precisely one match.
+        """
+        return self.exactly_one_ids('account.account', 'code', codes,
+            extra_domain=[('company_id', '=', company.id)],
+        )
+
+
+    def account_index(self, company):
+        """Return an AccountCodeIndex of company's accounts.
+
+        The accounts are read with one search_read the first time, and
+        the index is kept until account.account is invalidated, by
+        invalidate_lookups() or clear_cache().
+        """
+        company_id = getattr(company, 'id', company)
+        index = self._account_indexes.get(company_id)
+        if index is None:
+            accounts = self.model('account.account').search_read(self._cr, self._uid,
+                [('company_id', '=', company_id)],
+                fields=['code'],
+                context=self._context.copy(),
+            )
+            index = AccountCodeIndex(company_id, [(account['code'], account['id']) for account in accounts])
+            self._account_indexes[company_id] = index
+        return index
+
+
+    def account_ids_by_prefix(self, company, prefix):
+        """Return ids of company's accounts whose codes start with prefix, in code order.
+        """
+        return self.account_index(company).prefix(prefix)
+
+
+    def account_ids_in_range(self, company, low, high):
+        """Return ids of company's accounts with codes from low to high, in code order.
+
+        See AccountCodeIndex.range().
+        """
+        return self.account_index(company).range(low, high)
+
+
+    def period_index(self, company):
+        """Return a DateIntervalIndex of company's periods, opening periods excluded.
+
+        The periods are read with one search_read the first time, and the
+        index is kept until account.period is invalidated, by
+        invalidate_lookups() or clear_cache().
+        """
+        return self._date_index('account.period', company, [('special', '=', False)])
+
+
+    def fiscalyear_index(self, company):
+        """Return a DateIntervalIndex of company's fiscal years.
+
+        Kept until account.fiscalyear is invalidated, as for period_index().
+        """
+        return self._date_index('account.fiscalyear', company, [])
+
+
+    def period_id(self, company, day):
+        """Return the id of company's (non-opening) period containing day.
+
+        day: date, datetime or 'YYYY-MM-DD' string
+        """
+        return self.period_index(company).find(day)
+
+
+    def period_ids(self, company, days):
+        """Return a list of the ids of company's periods containing each of days.
+        """
+        return self.period_index(company).find_many(days)
+
+
+    def fiscalyear_id(self, company, day):
+        """Return the id of company's fiscal year containing day.
+        """
+        return self.fiscalyear_index(company).find(day)
+
+    def _date_index(self, model_name, company, extra_domain):
+        company_id = getattr(company, 'id', company)
+        index = self._date_indexes.get((model_name, company_id))
+        if index is None:
+            records = self.model(model_name).search_read(self._cr, self._uid,
+                [('company_id', '=', company_id)] + extra_domain,
+                fields=['date_start', 'date_stop'],
+                context=self._context.copy(),
+            )
+            index = DateIntervalIndex(model_name, company_id, [
+                (record['date_start'], record['date_stop'], record['id']) for record in records
+            ])
+            self._date_indexes[model_name, company_id] = index
+        return index
+
+
     def xmlid(self, module_or_dotted_xmlid, xmlid=None):
         """Return the object with XMLID = 'module.xmlid'.
 
@@ -89,20 +250,56 @@ class Lookup(object):
         Otherwise the first is expected.
 
         Note this returns an OBJECT, not a numeric database id.
+
+        If the module has been loaded with preload_xmlids() then no query is
+        made until you use an attribute of the returned record.
         """
-        IMD = self._registry['ir.model.data']
-        if '.' in module_or_dotted_xmlid:
-            module, identifier = module_or_dotted_xmlid.split('.')
-        else:
-            if not isinstance(xmlid, (str, unicode)):
-                raise TypeError('xmlid(module, xmlid) form: xmlid must be a string')
-            module, identifier = module_or_dotted_xmlid, xmlid
-        return IMD.get_object(self._cr, self._uid, module, identifier)
+        module, identifier = self._split_xmlid(module_or_dotted_xmlid, xmlid)
+        try:
+            model_name, res_id = self._xmlid_index[module, identifier]
+        except KeyError:
+            IMD = self._registry['ir.model.data']
+            return IMD.get_object(self._cr, self._uid, module, identifier)
+        return self.model(model_name).browse(self._cr, self._uid, res_id,
+            context=self._context.copy(),
+        )
 
 
     def xmlid_id(self, module_or_dotted_xmlid, xmlid=None):
         """Like xmlid() but returns the numeric id"""
-        return self.xmlid(module_or_dotted_xmlid, xmlid).id
+        module, identifier = self._split_xmlid(module_or_dotted_xmlid, xmlid)
+        try:
+            return self._xmlid_index[module, identifier][1]
+        except KeyError:
+            IMD = self._registry['ir.model.data']
+            return IMD.get_object_reference(self._cr, self._uid, module, identifier)[1]
+
+
+    def preload_xmlids(self, *modules):
+        """Load every XMLID belonging to the given modules in one query.
+
+        After this, xmlid_id() answers from memory for those modules, and
+        xmlid() returns records without searching ir.model.data.
+
+        e.g.
+            lookup.preload_xmlids('account', 'l10n_uk')
+        """
+        records = self._registry['ir.model.data'].search_read(self._cr, self._uid,
+            [('module', 'in', list(modules))],
+            fields=['module', 'name', 'model', 'res_id'],
+            context=self._context.copy(),
+        )
+        for record in records:
+            self._xmlid_index[record['module'], record['name']] = (record['model'], record['res_id'])
+        return len(records)
+
+    def _split_xmlid(self, module_or_dotted_xmlid, xmlid=None):
+        if '.' in module_or_dotted_xmlid:
+            module, identifier = module_or_dotted_xmlid.split('.')
+            return module, identifier
+        if not isinstance(xmlid, (str, unicode)):
+            raise TypeError('xmlid(module, xmlid) form: xmlid must be a string')
+        return module_or_dotted_xmlid, xmlid
 
 
     def exactly_one_id(self, model, domain):
@@ -111,8 +308,12 @@ class Lookup(object):
         Raises TooManyRecordsError if more than one record is found.
         Raises NoRecordsError if no records are found.
         """
-        modobj = self._autoresolve_model(model)
-        return get_exactly_one_id(modobj, self._cr, self._uid, domain, context=self._context.copy())
+        retrieved_id = self.maybe_id(model, domain)
+        if isinstance(retrieved_id, PendingId):
+            retrieved_id.required = True
+        elif retrieved_id is None:
+            raise NoRecordsError("No records matching %r" % domain)
+        return retrieved_id
 
 
     def maybe_id(self, model, domain):
@@ -120,11 +321,176 @@ class Lookup(object):
 
         Raises TooManyRecordsError if more than one record is found.
         """
-        return get_maybe_id(self._autoresolve_model(model), self._cr, self._uid,
+        domain = resolve_pending(domain)
+        modobj = self._autoresolve_model(model)
+        key = (modobj._name, normalize_domain(domain))
+        if self._cache is not None:
+            try:
+                return self._cache.get(key)
+            except KeyError:
+                pass
+        if self._deferred and _equality_terms(domain, modobj) is not None:
+            pending = PendingId(self, modobj._name, domain)
+            self._pending.append(pending)
+            return pending
+        retrieved_id = self._search_maybe_id(modobj, domain)
+        if self._cache is not None:
+            self._cache.put(key, retrieved_id)
+        return retrieved_id
+
+    def flush(self):
+        """Resolve every pending lookup made in deferred mode.
+
+        Lookups on the same model testing the same fields are answered by
+        one search_read between them.  If that search_read fails, each of
+        its placeholders raises the same exception when its value is needed.
+        Over RPC the search_reads are sent together; see rpc.RpcConnection.
+        """
+        pending, self._pending = self._pending, []
+        groups = OrderedDict()
+        for placeholder in pending:
+            terms = _equality_terms(placeholder.domain, self.model(placeholder.model_name))
+            fields = tuple(sorted(terms))
+            key = tuple(terms[field] for field in fields)
+            groups.setdefault((placeholder.model_name, fields), []).append((key, placeholder))
+
+        searches = []
+        for (model_name, fields), members in groups.items():
+            values = [OrderedDict.fromkeys(key[position] for key, _placeholder in members)
+                      for position in range(len(fields))]
+            searches.append((model_name,
+                [[(field, 'in', list(values[position])) for position, field in enumerate(fields)]],
+                {'fields': list(fields), 'context': self._context.copy()},
+            ))
+
+        for ((model_name, fields), members), (ok, records) in zip(groups.items(), self._search_reads(searches)):
+            if not ok:
+                for _key, placeholder in members:
+                    placeholder._error = records
+                    placeholder._resolved = True
+                continue
+            found = {}
+            for record in records:
+                found.setdefault(tuple(_m2o_id(record[field]) for field in fields), []).append(record['id'])
+            for key, placeholder in members:
+                ids = found.get(key, [])
+                if len(ids) > 1:
+                    placeholder._error = TooManyRecordsError("More than one record matching %r" % placeholder.domain)
+                    continue
+                placeholder._value = ids[0] if ids else None
+                if self._cache is not None:
+                    self._cache.put((model_name, normalize_domain(placeholder.domain)), placeholder._value)
+            for _key, placeholder in members:
+                placeholder._resolved = True
+        return len(pending)
+
+    def _search_reads(self, searches):
+        """Run each (model name, args, kwargs) search_read, returning a
+        list of (True, records) or (False, exception) in the same order.
+
+        Registries with a multicall_outcomes() method, like the RPC
+        registry, get them all in one go.
+        """
+        multicall = getattr(self._registry, 'multicall_outcomes', None)
+        if multicall is not None and len(searches) > 1:
+            return multicall([(model_name, 'search_read', args, kwargs)
+                              for model_name, args, kwargs in searches])
+        outcomes = []
+        for model_name, args, kwargs in searches:
+            try:
+                outcomes.append((True, self.model(model_name).search_read(self._cr, self._uid, *args, **kwargs)))
+            except Exception as error:
+                outcomes.append((False, error))
+        return outcomes
+
+    def resolve(self, value):
+        """Return value with any PendingId placeholders in it replaced by their ids.
+        """
+        return resolve_pending(value)
+
+    def exactly_one_ids(self, model, field, values, extra_domain=None):
+        """Return an ordered mapping of value: id, with one record per value.
+
+        This is equivalent to calling
+
+            exactly_one_id(model, extra_domain + [(field, '=', value)])
+
+        for each value, but does it all in one search_read.
+
+        model: Model name or model object
+        field: Name of the field to match values against, e.g. 'code'
+        values: Values of field that you want the ids for
+        extra_domain: Extra criteria that all records must match
+
+        Raises BulkLookupError if any value doesn't have exactly one match.
+        The error's 'errors' attribute maps each bad value to the
+        NoRecordsError or TooManyRecordsError that exactly_one_id would
+        have raised, and 'results' holds the values that were found.
+        """
+        modobj = self._autoresolve_model(model)
+        extra_domain = list(extra_domain or [])
+        values = list(OrderedDict.fromkeys(values))
+        matches = OrderedDict((value, []) for value in values)
+        if values:
+            records = modobj.search_read(self._cr, self._uid,
+                extra_domain + [(field, 'in', values)],
+                fields=[field],
+                context=self._context.copy(),
+            )
+            for record in records:
+                value = record[field]
+                if isinstance(value, (list, tuple)):
+                    value = value[0]
+                if value in matches:
+                    matches[value].append(record['id'])
+
+        results = OrderedDict()
+        errors = OrderedDict()
+        for value, ids in matches.items():
+            domain = extra_domain + [(field, '=', value)]
+            if len(ids) > 1:
+                errors[value] = TooManyRecordsError("More than one record matching %r" % domain)
+                continue
+            retrieved_id = ids[0] if ids else None
+            if self._cache is not None:
+                self._cache.put((modobj._name, normalize_domain(domain)), retrieved_id)
+            if retrieved_id is None:
+                errors[value] = NoRecordsError("No records matching %r" % domain)
+            else:
+                results[value] = retrieved_id
+        if errors:
+            raise BulkLookupError(errors, results)
+        return results
+
+    def _search_maybe_id(self, modobj, domain):
+        return get_maybe_id(modobj, self._cr, self._uid,
             domain=domain,
             context=self._context.copy(),
+            use_sql=self._use_sql,
         )
 
+    def cache_info(self):
+        """Return a dictionary of statistics about the lookup cache.
+
+        Keys are 'hits', 'misses', 'size' and 'maxsize'.
+        Returns None if this Lookup was created without a cache_size.
+        """
+        return self._cache.info() if self._cache is not None else None
+
+    def clear_cache(self, model_name=None):
+        """Forget cached lookups for model_name, or for all models if not given.
+        """
+        if self._cache is not None:
+            self._cache.invalidate(model_name)
+        self._drop_indexes(model_name)
+
+    def _drop_indexes(self, model_name=None):
+        if model_name in (None, 'account.account'):
+            self._account_indexes.clear()
+        for key in list(self._date_indexes):
+            if model_name in (None, key[0]):
+                del self._date_indexes[key]
+
     def _autoresolve_model(self, model):
         return self.model(model) if isinstance(model, (str, unicode)) else model
 
@@ -135,6 +501,330 @@ class Lookup(object):
         return self._registry[model_name]
 
 
+class AccountCodeIndex(object):
+    """One company's account codes in sorted order, for exact, prefix and
+    range lookups by bisection.
+
+    rows: List of (code, account id)
+    """
+    def __init__(self, company_id, rows):
+        self.company_id = company_id
+        rows = sorted(rows)
+        self._codes = [code for code, _account_id in rows]
+        self._ids = [account_id for _code, account_id in rows]
+
+    def __len__(self):
+        return len(self._codes)
+
+    def exact(self, code):
+        """Return the id of the account with code.
+
+        Raises NoRecordsError or TooManyRecordsError unless there's exactly one.
+        """
+        start = bisect_left(self._codes, code)
+        stop = bisect_right(self._codes, code, start)
+        if stop - start == 1:
+            return self._ids[start]
+        domain = [('company_id', '=', self.company_id), ('code', '=', code)]
+        if stop == start:
+            raise NoRecordsError("No records matching %r" % domain)
+        raise TooManyRecordsError("More than one record matching %r" % domain)
+
+    def prefix(self, prefix):
+        """Return ids of the accounts whose codes start with prefix.
+        """
+        start = bisect_left(self._codes, prefix)
+        stop = bisect_left(self._codes, prefix + u'\uffff', start)
+        return self._ids[start:stop]
+
+    def range(self, low, high):
+        """Return ids of the accounts with codes from low to high.
+
+        Codes are compared as strings, and codes starting with high count
+        as within the range, so range('4000', '4999') includes '499950'.
+        """
+        start = bisect_left(self._codes, low)
+        stop = bisect_left(self._codes, high + u'\uffff', start)
+        return self._ids[start:stop]
+
+
+class DateIntervalIndex(object):
+    """Records with date_start and date_stop, such as periods or fiscal
+    years, sorted for finding the one containing a date by bisection.
+
+    rows: List of (date_start, date_stop, id), dates as 'YYYY-MM-DD'
+    """
+    def __init__(self, model_name, company_id, rows):
+        self.model_name = model_name
+        self.company_id = company_id
+        self._rows = sorted(rows)
+        self._starts = [start for start, _stop, _id in self._rows]
+        # Latest date_stop of this row and every row before it, so that
+        # find() knows how far back an overlapping row could start
+        self._reach = []
+        latest = None
+        for _start, stop, _id in self._rows:
+            latest = max(latest, stop)
+            self._reach.append(latest)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def find(self, day):
+        """Return the id of the record whose dates include day.
+
+        Raises NoRecordsError if there isn't one, or TooManyRecordsError
+        if day falls where records overlap.
+        """
+        day = _date_string(day)
+        matches = []
+        position = bisect_right(self._starts, day) - 1
+        while position >= 0 and self._reach[position] >= day:
+            _start, stop, record_id = self._rows[position]
+            if stop >= day:
+                matches.append(record_id)
+            position -= 1
+        if len(matches) == 1:
+            return matches[0]
+        domain = [('company_id', '=', self.company_id), ('date_start', '<=', day), ('date_stop', '>=', day)]
+        if not matches:
+            raise NoRecordsError("No %s records matching %r" % (self.model_name, domain))
+        raise TooManyRecordsError("More than one %s record matching %r" % (self.model_name, domain))
+
+    def find_many(self, days):
+        """Return list of the ids of the records containing each of days.
+        """
+        return [self.find(day) for day in days]
+
+    def gaps(self):
+        """Return list of (first day, last day) of the gaps between the records.
+        """
+        gaps = []
+        for position in range(1, len(self._rows)):
+            covered_to = self._reach[position - 1]
+            start = self._starts[position]
+            if _add_days(covered_to, 1) < start:
+                gaps.append((_add_days(covered_to, 1), _add_days(start, -1)))
+        return gaps
+
+    def overlaps(self):
+        """Return list of (id, id) of pairs of records whose dates overlap.
+        """
+        overlaps = []
+        for position, (start, _stop, record_id) in enumerate(self._rows):
+            earlier = position - 1
+            while earlier >= 0 and self._reach[earlier] >= start:
+                _earlier_start, earlier_stop, earlier_id = self._rows[earlier]
+                if earlier_stop >= start:
+                    overlaps.append((earlier_id, record_id))
+                earlier -= 1
+        return overlaps
+
+
+def _date_string(day):
+    if hasattr(day, 'strftime'):
+        return day.strftime('%Y-%m-%d')
+    return day[:10]
+
+
+def _add_days(day, days):
+    return (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+class PendingId(object):
+    """Placeholder for the result of a lookup made in deferred mode.
+
+    The value attribute (or int()) gives the id, resolving all of the
+    Lookup's pending lookups first if need be.  For a maybe_id lookup
+    that found nothing, value is None and int() raises NoRecordsError.
+    """
+    def __init__(self, lookup, model_name, domain):
+        self.lookup = lookup
+        self.model_name = model_name
+        self.domain = domain
+        self.required = False
+        self._resolved = False
+        self._value = None
+        self._error = None
+
+    @property
+    def value(self):
+        if not self._resolved:
+            self.lookup.flush()
+        if self._error is not None:
+            raise self._error
+        if self._value is None and self.required:
+            raise NoRecordsError("No records matching %r" % self.domain)
+        return self._value
+
+    def __int__(self):
+        value = self.value
+        if value is None:
+            raise NoRecordsError("No records matching %r" % self.domain)
+        return value
+
+    def _identity(self):
+        return (self.model_name, normalize_domain(self.domain), self.required)
+
+    def __eq__(self, other):
+        return isinstance(other, PendingId) and self._identity() == other._identity()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._identity())
+
+    def __repr__(self):
+        if self._resolved and self._error is None:
+            return '<PendingId %s %r: %r>' % (self.model_name, self.domain, self._value)
+        return '<PendingId %s %r>' % (self.model_name, self.domain)
+
+
+def resolve_pending(value):
+    """Return value with PendingId placeholders, however deeply nested in
+    dictionaries, lists and tuples, replaced by their ids.
+    """
+    if isinstance(value, PendingId):
+        return value.value
+    if isinstance(value, dict):
+        return dict((key, resolve_pending(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [resolve_pending(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(resolve_pending(item) for item in value)
+    return value
+
+
+# Field types whose '=' test compares the stored value as it is
+_PLAIN_FIELD_TYPES = frozenset(['char', 'text', 'selection', 'boolean', 'integer', 'float', 'date', 'datetime'])
+
+
+def _equality_terms(domain, model):
+    """Return dictionary of field: value if domain is only (field, '=', value)
+    terms that can be answered by a grouped 'in' search; otherwise None.
+
+    Only plain stored fields qualify, plus many2one fields and id tested
+    against an id: a many2one tested against a string is a name search.
+    """
+    field_types = _field_types(model)
+    terms = {}
+    for term in domain:
+        if not isinstance(term, (list, tuple)) or len(term) != 3:
+            return None
+        field, operator, value = term
+        if operator != '=' or '.' in field or field in terms:
+            return None
+        if value is False or value is None or isinstance(value, (list, tuple, dict, set)):
+            return None
+        field_type = 'many2one' if field == 'id' else field_types.get(field)
+        if field_type == 'many2one':
+            if isinstance(value, bool) or not isinstance(value, (int, long)):
+                return None
+        elif field_type not in _PLAIN_FIELD_TYPES:
+            return None
+        terms[field] = value
+    return terms if terms else None
+
+
+def _field_types(model):
+    """Return dictionary of field name: type for model, if it can be told
+    without a round trip (or, over RPC, with one per model).
+    """
+    columns = getattr(model, '_columns', None)
+    if columns is not None:
+        return dict((name, column._type) for name, column in columns.items())
+    if hasattr(model, 'fields_info'):
+        return dict((name, info.get('type')) for name, info in model.fields_info().items())
+    return {}
+
+
+class LookupCache(object):
+    """Bounded least-recently-used cache of search results for a Lookup.
+
+    Keys are (model_name, normalized_domain) and values are a record id or
+    None, so negative results are remembered too.
+
+    Every cache registers itself against its cursor so that the helpers in
+    this module can invalidate it when they write; see invalidate_lookups().
+    """
+    _instances = weakref.WeakSet()
+
+    def __init__(self, cr, maxsize):
+        self.cr = cr
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        LookupCache._instances.add(self)
+
+    def get(self, key):
+        """Return the cached value for key, raising KeyError if not cached.
+        """
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, model_name=None):
+        """Drop entries for model_name, or everything if model_name is None.
+        """
+        if model_name is None:
+            self._data.clear()
+            return
+        for key in [k for k in self._data if k[0] == model_name]:
+            del self._data[key]
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+def invalidate_lookups(cr, model_name=None):
+    """Invalidate cached lookups made on cursor cr.
+
+    model_name: Only forget lookups against this model.
+                If None, forget everything (e.g. after a settings execute(),
+                which can change almost anything).
+    """
+    for cache in list(LookupCache._instances):
+        if cache.cr is cr:
+            cache.invalidate(model_name)
+    for lookup in list(Lookup._instances):
+        if lookup._cr is cr:
+            lookup._drop_indexes(model_name)
+    if model_name is None:
+        forget_signature(cr)
+
+
+def normalize_domain(domain):
+    """Return a hashable version of domain, suitable for use as a cache key.
+
+    >>> normalize_domain([('code', 'in', [1, 2]), ('active', '=', True)])
+    (('code', 'in', (1, 2)), ('active', '=', True))
+    """
+    if isinstance(domain, (list, tuple)):
+        return tuple(normalize_domain(item) for item in domain)
+    if isinstance(domain, (set, frozenset)):
+        return tuple(sorted(domain))
+    if isinstance(domain, dict):
+        return tuple(sorted((k, normalize_domain(v)) for k, v in domain.items()))
+    return domain
+
 
 def set_global_default_product_customer_taxes(cr, registry, uid, company_id, tax_ids, context=None):
     """Set global default sales taxes for new products.
@@ -149,8 +839,9 @@ def set_global_default_product_customer_taxes(cr, registry, uid, company_id, tax
         field_name='taxes_id',
         for_all_users=True,
         company_id=company_id,
-        value=tax_ids,
+        value=resolve_pending(tax_ids),
     )
+    invalidate_lookups(cr, 'ir.values')
 
 def set_global_default_product_supplier_taxes(cr, registry, uid, company_id, tax_ids, context=None):
     """Set global default purchase taxes for new products.
@@ -165,14 +856,16 @@ def set_global_default_product_supplier_taxes(cr, registry, uid, company_id, tax
         field_name='supplier_taxes_id',
         for_all_users=True,
         company_id=company_id,
-        value=tax_ids,
+        value=resolve_pending(tax_ids),
     )
+    invalidate_lookups(cr, 'ir.values')
 
-def set_default_taxes(cr, registry, uid, company, sales_code, purchase_code, context=None):
+def set_default_taxes(cr, registry, uid, company, sales_code, purchase_code, context=None, batch=None):
     """Set the default tax codes for the given company.
 
     sales_code: e.g. 'ST1UK'
     purchase_code: e.g. 'PT1UK'
+    batch: Optional SettingsBatch to queue the settings change on
     """
     taxes_model = registry['account.tax']
 
@@ -195,11 +888,151 @@ def set_default_taxes(cr, registry, uid, company, sales_code, purchase_code, con
             'default_purchase_tax': purchase_tax_id,
         },
         context=context,
+        batch=batch,
+    )
+
+
+def set_companies_default_taxes(cr, registry, uid, company_codes, context=None, batch=None):
+    """Like set_default_taxes() but for many companies.
+
+    company_codes: Dictionary mapping company: (sales_code, purchase_code)
+
+    All the taxes are found with one search_read.  Companies whose
+    settings already hold these taxes are skipped by set_settings().
+    Pass a SettingsBatch as batch to merge with other settings changes.
+
+    Raises BulkLookupError listing every code that didn't match exactly
+    one tax.
+    """
+    tax_ids = company_tax_ids(cr, registry, uid, company_codes, context=context)
+    for company, (sales_code, purchase_code) in company_codes.items():
+        set_account_settings(cr, registry, uid,
+            company=company,
+            changes={
+                'default_sale_tax': tax_ids[company.id, sales_code],
+                'default_purchase_tax': tax_ids[company.id, purchase_code],
+            },
+            context=context,
+            batch=batch,
+        )
+
+
+def set_companies_default_product_taxes(cr, registry, uid, company_codes, context=None):
+    """Set default product sales and purchase taxes (ir.values) for many companies.
+
+    company_codes: Dictionary mapping company: (sales_code, purchase_code)
+
+    This is what set_global_default_product_customer_taxes() and
+    set_global_default_product_supplier_taxes() do, with every tax found
+    in one search_read and the existing defaults read in another.
+    Defaults that already hold the right taxes aren't rewritten.
+
+    Returns the number of defaults written.
+    """
+    tax_ids = company_tax_ids(cr, registry, uid, company_codes, context=context)
+    defaults = {}
+    for company, (sales_code, purchase_code) in company_codes.items():
+        defaults[company.id, 'taxes_id'] = [tax_ids[company.id, sales_code]]
+        defaults[company.id, 'supplier_taxes_id'] = [tax_ids[company.id, purchase_code]]
+    return set_product_tax_defaults(cr, registry, uid, defaults, context=context)
+
+
+def set_product_tax_defaults(cr, registry, uid, defaults, context=None):
+    """Set many companies' default product tax ids (ir.values) at once.
+
+    defaults: Dictionary mapping (company id, field name): list of tax ids,
+              field name being 'taxes_id' or 'supplier_taxes_id'
+
+    The existing defaults are read with one search_read, and only those
+    that differ are written.
+
+    Returns the number of defaults written.
+    """
+    ir_values = registry['ir.values']
+    existing = ir_values.search_read(cr, uid,
+        [
+            ('key', '=', 'default'),
+            ('model', '=', 'product.template'),
+            ('name', 'in', list(set(field_name for _company_id, field_name in defaults))),
+            ('company_id', 'in', list(set(company_id for company_id, _field_name in defaults))),
+            ('user_id', '=', False),
+        ],
+        fields=['name', 'company_id', 'value'],
+        context=context,
     )
+    current = {}
+    for default in existing:
+        key = (_m2o_id(default['company_id']), default['name'])
+        current.setdefault(key, []).append(_unpickle_default(default['value']))
+
+    written = 0
+    for (company_id, field_name), tax_ids in sorted(defaults.items()):
+        value = list(resolve_pending(tax_ids))
+        if current.get((company_id, field_name)) == [value]:
+            continue
+        ir_values.set_default(cr, uid,
+            model='product.template',
+            field_name=field_name,
+            for_all_users=True,
+            company_id=company_id,
+            value=value,
+        )
+        written += 1
+    if written:
+        invalidate_lookups(cr, 'ir.values')
+    return written
+
+
+def company_tax_ids(cr, registry, uid, company_codes, context=None):
+    """Return dictionary mapping (company id, tax code): account.tax id.
 
+    company_codes: Dictionary mapping company: list of tax codes
 
-def enable_multi_currency(cr, registry, uid, company, gain_account_code, loss_account_code, context=None):
+    Uses one search_read for every company and code.
+    Raises BulkLookupError listing every code that didn't match exactly one tax.
+    """
+    company_ids = set(company.id for company in company_codes)
+    codes = set(code for company_taxes in company_codes.values() for code in company_taxes)
+    taxes = registry['account.tax'].search_read(cr, uid,
+        [('company_id', 'in', list(company_ids)), ('description', 'in', list(codes))],
+        fields=['company_id', 'description'],
+        context=context,
+    )
+    found = {}
+    for tax in taxes:
+        found.setdefault((_m2o_id(tax['company_id']), tax['description']), []).append(tax['id'])
+
+    results = OrderedDict()
+    errors = OrderedDict()
+    for company, company_taxes in company_codes.items():
+        for code in company_taxes:
+            key = (company.id, code)
+            domain = [('company_id', '=', company.id), ('description', '=', code)]
+            ids = found.get(key, [])
+            if len(ids) > 1:
+                errors[key] = TooManyRecordsError("More than one record matching %r" % domain)
+            elif not ids:
+                errors[key] = NoRecordsError("No records matching %r" % domain)
+            else:
+                results[key] = ids[0]
+    if errors:
+        raise BulkLookupError(errors, results)
+    return results
+
+
+def _unpickle_default(value):
+    if isinstance(value, (str, unicode)):
+        try:
+            return pickle.loads(str(value))
+        except Exception:
+            return value
+    return value
+
+
+def enable_multi_currency(cr, registry, uid, company, gain_account_code, loss_account_code, context=None, batch=None):
     """Set up multi-currency support on the given company.
+
+    batch: Optional SettingsBatch to queue the settings change on
     """
     accounts_model = registry['account.account']
 
@@ -228,10 +1061,11 @@ def enable_multi_currency(cr, registry, uid, company, gain_account_code, loss_ac
             'expense_currency_exchange_account_id': loss_account_id,   # loss account
         },
         context=context,
+        batch=batch,
     )
 
 
-def set_account_settings(cr, registry, uid, changes, company, context=None):
+def set_account_settings(cr, registry, uid, changes, company, context=None, batch=None):
     """Set a bunch of accounts settings on the given company.
 
     Note there can be an issue with first runs of this if you haven't already
@@ -242,36 +1076,36 @@ def set_account_settings(cr, registry, uid, changes, company, context=None):
     and end dates of the first fiscal year.
     """
     return set_settings(cr, registry, uid, 'account.config.settings',
-        changes=changes, company=company, context=context,
+        changes=changes, company=company, context=context, batch=batch,
     )
 
 
-def set_general_settings(cr, registry, uid, changes, context=None):
+def set_general_settings(cr, registry, uid, changes, context=None, batch=None):
     """Set a bunch of general settings for the whole of Odoo.
     """
     return set_settings(cr, registry, uid, 'base.config.settings',
-        changes=changes, context=context,
+        changes=changes, context=context, batch=batch,
     )
 
-def set_purchasing_settings(cr, registry, uid, changes, context=None):
+def set_purchasing_settings(cr, registry, uid, changes, context=None, batch=None):
     """Set a bunch of purchasing settings for the whole of Odoo.
     """
     return set_settings(cr, registry, uid, 'purchase.config.settings',
-        changes=changes, context=context,
+        changes=changes, context=context, batch=batch,
     )
     
-def set_sale_settings(cr, registry, uid, changes, context=None):
+def set_sale_settings(cr, registry, uid, changes, context=None, batch=None):
     """Set a bunch of sale settings for the whole of Odoo.
     """
     return set_settings(cr, registry, uid, 'sale.config.settings',
-        changes=changes, context=context,
+        changes=changes, context=context, batch=batch,
     )
     
-def set_warehouse_settings(cr, registry, uid, changes, context=None):
+def set_warehouse_settings(cr, registry, uid, changes, context=None, batch=None):
     """Set a bunch of warehouse settings for the whole of Odoo.
     """
     return set_settings(cr, registry, uid, 'stock.config.settings',
-        changes=changes, context=context,
+        changes=changes, context=context, batch=batch,
     )
 
 def get_account_id(cr, registry, uid, company, code, context=None):
@@ -284,86 +1118,468 @@ def get_account_id(cr, registry, uid, company, code, context=None):
     )
 
 
-def set_settings(cr, registry, uid, settings_model_name, changes, company=None, context=None):
+def set_settings(cr, registry, uid, settings_model_name, changes, company=None, context=None, batch=None, force=False):
     """Update and execute a settings form.
 
     settings_model_name: for example 'account.config.settings' or 'base.config.settings'
     changes: Dictionary mapping field names to their new values.
     company: If defined, will create or find a config object matching company_id == company.id
+    batch: If given, a SettingsBatch to queue the changes on instead of
+           executing them now.
+    force: Write and execute even if the settings already hold these values.
+
+    Returns True if the settings were written and executed, or False if
+    the current values already matched changes so nothing was done.  With
+    batch, returns None: nothing is known until the batch is flushed.
     """
+    if batch is not None:
+        batch.add(settings_model_name, changes, company=company)
+        return None
+    changes = resolve_pending(changes)
     settings_model = registry[settings_model_name]
+    current = current_settings(cr, registry, uid, settings_model_name, list(changes),
+        company=company, context=context,
+    )
+    if not force and all(field in current and current[field] == value
+                         for field, value in changes.items()):
+        _logger.debug('set_settings: %s already up to date, skipping execute' % (settings_model_name,))
+        return False
     domain = [('company_id', '=', company.id)] if company else []
     settings_id = get_maybe_id(settings_model, cr, uid, domain, context=context)
     if settings_id is None:
-        data = settings_model.default_get(cr, uid,
-            list(settings_model.fields_get(cr, uid, context=context)),
-            context=context,
-        )
-        data.update(changes)
+        data = dict(changes)
         if company:
             data['company_id'] = company.id
         settings_id = settings_model.create(cr, uid, data, context=context)
     else:
         settings_model.write(cr, uid, [settings_id], changes, context=context)
     settings_model.execute(cr, uid, [settings_id], context=context)
+    # execute() can install modules and rewrite groups, so forget everything
+    invalidate_lookups(cr)
+    return True
 
 
-def create_consolidation_account(cr, registry, uid, company, code, name, children, context=None):
+def current_settings(cr, registry, uid, settings_model_name, fields, company=None, context=None):
+    """Return dictionary of the current effective values of some settings fields.
+
+    The defaults of a settings form are its current values, so this is
+    default_get() restricted to fields, plus, if company is given, the
+    values onchange_company_id() gives for it.  So only pass company for
+    company-specific forms such as account.config.settings, which have
+    onchange_company_id().
+
+    Settings forms' default_get() returns every group_*, module_* and
+    default_* value whatever it is asked for, so only fields are kept.
+    """
+    settings_model = registry[settings_model_name]
+    defaults = settings_model.default_get(cr, uid, fields, context=context)
+    current = dict((field, value) for field, value in defaults.items() if field in fields)
+    if company:
+        onchange = settings_model.onchange_company_id(cr, uid, [], company.id, context=context)
+        current.update((field, value)
+            for field, value in (onchange or {}).get('value', {}).items()
+            if field in fields
+        )
+    return current
+
+
+class SettingsConflictError(Exception):
+    pass
+
+
+class SettingsBatch(object):
+    """Collects settings changes so each settings form is executed only once.
+
+    execute() on a settings model is slow, so rather than calling
+    set_account_settings() and friends one after another, queue the
+    changes and flush them all at the end:
+
+        with SettingsBatch(cr, registry, SUPERUSER_ID, context=context.copy()) as batch:
+            set_default_taxes(cr, registry, SUPERUSER_ID, company, 'ST1', 'PT1',
+                context=context.copy(), batch=batch)
+            set_general_settings(cr, registry, SUPERUSER_ID,
+                changes={'module_multi_company': True},
+                context=context.copy(), batch=batch)
+
+    Changes are merged per (settings model, company) and flushed with one
+    set_settings() call each, in the order they were first queued.
+    Setting the same field to two different values raises
+    SettingsConflictError when the second change is added, and none of
+    that change is queued.
+
+    Nothing is flushed if the with block raises.
+    """
+    def __init__(self, cr, registry, uid, context=None):
+        self._cr = cr
+        self._registry = registry
+        self._uid = uid
+        self._context = context
+        self._pending = OrderedDict()
+
+    def add(self, settings_model_name, changes, company=None):
+        """Queue changes for the given settings model and (optional) company.
+        """
+        key = (settings_model_name, company.id if company else None)
+        _company, merged = self._pending.get(key, (company, {}))
+        for field, value in sorted(changes.items()):
+            if field in merged and merged[field] != value:
+                raise SettingsConflictError(
+                    "%s: conflicting values for %s%s: %r and %r" % (
+                        settings_model_name,
+                        field,
+                        ' on company %s' % (company.id,) if company else '',
+                        merged[field],
+                        value,
+                    )
+                )
+        merged.update(changes)
+        self._pending[key] = (_company, merged)
+
+    def pending(self):
+        """Return list of (settings_model_name, company_id, changes) yet to be flushed.
+        """
+        return [
+            (model_name, company_id, dict(changes))
+            for (model_name, company_id), (_company, changes) in self._pending.items()
+        ]
+
+    def flush(self):
+        """Write and execute all queued settings, then forget them.
+
+        Returns the number of settings forms executed; forms already
+        holding their queued values aren't.
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        executed = 0
+        for (model_name, _company_id), (company, changes) in pending.items():
+            executed += set_settings(self._cr, self._registry, self._uid, model_name,
+                changes=changes,
+                company=company,
+                context=self._context.copy() if self._context is not None else None,
+            )
+        return executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
+
+
+def create_consolidation_account(cr, registry, uid, company, code, name, children, context=None, user_type_id=None):
     """Create a consolidation account for a company.  Return its id.
 
     company: The company that will own the new consolidation account.
     code: Code for the new consolidation account
     name: Name for the new consolidation account
     children: List of ids of child accounts
+    user_type_id: id of the account type to use, if you already have it.
+                  Defaults to the 'Root/View' type.
     """
-    account_type_view_id = get_exactly_one_id(
-        registry['account.account.type'], cr, uid,
-        [('name', '=', 'Root/View')],
-        context=context,
-    )
-    ADD_EXISTING_ID = 4
+    if user_type_id is None:
+        user_type_id = _view_account_type_id(cr, registry, uid, context=context)
+    children = resolve_pending(list(children))
+    user_type_id = resolve_pending(user_type_id)
     data = {
         'code': code,
         'name': name,
         'type': 'consolidation',
-        'user_type': account_type_view_id,
-        'child_consol_ids': [
-            (ADD_EXISTING_ID, child_id, False) for child_id in children
-            for child in children
-        ],
+        'user_type': user_type_id,
+        'child_consol_ids': _link_commands(children),
     }
-    return registry['account.account'].create(cr, uid, data, context=context)
+    if company:
+        data['company_id'] = company.id
+    account_id = registry['account.account'].create(cr, uid, data, context=context)
+    invalidate_lookups(cr, 'account.account')
+    return account_id
+
+
+def create_consolidation_tree(cr, registry, uid, companies, nodes, context=None):
+    """Create a hierarchy of consolidation accounts in each of the companies.
+
+    companies: List of res.company objects
+    nodes: List of dictionaries, one per consolidation account:
+        code: Code for the new account
+        name: Name for the new account
+        children: Optional list of codes of existing accounts, or of other
+                  consolidation accounts in nodes
+        prefixes: Optional list of code prefixes; every existing account
+                  whose code starts with one of them becomes a child
+        ranges: Optional list of (low, high) code ranges, as for
+                AccountCodeIndex.range(); the accounts in them become children
+
+    e.g.
+        create_consolidation_tree(cr, registry, SUPERUSER_ID, [uk, fr], [
+            {'code': '9100', 'name': 'Income', 'prefixes': ['4']},
+            {'code': '9200', 'name': 'Expenses', 'prefixes': ['5', '6', '7']},
+            {'code': '9000', 'name': 'Profit & Loss', 'children': ['9100', '9200']},
+        ], context=context.copy())
+
+    Each company's accounts are read into an AccountCodeIndex with one
+    search_read, the view type is looked up once, and nodes are created
+    children first.
+
+    Returns dictionary mapping company id: {code: new account id}.
+    Raises NoRecordsError if a child code doesn't exist in a company, or
+    TooManyRecordsError if it matches more than one account.
+    """
+    order = _consolidation_order(nodes)
+    user_type_id = _view_account_type_id(cr, registry, uid, context=context)
+    result = {}
+    lookup = Lookup(cr, registry, uid, context=context)
+    for company in companies:
+        index = lookup.account_index(company)
+        created = {}
+        for node in order:
+            children = []
+            for child_code in node.get('children', []):
+                child_id = created.get(child_code)
+                children.append(child_id or index.exact(child_code))
+            for prefix in node.get('prefixes', []):
+                children.extend(index.prefix(prefix))
+            for low, high in node.get('ranges', []):
+                children.extend(index.range(low, high))
+            created[node['code']] = create_consolidation_account(cr, registry, uid,
+                company=company,
+                code=node['code'],
+                name=node['name'],
+                children=children,
+                context=context,
+                user_type_id=user_type_id,
+            )
+        result[company.id] = created
+    return result
+
+
+def _consolidation_order(nodes):
+    """Return nodes sorted so that each comes after the nodes it consolidates.
+    """
+    by_code = OrderedDict((node['code'], node) for node in nodes)
+    ordered = []
+    visiting = set()
+    done = set()
+
+    def visit(code):
+        if code in done:
+            return
+        if code in visiting:
+            raise ValueError('Consolidation account %s contains itself' % (code,))
+        visiting.add(code)
+        for child_code in by_code[code].get('children', []):
+            if child_code in by_code:
+                visit(child_code)
+        visiting.discard(code)
+        done.add(code)
+        ordered.append(by_code[code])
+
+    for code in by_code:
+        visit(code)
+    return ordered
+
+
+def _view_account_type_id(cr, registry, uid, context=None):
+    return _cached_metadata(cr, ['account.account.type', 'Root/View'], lambda: get_exactly_one_id(
+        registry['account.account.type'], cr, uid,
+        [('name', '=', 'Root/View')],
+        context=context,
+    ))
+
+
+def _cached_metadata(cr, key, compute):
+    """Return compute(), or the value saved for key in the metadata cache if in use.
+    """
+    cache = metadata_cache(cr)
+    if cache is None:
+        return compute()
+    try:
+        return cache.get(key)
+    except KeyError:
+        value = compute()
+        cache.put(key, value)
+        return value
+
+
+def _link_commands(ids):
+    """Return one (4, id) many2many link command per distinct id, in order.
+    """
+    ADD_EXISTING_ID = 4
+    return [(ADD_EXISTING_ID, child_id, False) for child_id in OrderedDict.fromkeys(ids)]
 
 
 def set_default_customer_sale_pricelist(cr, registry, uid, company, pricelist, context=None):
     """Set the default customer sale pricelist for a company.
     """
-    field_id = get_field_id(cr, registry, uid,
-        model_name='res.partner',
-        field_name='property_product_pricelist',
+    set_company_default_properties(cr, registry, uid,
+        {('res.partner', 'property_product_pricelist'): {company: pricelist}},
         context=context,
     )
+
+
+# Which ir.property column holds the value for each field type
+_PROPERTY_VALUE_FIELDS = {
+    'char': 'value_text',
+    'text': 'value_text',
+    'selection': 'value_text',
+    'float': 'value_float',
+    'integer': 'value_integer',
+    'boolean': 'value_integer',
+    'many2one': 'value_reference',
+    'date': 'value_datetime',
+    'datetime': 'value_datetime',
+    'binary': 'value_binary',
+}
+
+
+def set_company_default_properties(cr, registry, uid, properties, context=None):
+    """Set company-wide default values of many properties for many companies.
+
+    properties: Dictionary mapping (model name, field name): {company: value}
+
+        company: A res.company object or id
+        value: For many2one properties a record, an id, or a reference
+               string like 'product.pricelist,3'.  Otherwise the plain value.
+
+    e.g.
+        set_company_default_properties(cr, registry, SUPERUSER_ID, {
+            ('res.partner', 'property_product_pricelist'): {uk: uk_list, fr: fr_list},
+            ('product.template', 'cost_method'): {uk: 'average', fr: 'average'},
+        }, context=context.copy())
+
+    The fields are found with one ir.model.fields search_read, or in the
+    metadata cache if in use, and existing defaults with one ir.property
+    search_read.  Defaults that already hold
+    the requested value are left alone; the rest are removed with a single
+    unlink and recreated.
+
+    Returns the number of defaults created.
+    """
+    if not properties:
+        return 0
+    fields_by_key = _property_fields(cr, registry, uid, properties, context=context)
+
+    wanted = {}
+    for key, values in properties.items():
+        matches = fields_by_key[key]
+        domain = [('model', '=', key[0]), ('name', '=', key[1])]
+        if not matches:
+            raise NoRecordsError("No records matching %r" % domain)
+        if len(matches) > 1:
+            raise TooManyRecordsError("More than one record matching %r" % domain)
+        info = matches[0]
+        value_field = _PROPERTY_VALUE_FIELDS.get(info['ttype'], 'value_text')
+        for company, value in values.items():
+            company_id = getattr(company, 'id', company)
+            value = resolve_pending(value)
+            if info['ttype'] == 'many2one':
+                value = _property_reference(info['relation'], value)
+            wanted[info['id'], company_id] = (info, value_field, value)
+
     ir_property = registry['ir.property']
-    existing_ids = ir_property.search(cr, uid,
+    existing = ir_property.search_read(cr, uid,
         [
-            ('company_id', '=', company.id),
-            ('fields_id', '=', field_id),
+            ('fields_id', 'in', list(set(field_id for field_id, _company_id in wanted))),
+            ('company_id', 'in', list(set(company_id for _field_id, company_id in wanted))),
             ('res_id', '=', False),
         ],
+        fields=['fields_id', 'company_id'] + sorted(set(_PROPERTY_VALUE_FIELDS.values())),
         context=context,
     )
-    if existing_ids:
-        ir_property.unlink(cr, uid, existing_ids, context=context)
-    ir_property.create(cr, uid,
-        dict(
-            company_id=company.id,
-            fields_id=field_id,
-            res_id=False,
-            type='many2one',
-            value_reference=makeref('product.pricelist', pricelist.id),
-        ),
+    existing_by_key = {}
+    for prop in existing:
+        key = (_m2o_id(prop['fields_id']), _m2o_id(prop['company_id']))
+        if key in wanted:
+            existing_by_key.setdefault(key, []).append(prop)
+
+    to_unlink = []
+    to_create = []
+    for key, (info, value_field, value) in sorted(wanted.items()):
+        current = existing_by_key.get(key, [])
+        if len(current) == 1 and current[0][value_field] == value:
+            continue
+        to_unlink.extend(prop['id'] for prop in current)
+        to_create.append({
+            'name': info['name'],
+            'company_id': key[1],
+            'fields_id': key[0],
+            'res_id': False,
+            'type': info['ttype'],
+            value_field: value,
+        })
+
+    if to_unlink:
+        ir_property.unlink(cr, uid, to_unlink, context=context)
+    for values in to_create:
+        ir_property.create(cr, uid, values, context=context)
+    if to_unlink or to_create:
+        invalidate_lookups(cr, 'ir.property')
+    return len(to_create)
+
+
+def _property_fields(cr, registry, uid, keys, context=None):
+    """Return dictionary mapping (model name, field name): list of matching ir.model.fields.
+
+    The fields not in the metadata cache are found with one search_read.
+    """
+    cache = metadata_cache(cr)
+    result = {}
+    if cache is not None:
+        for key in keys:
+            try:
+                result[key] = cache.get(['ir.model.fields', 'property', key[0], key[1]])
+            except KeyError:
+                pass
+    wanted = [key for key in keys if key not in result]
+    if not wanted:
+        return result
+
+    fields_info = registry['ir.model.fields'].search_read(cr, uid,
+        [
+            ('model', 'in', list(set(model for model, _field in wanted))),
+            ('name', 'in', list(set(field for _model, field in wanted))),
+        ],
+        fields=['model', 'name', 'ttype', 'relation'],
         context=context,
     )
+    found = {}
+    for info in fields_info:
+        found.setdefault((info['model'], info['name']), []).append(info)
+    for key in wanted:
+        result[key] = found.get(key, [])
+        if cache is not None and result[key]:
+            cache.put(['ir.model.fields', 'property', key[0], key[1]], result[key])
+    return result
+
+
+def _property_reference(relation, value):
+    if not value:
+        return False
+    if isinstance(value, (str, unicode)):
+        return value
+    return makeref(relation, getattr(value, 'id', value))
+
+
+def _m2o_id(value):
+    return value[0] if isinstance(value, (list, tuple)) else value
+
+
+def _company_owned(cr, registry, uid, ids_by_model, context=None):
+    """Return set of (model name, id) of the records that belong to a company.
+    """
+    owned = set()
+    for model_name, ids in ids_by_model.items():
+        if model_name not in registry:
+            continue
+        model = registry[model_name]
+        if 'company_id' not in model.fields_get(cr, uid, ['company_id'], context=context):
+            continue
+        for record in model.search_read(cr, uid, [('id', 'in', list(ids))],
+                fields=['company_id'], context=dict(context or {}, active_test=False)):
+            if record['company_id']:
+                owned.add((model_name, record['id']))
+    return owned
+
 
 def makeref(model_name, identifier):
     """Return a string reference for an object in the database.
@@ -379,14 +1595,23 @@ def makeref(model_name, identifier):
 def get_field_id(cr, registry, uid, model_name, field_name, context=None):
     """Return the id for a model field's record in the Odoo database.
     """
-    return get_exactly_one_id(
+    return _cached_metadata(cr, ['ir.model.fields', model_name, field_name], lambda: get_exactly_one_id(
         registry['ir.model.fields'], cr, uid,
         [
             ('model', '=', model_name),
             ('name', '=', field_name),
         ],
         context=context,
-    )
+    ))
+
+
+# Sale module group names and their equivalents once 'crm' is installed
+_CRM_SALE_LEVELS = {
+    False: False,
+    'See all Leads': 'User: All Leads',
+    'See Own Leads': 'User: Own Leads Only',
+    'Manager': 'Manager',
+}
 
 
 def select_sale_user_level(cr, registry, uid, user, level, context=None):
@@ -399,29 +1624,35 @@ def select_sale_user_level(cr, registry, uid, user, level, context=None):
     level: The level according to the 'sale' module
         either 'See all Leads', 'See Own Leads', 'Manager' or False
     """
-    crm_perm_map = {
-        False: False,
-        'See all Leads': 'User: All Leads',
-        'See Own Leads': 'User: Own Leads Only',
-        'Manager': 'Manager',
-    }
+    select_sale_user_levels(cr, registry, uid, [(user, level)], context=context)
 
-    try:
-        _logger.debug('select_sale_user_level: Trying level=%r' % (level,))
-        select_user_levels(cr, registry, uid,
-            user=user,
-            changes={'Sales': level},
-            context=context.copy(),
-        )
-    except NoRecordsError, exc:
-        _logger.debug('select_sale_user_level: Caught NoRecordsError in select_user_levels: %s' % (exc,))
-        crm_level = crm_perm_map[level]
-        _logger.debug('select_sale_user_level: Trying level=%r instead' % (crm_level,))
-        select_user_levels(cr, registry, uid,
-            user=user,
-            changes={'Sales': crm_level},
-            context=context.copy(),
-        )
+
+def select_sale_user_levels(cr, registry, uid, user_levels, context=None):
+    """Like select_sale_user_level() but for many users at once.
+
+    user_levels: List of (user, level) tuples, level being as for
+                 select_sale_user_level()
+
+    Whether each level needs its 'crm' name is worked out once for all
+    users, in the same query that finds the groups.
+    """
+    levels = set(level for _user, level in user_levels if level)
+    candidates = [('Sales', level) for level in levels]
+    candidates += [('Sales', _CRM_SALE_LEVELS.get(level, level)) for level in levels]
+    group_ids = _app_group_ids(cr, registry, uid, candidates, context=context, missing_ok=True)
+
+    def group_name(level):
+        if not level or ('Sales', level) in group_ids:
+            return level
+        crm_level = _CRM_SALE_LEVELS.get(level, level)
+        _logger.debug('select_sale_user_levels: No group %r, using %r instead' % (level, crm_level))
+        return crm_level
+
+    _select_users_levels(cr, registry, uid,
+        [(user, {'Sales': group_name(level)}) for user, level in user_levels],
+        known_group_ids=group_ids,
+        context=context,
+    )
 
 
 def select_user_levels(cr, registry, uid, user, changes, context=None):
@@ -445,24 +1676,52 @@ def select_user_levels(cr, registry, uid, user, changes, context=None):
 
     
     """
-    res_users = registry['res.users']
+    select_users_levels(cr, registry, uid, [(user, changes)], context=context)
+
+
+def select_users_levels(cr, registry, uid, user_changes, context=None):
+    """Like select_user_levels() but for many users at once.
+
+    user_changes: List of (user, changes) tuples, changes being as for
+                  select_user_levels()
+
+    The user fields and all the groups are looked up once, and users
+    getting identical changes are updated with a single write.
+    """
+    _select_users_levels(cr, registry, uid, user_changes, context=context)
+
+
+def _select_users_levels(cr, registry, uid, user_changes, known_group_ids=None, context=None):
+    # Category names are translated, so the map depends on the language
+    category_field_map = _cached_metadata(cr, ['res.users', 'level fields', (context or {}).get('lang')],
+        lambda: _user_level_fields(cr, registry, uid, context=context))
+
+    group_ids = _app_group_ids(cr, registry, uid,
+        [pair for _user, changes in user_changes for pair in changes.items()],
+        known=known_group_ids,
+        context=context,
+    )
+    _write_users_grouped(cr, registry, uid, [
+        (user, {
+            category_field_map[category]: group_ids[category, group]
+            for category, group in changes.items()
+        })
+        for user, changes in user_changes
+    ], context=context)
+
 
+def _user_level_fields(cr, registry, uid, context=None):
+    """Return dictionary mapping application category name: res.users level field.
+    """
     is_user_level_field = lambda f: f.startswith('sel_groups_')
-    user_fields = res_users.fields_get(cr, uid, context=context)
+    user_fields = registry['res.users'].fields_get(cr, uid, context=context)
     level_fields = filter(is_user_level_field, user_fields.keys())
 
-    category_field_map = {
+    return {
         user_fields[field]['string']: field
         for field in level_fields
     }
 
-    field_changes = {
-        category_field_map[category]: _app_group_id(cr, registry, uid, category, group, context)
-        for category, group in changes.items()
-    }
-
-    user.write(field_changes, context=context)
-
 
 def set_user_access_rights(cr, registry, uid, user, changes, context=None):
     """Tick/untick user's technical settings.
@@ -480,12 +1739,44 @@ def set_user_access_rights(cr, registry, uid, user, changes, context=None):
         )
 
     """
+    set_users_access_rights(cr, registry, uid, [(user, changes)], context=context)
+
+
+def set_users_access_rights(cr, registry, uid, user_changes, context=None):
+    """Like set_user_access_rights() but for many users at once.
+
+    user_changes: List of (user, changes) tuples, changes being as for
+                  set_user_access_rights()
+
+    All the groups are looked up in one query, and users getting
+    identical changes are updated with a single write.
+    """
+    group_ids = _app_group_ids(cr, registry, uid,
+        [(category, group) for _user, changes in user_changes for (category, group, _ticked) in changes],
+        context=context,
+    )
     group_field = lambda gid: 'in_group_%d' % (gid,)
-    field_changes = {
-        group_field(_app_group_id(cr, registry, uid, category, group, context)): ticked
-        for (category, group, ticked) in changes
-    }
-    user.write(field_changes, context=context)
+    _write_users_grouped(cr, registry, uid, [
+        (user, {
+            group_field(group_ids[category, group]): ticked
+            for (category, group, ticked) in changes
+        })
+        for user, changes in user_changes
+    ], context=context)
+
+
+def _write_users_grouped(cr, registry, uid, user_field_changes, context=None):
+    """Write field changes to users, one write per distinct set of changes.
+    """
+    groups = OrderedDict()
+    for user, field_changes in user_field_changes:
+        if field_changes:
+            key = tuple(sorted(field_changes.items()))
+            groups.setdefault(key, []).append(user.id)
+    for key, user_ids in groups.items():
+        registry['res.users'].write(cr, uid, user_ids, dict(key), context=context)
+    invalidate_lookups(cr, 'res.users')
+
 
 def _app_group_id(cr, registry, uid, category_name, group_name, context=None):
     if group_name:
@@ -499,6 +1790,59 @@ def _app_group_id(cr, registry, uid, category_name, group_name, context=None):
     else:
         return False
 
+
+def _app_group_ids(cr, registry, uid, pairs, context=None, missing_ok=False, known=None):
+    """Return dictionary mapping (category_name, group_name): group id.
+
+    Like calling _app_group_id() for each pair, but with one search_read.
+    Pairs whose group_name is False map to False.
+
+    known: Mapping of pairs already looked up, which won't be searched again.
+
+    Raises NoRecordsError or TooManyRecordsError for the first pair that
+    doesn't match exactly one group, unless missing_ok is set, in which
+    case groups that aren't found are just left out.
+    """
+    pairs = set(pairs)
+    known = known or {}
+    result = {pair: False for pair in pairs if not pair[1]}
+    result.update((pair, known[pair]) for pair in pairs if pair in known)
+    cache = metadata_cache(cr)
+    lang = (context or {}).get('lang')
+    if cache is not None:
+        for pair in pairs - set(result):
+            try:
+                result[pair] = cache.get(['res.groups', lang, pair[0], pair[1]])
+            except KeyError:
+                pass
+    wanted = pairs - set(result)
+    if not wanted:
+        return result
+    records = registry['res.groups'].search_read(cr, uid,
+        [
+            ('category_id.name', 'in', list(set(category for category, _group in wanted))),
+            ('name', 'in', list(set(group for _category, group in wanted))),
+        ],
+        fields=['name', 'category_id'],
+        context=context,
+    )
+    found = {}
+    for record in records:
+        category = record['category_id'] and record['category_id'][1]
+        found.setdefault((category, record['name']), []).append(record['id'])
+    for category, group in sorted(wanted):
+        domain = [('category_id.name', '=', category), ('name', '=', group)]
+        ids = found.get((category, group), [])
+        if len(ids) > 1:
+            raise TooManyRecordsError("More than one record matching %r" % domain)
+        elif ids:
+            result[category, group] = ids[0]
+            if cache is not None:
+                cache.put(['res.groups', lang, category, group], ids[0])
+        elif not missing_ok:
+            raise NoRecordsError("No records matching %r" % domain)
+    return result
+
 class WrongNumberOfRecordsError(Exception):
     pass
 
@@ -508,25 +1852,57 @@ class TooManyRecordsError(WrongNumberOfRecordsError):
 class NoRecordsError(WrongNumberOfRecordsError):
     pass
 
-def get_exactly_one_id(model, cr, uid, domain, context=None):
+class BulkLookupError(WrongNumberOfRecordsError):
+    """Raised by bulk lookups when some values didn't match exactly one record.
+
+    errors: Ordered mapping of value: NoRecordsError or TooManyRecordsError
+    results: Ordered mapping of value: id for the values that were found
+    """
+    def __init__(self, errors, results):
+        super(BulkLookupError, self).__init__(
+            "%d value(s) did not match exactly one record: %s"
+            % (len(errors), '; '.join(str(exc) for exc in errors.values()))
+        )
+        self.errors = errors
+        self.results = results
+
+def get_exactly_one_id(model, cr, uid, domain, context=None, use_sql=False):
     """Return one record id matching the domain.  Raise if any other number is found.
 
     Raises TooManyRecordsError if more than one record is found.
     Raises NoRecordsError if no records are found.
+
+    use_sql: as for get_maybe_id
     """
-    retrieved_id = get_maybe_id(model, cr, uid, domain, context=context)
+    retrieved_id = get_maybe_id(model, cr, uid, domain, context=context, use_sql=use_sql)
     if retrieved_id is None:
         raise NoRecordsError("No records matching %r" % domain)
     else:
         return retrieved_id
 
 
-def get_maybe_id(model, cr, uid, domain, context=None):
+# Number of get_maybe_id() calls answered by each path: 'orm' or 'sql'
+lookup_path_counts = Counter()
+
+def get_maybe_id(model, cr, uid, domain, context=None, use_sql=False):
     """Return single record id or None matching the domain.
 
     Raises TooManyRecordsError if more than one record is found.
+
+    Only the first two matches are ever fetched, since that's all that's
+    needed to tell one match from many.
+
+    use_sql: If True, and uid is the superuser, and domain is just
+             ('field', '=', value) leaves on plain stored columns,
+             query the table directly, skipping the domain parser and
+             record rules.  Anything else goes through search() as usual.
     """
-    ids = model.search(cr, uid, domain, context=context)
+    ids = _sql_probe_ids(model, cr, uid, domain, context) if use_sql else None
+    if ids is None:
+        lookup_path_counts['orm'] += 1
+        ids = model.search(cr, uid, domain, limit=2, context=context)
+    else:
+        lookup_path_counts['sql'] += 1
     if len(ids) > 1:
         raise TooManyRecordsError("More than one record matching %r" % domain)
     elif len(ids) == 0:
@@ -535,6 +1911,41 @@ def get_maybe_id(model, cr, uid, domain, context=None):
         return ids[0]
 
 
+def _sql_probe_ids(model, cr, uid, domain, context=None):
+    """Return up to two ids matching domain using plain SQL.
+
+    Returns None if the domain is too complicated for this, in which case
+    the caller should fall back to search().
+    """
+    if uid != SUPERUSER_ID or not domain:
+        return None
+    columns = getattr(model, '_columns', {})
+    clauses = []
+    params = []
+    mentions_active = False
+    for leaf in domain:
+        if not isinstance(leaf, (list, tuple)) or len(leaf) != 3:
+            return None
+        field, operator, value = leaf
+        column = columns.get(field)
+        if (operator != '=' or column is None or value in (False, None)
+                or not getattr(column, '_classic_write', False)
+                or getattr(column, 'translate', False)):
+            return None
+        mentions_active = mentions_active or field == 'active'
+        clauses.append('"%s" = %%s' % (field,))
+        params.append(value)
+    # search() hides archived records unless told otherwise, so must we
+    if ('active' in columns and not mentions_active
+            and (context or {}).get('active_test', True)):
+        clauses.append('"active" = true')
+    cr.execute('SELECT id FROM "%s" WHERE %s ORDER BY id LIMIT 2'
+        % (model._table, ' AND '.join(clauses)),
+        params,
+    )
+    return [row[0] for row in cr.fetchall()]
+
+
 def refgetter(cr, registry, uid):
     """DEPRECATED Return a function with simplified interface to get references.
 
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Apply account settings from large CSV or JSON Lines files.
+
+    report = import_account_settings(cr, registry, SUPERUSER_ID, company,
+        read_rows('/path/to/accounts.csv'),
+        chunk_size=1000,
+        commit_every=10000,
+        context=context.copy(),
+    )
+    _logger.info('%d rows at %.0f rows/s, %d failed'
+                 % (report.rows, report.rows_per_second, report.failed_count))
+
+Each row has a 'code' identifying one of the company's accounts, plus
+any of:
+
+    type: Name of an account.account.type, written to user_type
+    taxes: account.tax codes (their description), separated by spaces or
+           commas, or as a JSON list, written to tax_ids
+    reconcile: true/false, 1/0, yes/no
+
+Other columns are written to the account field of the same name as they
+are.  Empty cells are left alone.
+
+Rows are read lazily and handled chunk_size at a time: the codes, types
+and taxes in a chunk are each found with one search_read.  Rows for the
+same account are merged, later rows winning, and then accounts getting
+identical changes are written together.  Only one chunk is held
+in memory, plus at most keep_failures failed rows.
+
+A row fails if its account, type or one of its taxes doesn't match
+exactly one record, with that lookup's WrongNumberOfRecordsError as the
+reason, if it has no code or its reconcile value isn't recognised
+(ValueError), or if one of its values is of the wrong kind (TypeError).
+The rest of its chunk still goes ahead.
+"""
+
+from collections import OrderedDict
+import csv
+import json
+import re
+import time
+
+from .confutil import (
+    Lookup, BulkLookupError, WrongNumberOfRecordsError, invalidate_lookups, normalize_domain,
+)
+
+import logging
+_logger = logging.getLogger(__name__)
+
+_TRUE = frozenset(['1', 'true', 'yes', 'y', 't'])
+_FALSE = frozenset(['0', 'false', 'no', 'n', 'f'])
+
+
+class ImportReport(object):
+    """What an import did.
+
+    rows: Number of rows read
+    written: Number of distinct accounts written
+    written_ids: Set of the ids of the accounts written
+    failed: List of (line number, row, exception) for the
+            first keep_failures failed rows
+    failed_count: Total number of failed rows
+    seconds: Wall time taken
+    """
+    def __init__(self):
+        self.rows = 0
+        self.written_ids = set()
+        self.failed = []
+        self.failed_count = 0
+        self.seconds = 0.0
+
+    @property
+    def written(self):
+        return len(self.written_ids)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_rows(path):
+    """Yield (line number, row dictionary) from a CSV or JSON Lines file.
+
+    Files ending .json or .jsonl are read as one JSON object per line;
+    anything else as CSV with a header row.
+    """
+    with open(path, 'rb') as stream:
+        if path.endswith(('.json', '.jsonl')):
+            for line_number, line in enumerate(stream, 1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+        else:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, dict(
+                    (key, value.decode('utf-8') if isinstance(value, str) else value)
+                    for key, value in row.items()
+                )
+
+
+def import_account_settings(cr, registry, uid, company, rows, chunk_size=1000, commit_every=None,
+                            keep_failures=1000, context=None):
+    """Write the account settings in rows to company's accounts.
+
+    rows: Iterable of (line number, row dictionary), such as read_rows() gives
+    commit_every: If given, commit after roughly this many rows
+    keep_failures: Most failed rows to keep in the report
+
+    Returns an ImportReport.
+    """
+    lookup = Lookup(cr, registry, uid, context=context)
+    report = ImportReport()
+    started = time.time()
+    since_commit = 0
+    for chunk in _chunks(rows, chunk_size):
+        report.rows += len(chunk)
+        _import_chunk(cr, registry, uid, lookup, company, chunk, report, keep_failures, context=context)
+        since_commit += len(chunk)
+        if commit_every and since_commit >= commit_every:
+            cr.commit()
+            since_commit = 0
+    if commit_every and since_commit:
+        cr.commit()
+    report.seconds = time.time() - started
+    _logger.debug('import_account_settings: %d rows, %d written, %d failed in %.1fs'
+                  % (report.rows, report.written, report.failed_count, report.seconds))
+    return report
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _import_chunk(cr, registry, uid, lookup, company, chunk, report, keep_failures, context=None):
+    account_ids, account_errors = _bulk(lookup.account_ids, company,
+        [row['code'] for _line, row in chunk if row.get('code') and isinstance(row['code'], basestring)])
+    type_ids, type_errors = _bulk(lookup.exactly_one_ids, 'account.account.type', 'name',
+        [row['type'] for _line, row in chunk if row.get('type') and isinstance(row['type'], basestring)])
+    tax_ids, tax_errors = _bulk(lookup.exactly_one_ids, 'account.tax', 'description',
+        [code for _line, row in chunk for code in _tax_codes(row)],
+        extra_domain=[('company_id', '=', company.id)])
+
+    changes = OrderedDict()
+    for line, row in chunk:
+        try:
+            if not row.get('code'):
+                raise ValueError('No account code')
+            _check_text('code', row['code'])
+            if row['code'] in account_errors:
+                raise account_errors[row['code']]
+            values = {}
+            for field, value in row.items():
+                if field == 'code' or value in (None, ''):
+                    continue
+                if field == 'type':
+                    _check_text(field, value)
+                    if value in type_errors:
+                        raise type_errors[value]
+                    values['user_type'] = type_ids[value]
+                elif field == 'taxes':
+                    codes = _split_codes(value)
+                    for code in codes:
+                        if code in tax_errors:
+                            raise tax_errors[code]
+                    values['tax_ids'] = [(6, 0, [tax_ids[code] for code in codes])]
+                elif field == 'reconcile':
+                    values['reconcile'] = _boolean(value)
+                else:
+                    values[field] = value
+        except (WrongNumberOfRecordsError, ValueError, TypeError) as error:
+            report.failed_count += 1
+            if len(report.failed) < keep_failures:
+                report.failed.append((line, row, error))
+            continue
+        if values:
+            changes.setdefault(account_ids[row['code']], {}).update(values)
+
+    groups = OrderedDict()
+    for account_id, values in changes.items():
+        groups.setdefault(normalize_domain(values), (values, []))[1].append(account_id)
+    accounts = registry['account.account']
+    for values, ids in groups.values():
+        accounts.write(cr, uid, ids, values, context=context)
+        report.written_ids.update(ids)
+    if groups:
+        invalidate_lookups(cr, 'account.account')
+
+
+def _bulk(method, *args, **kwargs):
+    """Call a Lookup bulk method, returning (results, errors) rather than raising.
+    """
+    try:
+        return method(*args, **kwargs), {}
+    except BulkLookupError as error:
+        return error.results, error.errors
+
+
+def _tax_codes(row):
+    """Return the tax codes in row, or none if they're malformed (the row fails later).
+    """
+    try:
+        return _split_codes(row.get('taxes'))
+    except TypeError:
+        return []
+
+
+def _split_codes(value):
+    if isinstance(value, (list, tuple)):
+        for code in value:
+            _check_text('taxes', code)
+        return [code for code in value if code]
+    return [code for code in re.split(r'[\s,]+', value or '') if code]
+
+
+def _check_text(field, value):
+    if not isinstance(value, basestring):
+        raise TypeError('%s must be text, not %r' % (field, value))
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = unicode(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError('Not a true/false value: %r' % (value,))
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Count the SQL and ORM work done by each confutil helper.
+
+    instr = Instrumentation()
+    cr = instr.cursor(cr)
+    registry = instr.registry(registry)
+    with instr.patch():
+        lookup = Lookup(cr, registry, SUPERUSER_ID, context={})
+        set_default_taxes(cr, registry, SUPERUSER_ID, company, 'ST11', 'PT11', context={})
+    _logger.info(instr.format_report())
+
+While patch() is active, every public and private function in
+confutil.confutil and confutil.account_setup, and every Lookup method,
+records how many times it was called, how many SQL statements it ran,
+how long they took, how many ORM methods it called and its wall time.
+Figures are inclusive: a query made by set_settings() on behalf of
+set_default_taxes() counts towards both.
+
+Give budgets to fail when a helper gets more expensive:
+
+    instr = Instrumentation(budgets={'set_settings': 12, '_app_group_ids': 1})
+
+Each budget is the most SQL statements allowed in a single call of that
+helper; QueryBudgetExceeded is raised as soon as a call goes over.
+
+Only calls made through the module attributes are seen, so names bound
+earlier with "from confutil.confutil import x" aren't instrumented.
+"""
+
+from contextlib import contextmanager
+import inspect
+import time
+
+from . import confutil as confutil_module
+from . import account_setup as account_setup_module
+
+import logging
+_logger = logging.getLogger(__name__)
+
+TOTAL = '<total>'
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class HelperStats(object):
+    """Counters for one helper.  All figures are summed over every call,
+    except max_queries which is the most statements run by one call.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.orm_calls = 0
+        self.wall_seconds = 0.0
+        self.max_queries = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'queries': self.queries,
+            'sql_seconds': self.sql_seconds,
+            'orm_calls': self.orm_calls,
+            'wall_seconds': self.wall_seconds,
+            'max_queries': self.max_queries,
+        }
+
+
+class Instrumentation(object):
+    def __init__(self, budgets=None):
+        self.budgets = dict(budgets or {})
+        self.stats = {TOTAL: HelperStats(TOTAL)}
+        # Names of the helpers currently running, innermost last
+        self._stack = []
+
+    def cursor(self, cr):
+        """Return a wrapper around cr that counts and times execute() calls.
+        """
+        return InstrumentedCursor(cr, self)
+
+    def registry(self, registry):
+        """Return a wrapper around registry whose models count method calls.
+        """
+        return InstrumentedRegistry(registry, self)
+
+    def _active(self):
+        names = set(self._stack)
+        names.add(TOTAL)
+        return [self.stats[name] for name in names]
+
+    def _record_query(self, seconds):
+        for stats in self._active():
+            stats.queries += 1
+            stats.sql_seconds += seconds
+
+    def _record_orm_call(self):
+        for stats in self._active():
+            stats.orm_calls += 1
+
+    def wrap(self, name, func):
+        """Return func wrapped so that its work is recorded under name.
+        """
+        def wrapper(*args, **kwargs):
+            stats = self.stats.setdefault(name, HelperStats(name))
+            stats.calls += 1
+            queries_before = self.stats[TOTAL].queries
+            started = time.time()
+            self._stack.append(name)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self._stack.pop()
+                stats.wall_seconds += time.time() - started
+                used = self.stats[TOTAL].queries - queries_before
+                stats.max_queries = max(stats.max_queries, used)
+            budget = self.budgets.get(name)
+            if budget is not None and used > budget:
+                raise QueryBudgetExceeded('%s ran %d SQL statements, budget is %d'
+                                          % (name, used, budget))
+            return result
+        wrapper.__name__ = getattr(func, '__name__', name)
+        wrapper.__doc__ = getattr(func, '__doc__', None)
+        return wrapper
+
+    @contextmanager
+    def patch(self):
+        """Instrument the confutil helpers for the duration of a with block.
+        """
+        originals = []
+        for module in (confutil_module, account_setup_module):
+            for attr, value in list(vars(module).items()):
+                if inspect.isfunction(value) and value.__module__ == module.__name__:
+                    originals.append((module, attr, value))
+                    setattr(module, attr, self.wrap(attr, value))
+        lookup_class = confutil_module.Lookup
+        for attr, value in list(vars(lookup_class).items()):
+            if inspect.isfunction(value) and attr != '__init__':
+                originals.append((lookup_class, attr, value))
+                setattr(lookup_class, attr, self.wrap('Lookup.' + attr, value))
+        try:
+            yield self
+        finally:
+            for owner, attr, value in originals:
+                setattr(owner, attr, value)
+
+    def report(self):
+        """Return dictionary mapping helper name: dictionary of counters.
+
+        The '<total>' entry covers everything seen through the wrapped
+        cursor and registry, whether or not a helper was running.
+        """
+        return dict((name, stats.as_dict()) for name, stats in self.stats.items())
+
+    def format_report(self):
+        """Return the report as a table, most expensive helpers first.
+        """
+        rows = sorted(self.stats.values(), key=lambda s: (s.name != TOTAL, -s.sql_seconds, s.name))
+        lines = ['%-40s %6s %8s %9s %6s %9s' % ('helper', 'calls', 'queries', 'sql s', 'orm', 'wall s')]
+        for s in rows:
+            lines.append('%-40s %6d %8d %9.3f %6d %9.3f' % (
+                s.name, s.calls, s.queries, s.sql_seconds, s.orm_calls, s.wall_seconds,
+            ))
+        return '\n'.join(lines)
+
+    def check_budgets(self):
+        """Raise QueryBudgetExceeded if any recorded call went over its budget.
+
+        Budgets are checked as calls finish anyway; this is for when a
+        helper's exception was caught by the code under test.
+        """
+        for name, budget in sorted(self.budgets.items()):
+            stats = self.stats.get(name)
+            if stats is not None and stats.max_queries > budget:
+                raise QueryBudgetExceeded('%s ran %d SQL statements, budget is %d'
+                                          % (name, stats.max_queries, budget))
+
+
+class InstrumentedCursor(object):
+    def __init__(self, cr, instrumentation):
+        self._cr = cr
+        self._instrumentation = instrumentation
+
+    def execute(self, *args, **kwargs):
+        started = time.time()
+        try:
+            return self._cr.execute(*args, **kwargs)
+        finally:
+            self._instrumentation._record_query(time.time() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._cr, name)
+
+
+class InstrumentedRegistry(object):
+    def __init__(self, registry, instrumentation):
+        self._registry = registry
+        self._instrumentation = instrumentation
+
+    def __getitem__(self, model_name):
+        return InstrumentedModel(self._registry[model_name], self._instrumentation)
+
+    def __contains__(self, model_name):
+        return model_name in self._registry
+
+    def __getattr__(self, name):
+        return getattr(self._registry, name)
+
+
+class InstrumentedModel(object):
+    def __init__(self, model, instrumentation):
+        self._model = model
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        value = getattr(self._model, name)
+        if name.startswith('_') or not callable(value):
+            return value
+        instrumentation = self._instrumentation
+
+        def orm_call(*args, **kwargs):
+            instrumentation._record_orm_call()
+            return value(*args, **kwargs)
+        return orm_call
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Skip helper calls that a previous run of the same hook already made.
+
+Hooks run again on every module upgrade.  Calls made through a Journal
+are recorded, and a later call of the same helper with the same
+arguments is skipped:
+
+    journal = Journal(cr, registry, SUPERUSER_ID, context=context)
+    journal.call(select_user_levels, user, {'Sales': 'Manager'}, context=context)
+    journal.call(set_default_customer_sale_pricelist, company, pricelist, context=context)
+
+The helper is called as helper(cr, registry, uid, *args, **kwargs).  The
+arguments are fingerprinted with browse records reduced to (model, id);
+the context and batch arguments are left out of the fingerprint.
+
+The journal is kept in ir.config_parameter under keys starting
+'confutil.journal.', so it commits or rolls back with the work it
+records.  All entries are read on the first call, after which checking
+whether a call has been made costs nothing.
+
+Journal(..., force=True) runs every call and rewrites its entry;
+journal.forget() drops entries so that they run again next time, and
+journal.entries() lists them.
+"""
+
+import hashlib
+import json
+import time
+
+from .confutil import resolve_pending
+
+import logging
+_logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'confutil.journal.'
+
+# Arguments that don't change what a helper does
+_IGNORED_KWARGS = frozenset(['context', 'batch'])
+
+
+class Journal(object):
+    def __init__(self, cr, registry, uid, context=None, force=False):
+        self.cr = cr
+        self.registry = registry
+        self.uid = uid
+        self.context = context
+        self.force = force
+        self.skipped = 0
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            rows = self.registry['ir.config_parameter'].search_read(self.cr, self.uid,
+                [('key', '=like', KEY_PREFIX + '%')],
+                fields=['key', 'value'],
+                context=self.context,
+            )
+            self._entries = dict((row['key'], (row['id'], json.loads(row['value']))) for row in rows)
+        return self._entries
+
+    def call(self, helper, *args, **kwargs):
+        """Call helper(cr, registry, uid, *args, **kwargs) unless it's been done before.
+
+        Returns the helper's result, or if skipped the result recorded
+        when it was called (as it came back from JSON).
+        """
+        args = resolve_pending(args)
+        kwargs = resolve_pending(kwargs)
+        entries = self._load()
+        key = journal_key(helper.__name__, args, kwargs)
+        if key in entries and not self.force:
+            self.skipped += 1
+            _logger.debug('Journal: skipping %s' % (key,))
+            return entries[key][1]['outcome']
+
+        result = helper(self.cr, self.registry, self.uid, *args, **kwargs)
+        value = json.dumps({
+            'helper': helper.__name__,
+            'outcome': _fingerprint(result),
+            'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }, sort_keys=True)
+        model = self.registry['ir.config_parameter']
+        if key in entries:
+            record_id = entries[key][0]
+            model.write(self.cr, self.uid, [record_id], {'value': value}, context=self.context)
+        else:
+            record_id = model.create(self.cr, self.uid, {'key': key, 'value': value}, context=self.context)
+        entries[key] = (record_id, json.loads(value))
+        return result
+
+    def entries(self, helper_name=None):
+        """Return list of dictionaries with the key, helper, outcome and time of each entry.
+        """
+        result = []
+        for key, (_record_id, entry) in sorted(self._load().items()):
+            if helper_name and entry['helper'] != helper_name:
+                continue
+            result.append(dict(entry, key=key))
+        return result
+
+    def forget(self, helper_name=None):
+        """Delete the entries for helper_name, or all entries, so those calls run again.
+
+        Returns the number of entries deleted.
+        """
+        entries = self._load()
+        keys = [key for key, (_record_id, entry) in entries.items()
+                if not helper_name or entry['helper'] == helper_name]
+        if keys:
+            self.registry['ir.config_parameter'].unlink(self.cr, self.uid,
+                [entries[key][0] for key in keys],
+                context=self.context,
+            )
+            for key in keys:
+                del entries[key]
+        return len(keys)
+
+
+def journal_key(helper_name, args, kwargs):
+    """Return the ir.config_parameter key recording a call of helper_name with these arguments.
+    """
+    kwargs = dict((name, value) for name, value in kwargs.items() if name not in _IGNORED_KWARGS)
+    digest = hashlib.sha1(json.dumps(_fingerprint([args, kwargs]), sort_keys=True)).hexdigest()
+    return '%s%s.%s' % (KEY_PREFIX, helper_name, digest)
+
+
+def _fingerprint(value):
+    """Reduce value to something JSON can represent, with browse records as [model, id].
+    """
+    if hasattr(value, '_name') and hasattr(value, 'id'):
+        return [value._name, value.id]
+    if isinstance(value, dict):
+        return sorted([_fingerprint(key), _fingerprint(item)] for key, item in value.items())
+    if isinstance(value, (set, frozenset)):
+        return sorted(_fingerprint(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return [_fingerprint(item) for item in value]
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    return repr(value)
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
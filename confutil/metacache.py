@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""An on-disk cache of metadata lookups that survives restarts.
+
+Field ids, the user access level fields, group ids and the Root/View
+account type only change when modules are installed or upgraded.  After
+
+    use_metadata_cache(cr, registry, SUPERUSER_ID, '/var/lib/odoo/confutil-cache.sqlite')
+
+the helpers in confutil.confutil that look those up check the cache
+first, and store what they find for the next run.
+
+Entries are kept in SQLite, keyed on the database name and a signature
+of the installed modules' names and versions.  Working out the
+signature costs one ir.module.module search_read per process.  When the
+signature changes, the stale entries for that database are dropped.  The
+signature is worked out again after any settings execute(), since that
+can install modules.
+
+Any number of processes and threads can share the same file; SQLite
+does the locking.  Each thread of each process opens its own connection.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import logging
+_logger = logging.getLogger(__name__)
+
+# Database name: (MetadataCache, registry, uid)
+_active = {}
+
+
+class MetadataCache(object):
+    """Persistent mapping of key: value for one database and module signature.
+
+    Keys and values are anything JSON can represent.
+    """
+    def __init__(self, path, db_name, signature=None):
+        self.path = path
+        self.db_name = db_name
+        self.signature = signature
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+            except sqlite3.DatabaseError:
+                pass
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                ' db TEXT NOT NULL, signature TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+                ' PRIMARY KEY (db, signature, key))'
+            )
+            local.conn, local.pid = conn, os.getpid()
+        return local.conn
+
+    def set_signature(self, signature):
+        """Switch to signature, dropping entries saved under any other.
+        """
+        if signature != self.signature:
+            self._connection().execute('DELETE FROM metadata WHERE db = ? AND signature != ?',
+                                       (self.db_name, signature))
+            self.signature = signature
+
+    def get(self, key):
+        """Return the value stored for key.  Raises KeyError if there isn't one.
+        """
+        row = self._connection().execute(
+            'SELECT value FROM metadata WHERE db = ? AND signature = ? AND key = ?',
+            (self.db_name, self.signature, json.dumps(key)),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO metadata (db, signature, key, value) VALUES (?, ?, ?, ?)',
+            (self.db_name, self.signature, json.dumps(key), json.dumps(value)),
+        )
+
+    def clear(self):
+        """Drop every entry for this database.
+        """
+        self._connection().execute('DELETE FROM metadata WHERE db = ?', (self.db_name,))
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'signature': self.signature}
+
+
+def module_signature(cr, registry, uid, context=None):
+    """Return a digest of the names and versions of the installed modules.
+    """
+    modules = registry['ir.module.module'].search_read(cr, uid,
+        [('state', '=', 'installed')],
+        fields=['name', 'latest_version'],
+        context=context,
+    )
+    versions = sorted((module['name'], module['latest_version'] or '') for module in modules)
+    return hashlib.sha1(json.dumps(versions)).hexdigest()
+
+
+def use_metadata_cache(cr, registry, uid, path):
+    """Have the confutil helpers cache metadata for cr's database in the file at path.
+
+    Returns the MetadataCache.
+    """
+    cache = MetadataCache(path, cr.dbname)
+    _active[cr.dbname] = (cache, registry, uid)
+    return cache
+
+
+def stop_metadata_cache(cr):
+    """Stop using the metadata cache for cr's database.
+    """
+    _active.pop(getattr(cr, 'dbname', None), None)
+
+
+def metadata_cache(cr):
+    """Return the MetadataCache in use for cr's database, or None.
+    """
+    entry = _active.get(getattr(cr, 'dbname', None))
+    if entry is None:
+        return None
+    cache, registry, uid = entry
+    if cache.signature is None:
+        cache.set_signature(module_signature(cr, registry, uid))
+    return cache
+
+
+def forget_signature(cr):
+    """Work the module signature out again before the cache is next used.
+    """
+    entry = _active.get(getattr(cr, 'dbname', None))
+    if entry is not None:
+        entry[0].signature = None
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
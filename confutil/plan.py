@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Declarative configuration plans.
+
+Rather than calling the helpers one at a time from a post_init hook,
+describe the configuration you want as a dictionary (or JSON file):
+
+    {
+        "companies": {
+            "uk": {
+                "company": "base.main_company",
+                "chart_template": "l10n_uk.l10n_uk",
+                "code_digits": 6,
+                "fiscal_years": [2015, 2016],
+                "default_taxes": {"sale": "ST11", "purchase": "PT11"},
+                "multi_currency": {"gain": "7700", "loss": "7701"},
+                "sale_pricelist": "product.list0"
+            }
+        },
+        "general_settings": {"group_multi_company": true},
+        "users": [
+            {
+                "user": "base.user_root",
+                "levels": {"Sales": "Manager"},
+                "access_rights": [["Technical Settings", "Multi Currencies", true]]
+            }
+        ]
+    }
+
+All records are referred to by XMLID.  compile_plan() turns this into a
+CompiledPlan whose steps run in dependency order:
+
+    1. resolve every XMLID, preloading each module's ir.model.data once
+    2. install charts of accounts (one unconfigured-company scan)
+    3. create fiscal years for the companies that just got a chart
+    4. look up all tax and account codes, one query per company and model
+    5. apply all settings through one SettingsBatch
+    6. set company default pricelists
+    7. set user levels and access rights in bulk
+
+    compiled = compile_plan(plan)
+    print compiled.describe()       # dry run
+    compiled.execute(cr, registry, SUPERUSER_ID, context=context.copy())
+
+From the command line, "python -m confutil.plan plan.json --dry-run"
+prints the calls a plan would make without connecting to a database.
+"""
+
+from collections import OrderedDict
+from datetime import date
+import json
+
+from .confutil import (
+    SUPERUSER_ID,
+    Lookup,
+    SettingsBatch,
+    set_account_settings,
+    set_general_settings,
+    set_default_customer_sale_pricelist,
+    select_users_levels,
+    set_users_access_rights,
+)
+from .account_setup import (
+    unconfigured_company_ids,
+    setup_chart_of_accounts,
+    create_fiscal_year,
+)
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+PHASES = [
+    'resolve',
+    'charts',
+    'fiscal_years',
+    'lookups',
+    'settings',
+    'properties',
+    'users',
+]
+
+_COMPANY_KEYS = set([
+    'company',
+    'chart_template',
+    'code_digits',
+    'fiscal_years',
+    'default_taxes',
+    'multi_currency',
+    'sale_pricelist',
+])
+
+
+class PlanError(Exception):
+    pass
+
+
+class PlanStep(object):
+    """One step of a CompiledPlan.
+
+    phase: One of PHASES
+    description: What the step is for
+    calls: Human-readable list of the ORM calls it will make
+    action: Callable taking a PlanState, which does the work
+    """
+    def __init__(self, phase, description, calls, action):
+        self.phase = phase
+        self.description = description
+        self.calls = calls
+        self.action = action
+
+
+class PlanState(object):
+    """Everything the steps of a plan share while executing.
+    """
+    def __init__(self, cr, registry, uid, context):
+        self.cr = cr
+        self.registry = registry
+        self.uid = uid
+        self.context = context
+        self.lookup = Lookup(cr, registry, uid, context=context.copy(), cache_size=10000)
+        self.ids = {}
+        self.tax_ids = {}
+        self.account_ids = {}
+        self.configured = set()
+
+    def record(self, xmlid):
+        return self.lookup.xmlid(xmlid)
+
+
+class CompiledPlan(object):
+    def __init__(self, steps):
+        self.steps = sorted(steps, key=lambda step: PHASES.index(step.phase))
+
+    def describe(self):
+        """Return the dry-run listing of the plan's steps and calls, as a string.
+        """
+        lines = []
+        for number, step in enumerate(self.steps, 1):
+            lines.append('%d. [%s] %s' % (number, step.phase, step.description))
+            lines.extend('       %s' % (call,) for call in step.calls)
+        return '\n'.join(lines)
+
+    def execute(self, cr, registry, uid, context=None):
+        """Run the plan.  Return the PlanState, for inspecting resolved ids.
+        """
+        state = PlanState(cr, registry, uid, dict(context or {}))
+        for step in self.steps:
+            _logger.debug('plan: [%s] %s' % (step.phase, step.description))
+            step.action(state)
+        return state
+
+
+def load_plan(path):
+    """Read a plan from a JSON file.
+    """
+    with open(path) as plan_file:
+        return json.load(plan_file)
+
+
+def compile_plan(plan):
+    """Validate a plan dictionary and return a CompiledPlan.
+    """
+    companies = OrderedDict(sorted((plan.get('companies') or {}).items()))
+    users = plan.get('users') or []
+    general_settings = plan.get('general_settings') or {}
+
+    for key, spec in companies.items():
+        unknown = set(spec) - _COMPANY_KEYS
+        if unknown:
+            raise PlanError('companies.%s: unknown keys %s' % (key, ', '.join(sorted(unknown))))
+        if 'company' not in spec:
+            raise PlanError('companies.%s: "company" is required' % (key,))
+    for index, spec in enumerate(users):
+        if 'user' not in spec:
+            raise PlanError('users[%d]: "user" is required' % (index,))
+
+    steps = []
+    steps.append(_resolve_step(companies, users))
+
+    charted = OrderedDict((key, spec) for key, spec in companies.items() if spec.get('chart_template'))
+    if charted:
+        steps.append(_charts_step(charted))
+        fiscal = OrderedDict((key, spec) for key, spec in charted.items()
+                             if spec.get('fiscal_years', True))
+        if fiscal:
+            steps.append(_fiscal_years_step(fiscal))
+
+    tax_codes = OrderedDict()
+    account_codes = OrderedDict()
+    for key, spec in companies.items():
+        taxes = spec.get('default_taxes')
+        if taxes:
+            tax_codes[key] = [taxes['sale'], taxes['purchase']]
+        currency = spec.get('multi_currency')
+        if currency:
+            account_codes[key] = [currency['gain'], currency['loss']]
+    if tax_codes or account_codes:
+        steps.append(_lookups_step(companies, tax_codes, account_codes))
+
+    if tax_codes or account_codes or general_settings:
+        steps.append(_settings_step(companies, general_settings))
+
+    pricelists = OrderedDict((key, spec) for key, spec in companies.items() if spec.get('sale_pricelist'))
+    if pricelists:
+        steps.append(_pricelists_step(pricelists))
+
+    if users:
+        steps.append(_users_step(users))
+
+    return CompiledPlan(steps)
+
+
+def _xmlids(companies, users):
+    xmlids = set()
+    for spec in companies.values():
+        xmlids.add(spec['company'])
+        for key in ('chart_template', 'sale_pricelist'):
+            if spec.get(key):
+                xmlids.add(spec[key])
+    for spec in users:
+        xmlids.add(spec['user'])
+    return sorted(xmlids)
+
+
+def _resolve_step(companies, users):
+    xmlids = _xmlids(companies, users)
+    modules = sorted(set(xmlid.split('.')[0] for xmlid in xmlids))
+
+    def action(state):
+        state.lookup.preload_xmlids(*modules)
+        for xmlid in xmlids:
+            state.ids[xmlid] = state.lookup.xmlid_id(xmlid)
+
+    return PlanStep('resolve', 'Resolve %d XMLID(s)' % (len(xmlids),),
+        ["ir.model.data.search_read([('module', 'in', %r)])" % (modules,)],
+        action,
+    )
+
+
+def _charts_step(charted):
+    def action(state):
+        unconfigured = set(unconfigured_company_ids(state.cr, state.registry, state.uid,
+            context=state.context.copy(),
+        ))
+        for key, spec in charted.items():
+            company_id = state.ids[spec['company']]
+            if company_id not in unconfigured:
+                _logger.debug('plan: company %s already has a chart of accounts' % (key,))
+                continue
+            setup_chart_of_accounts(state.cr, state.registry, state.uid,
+                company_id=company_id,
+                chart_template_id=state.ids[spec['chart_template']],
+                code_digits=spec.get('code_digits'),
+                context=state.context.copy(),
+            )
+            state.configured.add(key)
+
+    calls = ['account.installer.get_unconfigured_cmp()']
+    calls += ['wizard.multi.charts.accounts.execute()  # %s <- %s, if unconfigured'
+              % (spec['company'], spec['chart_template']) for spec in charted.values()]
+    return PlanStep('charts', 'Install %d chart(s) of accounts' % (len(charted),), calls, action)
+
+
+def _fiscal_year_specs(spec):
+    years = spec.get('fiscal_years', True)
+    if years is True:
+        years = [date.today().year]
+    return [{
+        'name': '%d' % (year,),
+        'code': 'FY%d' % (year,),
+        'start_date': '%d-01-01' % (year,),
+        'end_date': '%d-12-31' % (year,),
+    } for year in years]
+
+
+def _fiscal_years_step(fiscal):
+    def action(state):
+        for key, spec in fiscal.items():
+            if key not in state.configured:
+                continue
+            for fy in _fiscal_year_specs(spec):
+                create_fiscal_year(state.cr, state.registry, state.uid,
+                    company_id=state.ids[spec['company']],
+                    context=state.context.copy(),
+                    **fy
+                )
+
+    calls = ['account.fiscalyear.create(%s %s) + create_period()  # if chart was installed'
+             % (spec['company'], fy['code'])
+             for spec in fiscal.values() for fy in _fiscal_year_specs(spec)]
+    return PlanStep('fiscal_years', 'Create fiscal years and periods', calls, action)
+
+
+def _lookups_step(companies, tax_codes, account_codes):
+    def action(state):
+        for key, codes in tax_codes.items():
+            state.tax_ids[key] = state.lookup.exactly_one_ids('account.tax', 'description', codes,
+                extra_domain=[('company_id', '=', state.ids[companies[key]['company']])],
+            )
+        for key, codes in account_codes.items():
+            state.account_ids[key] = state.lookup.account_ids(
+                state.record(companies[key]['company']), codes,
+            )
+
+    calls = ["account.tax.search_read([('company_id', '=', %s), ('description', 'in', %r)])"
+             % (companies[key]['company'], codes) for key, codes in tax_codes.items()]
+    calls += ["account.account.search_read([('company_id', '=', %s), ('code', 'in', %r)])"
+              % (companies[key]['company'], codes) for key, codes in account_codes.items()]
+    return PlanStep('lookups', 'Look up tax and account codes', calls, action)
+
+
+def _settings_step(companies, general_settings):
+    def action(state):
+        with SettingsBatch(state.cr, state.registry, state.uid, context=state.context.copy()) as batch:
+            for key, spec in companies.items():
+                changes = {}
+                if key in state.tax_ids:
+                    taxes = spec['default_taxes']
+                    changes['default_sale_tax'] = state.tax_ids[key][taxes['sale']]
+                    changes['default_purchase_tax'] = state.tax_ids[key][taxes['purchase']]
+                if key in state.account_ids:
+                    currency = spec['multi_currency']
+                    changes.update({
+                        'group_multi_currency': True,
+                        'income_currency_exchange_account_id': state.account_ids[key][currency['gain']],
+                        'expense_currency_exchange_account_id': state.account_ids[key][currency['loss']],
+                    })
+                if changes:
+                    set_account_settings(state.cr, state.registry, state.uid,
+                        changes=changes,
+                        company=state.record(spec['company']),
+                        batch=batch,
+                    )
+            if general_settings:
+                set_general_settings(state.cr, state.registry, state.uid,
+                    changes=general_settings,
+                    batch=batch,
+                )
+
+    calls = ['account.config.settings.execute()  # %s' % (spec['company'],)
+             for spec in companies.values()
+             if spec.get('default_taxes') or spec.get('multi_currency')]
+    if general_settings:
+        calls.append('base.config.settings.execute()  # %s' % (', '.join(sorted(general_settings)),))
+    return PlanStep('settings', 'Apply settings, one execute() per settings record', calls, action)
+
+
+def _pricelists_step(pricelists):
+    def action(state):
+        for spec in pricelists.values():
+            set_default_customer_sale_pricelist(state.cr, state.registry, state.uid,
+                company=state.record(spec['company']),
+                pricelist=state.record(spec['sale_pricelist']),
+                context=state.context.copy(),
+            )
+
+    calls = ['ir.property unlink/create property_product_pricelist  # %s <- %s'
+             % (spec['company'], spec['sale_pricelist']) for spec in pricelists.values()]
+    return PlanStep('properties', 'Set default customer pricelists', calls, action)
+
+
+def _users_step(users):
+    with_levels = [spec for spec in users if spec.get('levels')]
+    with_rights = [spec for spec in users if spec.get('access_rights')]
+
+    def action(state):
+        if with_levels:
+            select_users_levels(state.cr, state.registry, state.uid,
+                [(state.record(spec['user']), spec['levels']) for spec in with_levels],
+                context=state.context.copy(),
+            )
+        if with_rights:
+            set_users_access_rights(state.cr, state.registry, state.uid,
+                [(state.record(spec['user']), [tuple(change) for change in spec['access_rights']])
+                 for spec in with_rights],
+                context=state.context.copy(),
+            )
+
+    calls = []
+    if with_levels:
+        calls.append('res.groups.search_read() + res.users.write() per distinct change  # levels for %d user(s)'
+                     % (len(with_levels),))
+    if with_rights:
+        calls.append('res.groups.search_read() + res.users.write() per distinct change  # access rights for %d user(s)'
+                     % (len(with_rights),))
+    return PlanStep('users', 'Set user levels and access rights', calls, action)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile and run a confutil configuration plan.')
+    parser.add_argument('plan', help='JSON plan file')
+    parser.add_argument('--dry-run', action='store_true',
+        help="Print the steps and calls the plan would make, then stop")
+    parser.add_argument('--database', help='Database to apply the plan to')
+    args = parser.parse_args(argv)
+
+    compiled = compile_plan(load_plan(args.plan))
+    if args.dry_run:
+        print(compiled.describe())
+        return 0
+    if not args.database:
+        parser.error('--database is required unless --dry-run is given')
+
+    def hook(cr, registry):
+        compiled.execute(cr, registry, SUPERUSER_ID)
+
+    from .runner import provision_databases
+    report = provision_databases([args.database], hook, max_workers=1)
+    print(report.summary())
+    return 0 if not report.failed() else 1
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
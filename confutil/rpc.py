@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Run Lookup and the helpers against Odoo over XML-RPC.
+
+    connection = RpcConnection('http://localhost:8069', 'mydb', 'admin', 'admin')
+    cr, registry = connection.cursor(), connection.registry()
+    lookup = Lookup(cr, registry, connection.uid, context={})
+    set_general_settings(cr, registry, connection.uid, changes={...}, context={})
+
+registry[model] gives an object with the old-style method signatures the
+helpers use (the cr and uid arguments are ignored; calls are made as the
+logged-in user).  Connections are kept alive and pooled.
+
+Independent calls can be sent together:
+
+    tax_ids, account_ids = connection.multicall([
+        ('account.tax', 'search', [[('description', '=', 'ST11')]], {}),
+        ('account.account', 'search', [[('code', '=', '7700')]], {}),
+    ])
+
+This uses system.multicall when the server offers it (Odoo itself
+doesn't, but proxies and stand-in servers may), and otherwise sends the
+calls concurrently over the pooled connections.  A deferred Lookup
+resolves its pending lookups this way.
+
+Models only have the methods the server has, but there's no asking the
+server which those are, so hasattr() is true for any public name.
+
+Every call is its own transaction on the server, and raw SQL isn't
+available, so cr.execute() raises NotImplementedError and the SQL fast
+paths in confutil are never used.
+"""
+
+from multiprocessing.pool import ThreadPool
+import Queue
+import threading
+import xmlrpclib
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class RpcCursor(object):
+    """Stands in for a database cursor when running over RPC.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.dbname = connection.db
+
+    def execute(self, query, params=None, log_exceptions=None):
+        raise NotImplementedError('SQL is not available over RPC')
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RpcConnection(object):
+    """A logged-in XML-RPC connection pool for one database.
+
+    url: Base URL of the server, e.g. 'http://localhost:8069'
+    pool_size: Number of keep-alive HTTP connections to keep open
+    use_multicall: True or False to force system.multicall on or off;
+                   None to ask the server whether it has it.
+    """
+    def __init__(self, url, db, login, password, pool_size=4, use_multicall=None):
+        self.url = url.rstrip('/')
+        self.db = db
+        self.password = password
+        self.pool_size = pool_size
+        self._pool = Queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._threads = None
+        common = xmlrpclib.ServerProxy(self.url + '/xmlrpc/2/common', allow_none=True)
+        self.uid = common.login(db, login, password)
+        if not self.uid:
+            raise ValueError('Login to %s as %s failed' % (db, login))
+        if use_multicall is None:
+            use_multicall = self._has_multicall()
+        self.use_multicall = use_multicall
+
+    def _has_multicall(self):
+        with self._proxy() as proxy:
+            try:
+                return 'system.multicall' in proxy.system.listMethods()
+            except (xmlrpclib.Fault, xmlrpclib.ProtocolError):
+                return False
+
+    def _proxy(self):
+        return _PooledProxy(self)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except Queue.Empty:
+            with self._lock:
+                if self._created < self.pool_size:
+                    self._created += 1
+                    return xmlrpclib.ServerProxy(self.url + '/xmlrpc/2/object', allow_none=True)
+            return self._pool.get()
+
+    def _release(self, proxy):
+        self._pool.put(proxy)
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        """Call model.method(*args, **kwargs) on the server and return the result.
+        """
+        with self._proxy() as proxy:
+            return proxy.execute_kw(self.db, self.uid, self.password, model, method, args, kwargs or {})
+
+    def multicall(self, calls):
+        """Make several independent calls, returning their results in order.
+
+        calls: List of (model, method, args, kwargs)
+
+        If any call fails, the first failure is raised after all have run.
+        """
+        outcomes = self.multicall_outcomes(calls)
+        for ok, value in outcomes:
+            if not ok:
+                raise value
+        return [value for _ok, value in outcomes]
+
+    def multicall_outcomes(self, calls):
+        """Like multicall(), but return list of (True, result) or (False,
+        exception) for each call rather than raising.
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+        if self.use_multicall:
+            with self._proxy() as proxy:
+                batch = xmlrpclib.MultiCall(proxy)
+                for model, method, args, kwargs in calls:
+                    batch.execute_kw(self.db, self.uid, self.password, model, method, args, kwargs or {})
+                results = batch()
+            outcomes = []
+            for position in range(len(calls)):
+                try:
+                    outcomes.append((True, results[position]))
+                except xmlrpclib.Fault as fault:
+                    outcomes.append((False, fault))
+            return outcomes
+        if self._threads is None:
+            self._threads = ThreadPool(self.pool_size)
+        return self._threads.map(self._attempt, calls)
+
+    def _attempt(self, call):
+        model, method, args, kwargs = call
+        try:
+            return True, self.execute_kw(model, method, args, kwargs)
+        except Exception as exc:
+            return False, exc
+
+    def cursor(self):
+        return RpcCursor(self)
+
+    def registry(self):
+        return RpcRegistry(self)
+
+    def close(self):
+        if self._threads is not None:
+            self._threads.close()
+            self._threads = None
+
+
+class _PooledProxy(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.proxy = self.connection._acquire()
+        return self.proxy
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection._release(self.proxy)
+        return False
+
+
+class RpcRegistry(object):
+    """Registry look-alike whose models call the server.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self._models = {}
+
+    def __getitem__(self, model_name):
+        if model_name not in self._models:
+            self._models[model_name] = RpcModel(self.connection, model_name)
+        return self._models[model_name]
+
+    def __contains__(self, model_name):
+        return bool(self.connection.execute_kw('ir.model', 'search_count', [[('model', '=', model_name)]]))
+
+    def multicall_outcomes(self, calls):
+        return self.connection.multicall_outcomes(calls)
+
+
+class RpcModel(object):
+    """Model look-alike.  model.method(cr, uid, *args, **kwargs) runs on the server.
+    """
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+        self._fields = None
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        connection = self._connection
+        model_name = self._name
+
+        def call(cr, uid, *args, **kwargs):
+            return connection.execute_kw(model_name, method, list(args), kwargs)
+        call.__name__ = method
+        return call
+
+    def browse(self, cr, uid, ids, context=None):
+        if isinstance(ids, (list, tuple)):
+            return [RpcRecord(self, record_id) for record_id in ids]
+        return RpcRecord(self, ids)
+
+    def get_object(self, cr, uid, module, xml_id, context=None):
+        """ir.model.data.get_object() returns a browse record, which can't
+        be sent over RPC, so build one from get_object_reference().
+        """
+        model_name, res_id = self._connection.execute_kw(self._name, 'get_object_reference', [module, xml_id])
+        return RpcRegistry(self._connection)[model_name].browse(cr, uid, res_id)
+
+    def fields_info(self):
+        """Return the model's fields_get(), fetched once.
+        """
+        if self._fields is None:
+            self._fields = self._connection.execute_kw(self._name, 'fields_get', [],
+                {'attributes': ['type', 'relation', 'string']})
+        return self._fields
+
+
+class RpcRecord(object):
+    """Browse record look-alike.  Field values are read on first use.
+    """
+    def __init__(self, model, record_id):
+        self._model = model
+        self._values = None
+        self.id = record_id
+
+    @property
+    def _name(self):
+        return self._model._name
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._values is None:
+            self._values = self._model._connection.execute_kw(
+                self._model._name, 'read', [[self.id]])[0]
+        if name not in self._values:
+            raise AttributeError(name)
+        value = self._values[name]
+        field = self._model.fields_info().get(name, {})
+        if field.get('type') == 'many2one':
+            return RpcRecord(RpcRegistry(self._model._connection)[field['relation']], value[0]) if value else False
+        return value
+
+    def write(self, vals, context=None):
+        self._values = None
+        return self._model._connection.execute_kw(self._model._name, 'write', [[self.id], vals],
+            {'context': context} if context else {})
+
+    def __repr__(self):
+        return '%s(%d)' % (self._model._name, self.id)
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
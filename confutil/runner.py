@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Run the same configuration hook against many databases in parallel.
+
+The function you probably want to use is provision_databases():
+
+    def configure(cr, registry):
+        lookup = Lookup(cr, registry, SUPERUSER_ID, context={})
+        ...
+
+    report = provision_databases(['tenant1', 'tenant2'], configure,
+        max_workers=4, timeout=600,
+    )
+    _logger.info(report.summary())
+
+Each database gets its own worker process with its own registry and
+cursor.  The hook's work is committed if it returns normally, and rolled
+back if it raises or runs out of time.
+"""
+
+from collections import namedtuple
+import multiprocessing
+import time
+import traceback
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class DatabaseResult(namedtuple('DatabaseResult', 'db_name status seconds error result')):
+    """Outcome of running a hook against one database.
+
+    status: 'ok', 'error' or 'timeout'
+    seconds: Wall time taken, as seen by the runner
+    error: Formatted traceback or message if status isn't 'ok', else None
+    result: Whatever the hook returned, if status is 'ok'
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+
+class ProvisioningReport(object):
+    """Aggregated results of provision_databases().
+    """
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+
+    def failed(self):
+        """Return list of DatabaseResult for the databases that didn't succeed.
+        """
+        return [result for result in self.results if not result.ok]
+
+    def by_database(self):
+        return dict((result.db_name, result) for result in self.results)
+
+    def summary(self):
+        """Return a short human-readable description of the run.
+        """
+        lines = ['%d database(s) in %.1fs, %d failed' % (
+            len(self.results), self.seconds, len(self.failed()),
+        )]
+        for result in self.results:
+            lines.append('  %-30s %-8s %8.2fs' % (result.db_name, result.status, result.seconds))
+        return '\n'.join(lines)
+
+
+def odoo_registry(db_name):
+    """Return the Odoo registry for db_name.  The default registry_factory.
+    """
+    import openerp
+    return openerp.modules.registry.RegistryManager.get(db_name)
+
+
+def provision_databases(db_names, hook, max_workers=4, timeout=None, registry_factory=None, poll_interval=0.05):
+    """Run hook(cr, registry) once for each database, in parallel processes.
+
+    db_names: Names of the databases to configure
+    hook: Callable taking (cr, registry).  Its return value must be picklable.
+    max_workers: Maximum number of databases configured at the same time
+    timeout: Seconds to allow each database before killing its worker,
+             or None for no limit
+    registry_factory: Callable taking a database name and returning a
+                      registry with a cursor() method.
+                      Defaults to the real Odoo registry.
+
+    Returns a ProvisioningReport, with results in the same order as db_names.
+
+    Workers are forked, so call this before opening any cursors of your own.
+    """
+    registry_factory = registry_factory or odoo_registry
+    started = time.time()
+    pending = list(db_names)
+    running = {}
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < max_workers:
+            db_name = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(db_name, hook, registry_factory, sender),
+                name='confutil-%s' % (db_name,),
+            )
+            process.start()
+            sender.close()
+            running[db_name] = (process, receiver, time.time())
+
+        for db_name, (process, receiver, db_started) in list(running.items()):
+            elapsed = time.time() - db_started
+            # Check liveness first: a worker that has exited has already
+            # written anything it was going to send.
+            alive = process.is_alive()
+            if receiver.poll():
+                status, error, result = _receive(receiver)
+                process.join()
+            elif not alive:
+                status, error, result = 'error', 'Worker exited with code %s' % (process.exitcode,), None
+            elif timeout is not None and elapsed > timeout:
+                # Killing the worker drops its connection, so PostgreSQL rolls back
+                process.terminate()
+                process.join()
+                status, error, result = 'timeout', 'Timed out after %ss' % (timeout,), None
+            else:
+                continue
+            receiver.close()
+            del running[db_name]
+            results[db_name] = DatabaseResult(db_name, status, elapsed, error, result)
+            _logger.info('provision_databases: %s %s in %.2fs' % (db_name, status, elapsed))
+
+        if running:
+            time.sleep(poll_interval)
+
+    return ProvisioningReport(
+        [results[db_name] for db_name in db_names],
+        time.time() - started,
+    )
+
+
+def _receive(receiver):
+    try:
+        return receiver.recv()
+    except EOFError:
+        return 'error', 'Worker exited without reporting', None
+
+
+def _worker(db_name, hook, registry_factory, sender):
+    try:
+        registry = registry_factory(db_name)
+        cr = registry.cursor()
+        try:
+            result = hook(cr, registry)
+            cr.commit()
+        except Exception:
+            cr.rollback()
+            raise
+        finally:
+            cr.close()
+        outcome = ('ok', None, result)
+    except Exception:
+        outcome = ('error', traceback.format_exc(), None)
+    try:
+        sender.send(outcome)
+    except Exception:
+        # The hook's result couldn't be pickled, but the work was done
+        sender.send(('ok', None, None) if outcome[0] == 'ok' else outcome)
+    sender.close()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
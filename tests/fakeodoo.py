@@ -0,0 +1,681 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""An in-memory stand-in for an Odoo registry and cursor.
+
+This is just enough of the old-style ORM API (search, search_read, read,
+create, write, unlink, default_get, fields_get, browse, execute and the
+few model-specific methods confutil calls) for the helpers to run
+without a server, so their round trips can be counted and timed.
+
+    registry = make_registry(latency=0.001)
+    cr = FakeCursor()
+    company_id = registry['res.company'].create(cr, 1, {'name': 'Acme'})
+
+Every public model method call counts as one round trip on the registry
+(registry.round_trips) and sleeps for latency seconds, to stand in for
+the trip to PostgreSQL.
+"""
+
+from collections import Counter, defaultdict
+from datetime import date
+import time
+
+from confutil.account_setup import period_rows
+
+
+class FakeCursor(object):
+    """A cursor that records SQL but has no data.
+    """
+    def __init__(self, dbname='fake'):
+        self.dbname = dbname
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def execute(self, query, params=None, log_exceptions=None):
+        self.queries.append((query, params))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+class FakeRecord(object):
+    """A browse record.  Reads are free; only writes count as round trips.
+    """
+    def __init__(self, model, record_id):
+        self._model = model
+        self._name = model._name
+        self.id = record_id
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        values = self._model._records[self.id]
+        if name not in values:
+            raise AttributeError(name)
+        value = values[name]
+        comodel_name = self._model._many2one.get(name)
+        if comodel_name and value:
+            return FakeRecord(self._model._registry[comodel_name], value)
+        return value
+
+    def write(self, vals, context=None):
+        return self._model.write(None, None, [self.id], vals, context=context)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRecord) and (self._model._name, self.id) == (other._model._name, other.id)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._model._name, self.id))
+
+    def __repr__(self):
+        return '%s(%d)' % (self._model._name, self.id)
+
+
+class FakeColumn(object):
+    """Just enough of an osv.fields column to tell its type and comodel.
+    """
+    def __init__(self, field_type, comodel=None):
+        self._type = field_type
+        self._obj = comodel
+        self._classic_write = field_type not in ('one2many', 'many2many')
+
+
+def _round_trip(method):
+    def wrapper(self, *args, **kwargs):
+        self._registry._count(self._name, method.__name__)
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class FakeModel(object):
+    """In-memory model.
+
+    name: Model name, e.g. 'account.account'
+    many2one: Dictionary of field name: comodel name, used for dotted
+              domain paths and for (id, name) pairs from search_read()
+    defaults: Dictionary of field name: default value for default_get()
+    field_strings: Dictionary of field name: label for fields_get()
+    columns: Dictionary of field name: (type, comodel name or None), giving
+             the model _columns for code that inspects them
+    """
+    def __init__(self, registry, name, many2one=None, defaults=None, field_strings=None, columns=None):
+        self._registry = registry
+        self._name = name
+        self._table = name.replace('.', '_')
+        self._many2one = dict(many2one or {})
+        self._defaults = dict(defaults or {})
+        self._field_strings = dict(field_strings or {})
+        self._columns = dict((field, FakeColumn(*spec)) for field, spec in (columns or {}).items())
+        self._records = {}
+        # field -> value -> set of ids, built on demand for '=' and 'in' leaves
+        self._indexes = {}
+
+    # -- plumbing --------------------------------------------------------
+
+    def _insert(self, vals):
+        record_id = self._registry._next_id()
+        values = dict(self._defaults)
+        values.update(vals)
+        values['id'] = record_id
+        self._records[record_id] = values
+        self._reindex(record_id, None, values)
+        return record_id
+
+    def _reindex(self, record_id, old_values, new_values):
+        for field, index in self._indexes.items():
+            if old_values is not None:
+                index[_hashable(old_values.get(field, False))].discard(record_id)
+            if new_values is not None:
+                index[_hashable(new_values.get(field, False))].add(record_id)
+
+    def _index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            index = defaultdict(set)
+            for record_id, values in self._records.items():
+                index[_hashable(values.get(field, False))].add(record_id)
+            self._indexes[field] = index
+        return index
+
+    def _value(self, values, path):
+        field, _dot, rest = path.partition('.')
+        value = values.get(field, False)
+        if not rest:
+            return value
+        comodel_name = self._many2one.get(field)
+        if not comodel_name or not value:
+            return False
+        comodel = self._registry[comodel_name]
+        return comodel._value(comodel._records.get(value, {}), rest)
+
+    def _candidates(self, domain):
+        """Narrow the records to scan using an index on a top-level equality leaf.
+        """
+        if any(not isinstance(leaf, (list, tuple)) for leaf in domain):
+            return self._records.keys()
+        for field, operator, value in domain:
+            if '.' in field:
+                continue
+            if operator == '=':
+                return self._index(field).get(_hashable(value), ())
+            if operator == 'in':
+                index = self._index(field)
+                ids = set()
+                for item in value:
+                    ids |= index.get(_hashable(item), set())
+                return ids
+        return self._records.keys()
+
+    def _search_ids(self, domain):
+        domain = list(domain or [])
+        if 'active' in self._defaults and not any(
+                isinstance(leaf, (list, tuple)) and leaf[0] == 'active' for leaf in domain):
+            domain.append(('active', '=', True))
+        return sorted(
+            record_id for record_id in self._candidates(domain)
+            if _evaluate(domain, lambda path: self._value(self._records[record_id], path))
+        )
+
+    def _read_values(self, record_id, fields):
+        values = self._records[record_id]
+        fields = fields or [f for f in values if f != 'id']
+        result = {'id': record_id}
+        for field in fields:
+            value = values.get(field, False)
+            comodel_name = self._many2one.get(field)
+            if comodel_name and value:
+                comodel = self._registry[comodel_name]
+                value = (value, comodel._records.get(value, {}).get('name', ''))
+            result[field] = value
+        return result
+
+    # -- ORM API ---------------------------------------------------------
+
+    @_round_trip
+    def search(self, cr, uid, domain, offset=0, limit=None, order=None, context=None, count=False):
+        ids = self._search_ids(domain)[offset:]
+        if limit:
+            ids = ids[:limit]
+        return len(ids) if count else ids
+
+    @_round_trip
+    def search_read(self, cr, uid, domain=None, fields=None, offset=0, limit=None, order=None, context=None):
+        ids = self._search_ids(domain)[offset:]
+        if limit:
+            ids = ids[:limit]
+        return [self._read_values(record_id, fields) for record_id in ids]
+
+    @_round_trip
+    def read(self, cr, uid, ids, fields=None, context=None):
+        return [self._read_values(record_id, fields) for record_id in _ids(ids)]
+
+    @_round_trip
+    def create(self, cr, uid, vals, context=None):
+        return self._insert(vals)
+
+    @_round_trip
+    def write(self, cr, uid, ids, vals, context=None):
+        for record_id in _ids(ids):
+            old_values = dict(self._records[record_id])
+            self._records[record_id].update(vals)
+            self._reindex(record_id, old_values, self._records[record_id])
+        return True
+
+    @_round_trip
+    def unlink(self, cr, uid, ids, context=None):
+        for record_id in _ids(ids):
+            self._reindex(record_id, self._records.pop(record_id, None), None)
+        return True
+
+    @_round_trip
+    def default_get(self, cr, uid, fields_list, context=None):
+        return dict((field, self._defaults[field]) for field in fields_list if field in self._defaults)
+
+    @_round_trip
+    def fields_get(self, cr, uid, allfields=None, context=None, write_access=True, attributes=None):
+        names = set(self._defaults) | set(self._field_strings) | set(self._many2one) | set(self._columns)
+        result = {}
+        for name in names:
+            if allfields and name not in allfields:
+                continue
+            info = {'string': self._field_strings.get(name, name)}
+            if name in self._columns:
+                info['type'] = self._columns[name]._type
+                if self._columns[name]._obj:
+                    info['relation'] = self._columns[name]._obj
+            if name in self._many2one:
+                info.update(type='many2one', relation=self._many2one[name])
+            if attributes:
+                info = dict((key, value) for key, value in info.items() if key in attributes)
+            result[name] = info
+        return result
+
+    def browse(self, cr, uid, ids, context=None):
+        if isinstance(ids, (list, tuple)):
+            return [FakeRecord(self, record_id) for record_id in ids]
+        return FakeRecord(self, ids)
+
+
+class FakeSettingsModel(FakeModel):
+    """A *.config.settings model.  execute() copies its values to 'applied',
+    and to 'applied_by_company' under the record's company_id.
+
+    Like Odoo's res.config.settings, default_get() returns every default,
+    not only those in fields_list.
+    """
+    def __init__(self, *args, **kwargs):
+        super(FakeSettingsModel, self).__init__(*args, **kwargs)
+        self.applied = {}
+        self.applied_by_company = {}
+
+    @_round_trip
+    def default_get(self, cr, uid, fields_list, context=None):
+        result = dict(self._defaults)
+        result.update(self.applied)
+        return result
+
+    @_round_trip
+    def execute(self, cr, uid, ids, context=None):
+        for record_id in _ids(ids):
+            values = dict(self._records[record_id])
+            values.pop('id')
+            self.applied.update(values)
+            if values.get('company_id'):
+                self.applied_by_company.setdefault(values['company_id'], {}).update(values)
+        return True
+
+    @_round_trip
+    def onchange_company_id(self, cr, uid, ids, company_id, context=None):
+        values = dict(self.applied_by_company.get(company_id, {}))
+        values.pop('company_id', None)
+        return {'value': values}
+
+
+class FakeIrModelData(FakeModel):
+    @_round_trip
+    def get_object_reference(self, cr, uid, module, xml_id):
+        ids = self._search_ids([('module', '=', module), ('name', '=', xml_id)])
+        if not ids:
+            raise ValueError('External ID not found in the system: %s.%s' % (module, xml_id))
+        values = self._records[ids[0]]
+        return values['model'], values['res_id']
+
+    @_round_trip
+    def get_object(self, cr, uid, module, xml_id, context=None):
+        ids = self._search_ids([('module', '=', module), ('name', '=', xml_id)])
+        if not ids:
+            raise ValueError('External ID not found in the system: %s.%s' % (module, xml_id))
+        values = self._records[ids[0]]
+        return self._registry[values['model']].browse(cr, uid, values['res_id'])
+
+
+class FakeIrValues(FakeModel):
+    @_round_trip
+    def set_default(self, cr, uid, model, field_name, value, for_all_users=True, company_id=False, condition=False):
+        existing = self._search_ids([
+            ('model', '=', model), ('name', '=', field_name), ('company_id', '=', company_id),
+        ])
+        for record_id in existing:
+            self._reindex(record_id, self._records.pop(record_id), None)
+        return self._insert({
+            'key': 'default',
+            'model': model,
+            'name': field_name,
+            'company_id': company_id,
+            'value': value,
+        })
+
+
+class FakeAccountInstaller(FakeModel):
+    @_round_trip
+    def get_unconfigured_cmp(self, cr, uid, context=None):
+        accounts = self._registry['account.account']
+        configured = set(values.get('company_id') for values in accounts._records.values())
+        return [company_id for company_id in sorted(self._registry['res.company']._records)
+                if company_id not in configured]
+
+
+class FakeChartWizard(FakeModel):
+    """Installs a chart by copying the template's account codes and taxes
+    to the company.
+
+    Like the real wizard it also writes the currency and code digits to
+    the company, and makes the template's first sale and purchase taxes
+    the company's default product taxes.  Template taxes are dictionaries
+    of description, name, type_tax_use and optionally account_code.
+    Template properties map (model name, field name) to an account code,
+    set as the company's default property.
+    """
+    @_round_trip
+    def onchange_chart_template_id(self, cr, uid, ids, chart_template_id=False, context=None):
+        return {'value': {'code_digits': 6}}
+
+    @_round_trip
+    def execute(self, cr, uid, ids, context=None):
+        accounts = self._registry['account.account']
+        for record_id in _ids(ids):
+            wizard = self._records[record_id]
+            template = self._registry['account.chart.template']._records[wizard['chart_template_id']]
+            account_ids = {}
+            for code in template.get('account_codes', []):
+                account_ids[code] = accounts.create(cr, uid, {
+                    'company_id': wizard['company_id'],
+                    'code': code,
+                    'name': 'Account %s' % (code,),
+                    'type': 'other',
+                })
+            defaults = {}
+            for tax in template.get('taxes', []):
+                tax_id = self._registry['account.tax'].create(cr, uid, {
+                    'company_id': wizard['company_id'],
+                    'description': tax['description'],
+                    'name': tax['name'],
+                    'type_tax_use': tax['type_tax_use'],
+                    'account_collected_id': account_ids.get(tax.get('account_code'), False),
+                })
+                field_name = {'sale': 'taxes_id', 'purchase': 'supplier_taxes_id'}.get(tax['type_tax_use'])
+                defaults.setdefault(field_name, tax_id)
+            for field_name, tax_id in defaults.items():
+                if field_name:
+                    self._registry['ir.values'].set_default(cr, uid, 'product.template', field_name, [tax_id],
+                        company_id=wizard['company_id'])
+            fields = self._registry['ir.model.fields']
+            for (model_name, field_name), code in sorted(template.get('properties', {}).items()):
+                field_id = fields._search_ids([('model', '=', model_name), ('name', '=', field_name)])[0]
+                self._registry['ir.property'].create(cr, uid, {
+                    'name': field_name,
+                    'company_id': wizard['company_id'],
+                    'fields_id': field_id,
+                    'res_id': False,
+                    'type': 'many2one',
+                    'value_reference': 'account.account,%d' % (account_ids[code],),
+                })
+            self._registry['res.company'].write(cr, uid, [wizard['company_id']], {
+                'currency_id': wizard.get('currency_id', False),
+                'accounts_code_digits': wizard.get('code_digits'),
+            })
+        return True
+
+
+class FakeFiscalYear(FakeModel):
+    @_round_trip
+    def create_period(self, cr, uid, ids, context=None, interval=1):
+        periods = self._registry['account.period']
+        for record_id in _ids(ids):
+            fy = self._records[record_id]
+            for row in period_rows(record_id, fy.get('company_id'),
+                                   _parse_date(fy['date_start']), _parse_date(fy['date_stop']),
+                                   interval):
+                periods.create(cr, uid, row)
+        return True
+
+
+class FakeRegistry(object):
+    """Dictionary-like registry of FakeModels sharing one id sequence.
+
+    round_trips: Total model method calls
+    calls: Counter of (model name, method name)
+    latency: Seconds to sleep on every model method call
+    """
+    def __init__(self, latency=0.0, db_name='fake'):
+        self.latency = latency
+        self.db_name = db_name
+        self.round_trips = 0
+        self.calls = Counter()
+        self.models = {}
+        self._last_id = 0
+
+    def add(self, name, model_class=FakeModel, **kwargs):
+        self.models[name] = model_class(self, name, **kwargs)
+        return self.models[name]
+
+    def __getitem__(self, name):
+        try:
+            return self.models[name]
+        except KeyError:
+            raise KeyError('Model %s does not exist in the fake registry' % (name,))
+
+    def __contains__(self, name):
+        return name in self.models
+
+    def cursor(self):
+        return FakeCursor(self.db_name)
+
+    def reset_counters(self):
+        self.round_trips = 0
+        self.calls = Counter()
+
+    def _count(self, model_name, method_name):
+        self.round_trips += 1
+        self.calls[model_name, method_name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _next_id(self):
+        self._last_id += 1
+        return self._last_id
+
+
+def make_registry(latency=0.0, db_name='fake'):
+    """Return a FakeRegistry with the models confutil uses.
+    """
+    registry = FakeRegistry(latency=latency, db_name=db_name)
+    registry.add('res.currency')
+    registry.add('res.company', field_strings={'name': 'Company Name'}, many2one={'currency_id': 'res.currency'})
+    registry.add('res.partner', many2one={'company_id': 'res.company'})
+    registry.add('res.users', many2one={'company_id': 'res.company'})
+    registry.add('ir.module.category')
+    registry.add('res.groups', many2one={'category_id': 'ir.module.category'})
+    registry.add('ir.model.data', FakeIrModelData)
+    registry.add('ir.model.fields')
+    registry.add('ir.property', many2one={'company_id': 'res.company', 'fields_id': 'ir.model.fields'})
+    registry.add('ir.config_parameter')
+    registry.add('ir.module.module')
+    registry.add('ir.values', FakeIrValues, many2one={'company_id': 'res.company'})
+    registry.add('product.pricelist', many2one={'company_id': 'res.company'})
+    registry.add('account.account.type')
+    registry.add('account.account', many2one={'company_id': 'res.company', 'user_type': 'account.account.type'},
+                 defaults={'active': True},
+                 columns={
+                     'code': ('char',), 'name': ('char',), 'type': ('selection',),
+                     'company_id': ('many2one', 'res.company'),
+                     'user_type': ('many2one', 'account.account.type'),
+                 })
+    registry.add('account.tax', many2one={'company_id': 'res.company', 'account_collected_id': 'account.account'},
+                 defaults={'active': True},
+                 columns={
+                     'description': ('char',), 'name': ('char',), 'type_tax_use': ('selection',),
+                     'company_id': ('many2one', 'res.company'),
+                     'account_collected_id': ('many2one', 'account.account'),
+                 })
+    registry.add('account.chart.template')
+    registry.add('account.installer', FakeAccountInstaller)
+    registry.add('wizard.multi.charts.accounts', FakeChartWizard,
+                 defaults={'bank_accounts_id': [], 'currency_id': False})
+    registry.add('account.fiscalyear', FakeFiscalYear, many2one={'company_id': 'res.company'},
+                 defaults={'state': 'draft', 'company_id': False})
+    registry.add('account.period', many2one={'company_id': 'res.company', 'fiscalyear_id': 'account.fiscalyear'})
+    for settings, module_field in [
+            ('account.config.settings', 'module_account_accountant'),
+            ('base.config.settings', 'module_multi_company'),
+            ('purchase.config.settings', 'module_purchase_requisition'),
+            ('sale.config.settings', 'module_sale_margin'),
+            ('stock.config.settings', 'module_stock_dropshipping')]:
+        registry.add(settings, FakeSettingsModel, many2one={'company_id': 'res.company'},
+                     defaults={module_field: False})
+    return registry
+
+
+def serve_registry(registry, host='127.0.0.1', port=0, multicall=True, login='admin', password='admin'):
+    """Serve registry over XML-RPC the way Odoo does, in a background thread.
+
+    Answers /xmlrpc/2/common login() and /xmlrpc/2/object execute_kw(),
+    and system.multicall if multicall is set.  Returns the server;
+    its URL is 'http://%s:%d' % server.server_address.  Call
+    server.shutdown() when finished.
+    """
+    from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    import threading
+
+    class Handler(SimpleXMLRPCRequestHandler):
+        rpc_paths = ('/xmlrpc/2/common', '/xmlrpc/2/object')
+
+    server = SimpleXMLRPCServer((host, port), requestHandler=Handler, allow_none=True, logRequests=False)
+    cr = registry.cursor()
+
+    def do_login(db, user, secret):
+        return 1 if (user, secret) == (login, password) else False
+
+    def execute_kw(db, uid, secret, model, method, args, kwargs=None):
+        if secret != password:
+            raise ValueError('Access denied')
+        return getattr(registry[model], method)(cr, uid, *args, **(kwargs or {}))
+
+    server.register_function(do_login, 'login')
+    server.register_function(execute_kw, 'execute_kw')
+    server.register_introspection_functions()
+    if multicall:
+        server.register_multicall_functions()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def add_user_levels(registry, categories):
+    """Create groups for categories and matching sel_groups_ fields on res.users.
+
+    categories: Dictionary of category name: list of group names
+
+    Returns dictionary of (category, group): group id.
+    """
+    group_ids = {}
+    users = registry['res.users']
+    for category, groups in sorted(categories.items()):
+        category_id = registry['ir.module.category']._insert({'name': category})
+        ids = []
+        for group in groups:
+            group_ids[category, group] = registry['res.groups']._insert({
+                'name': group,
+                'category_id': category_id,
+            })
+            ids.append(group_ids[category, group])
+        field = 'sel_groups_' + '_'.join('%d' % (i,) for i in ids)
+        users._field_strings[field] = category
+    return group_ids
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _ids(ids):
+    return ids if isinstance(ids, (list, tuple)) else [ids]
+
+
+def _parse_date(value):
+    return date(*map(int, value.split('-')))
+
+
+def _compare(operator, left, right):
+    if operator == '=':
+        return left == right
+    if operator == '!=':
+        return left != right
+    if operator == 'in':
+        return left in right
+    if operator == 'not in':
+        return left not in right
+    if operator in ('like', 'ilike', '=like', '=ilike'):
+        left, right = '%s' % (left or '',), '%s' % (right,)
+        if operator.endswith('ilike'):
+            left, right = left.lower(), right.lower()
+        if operator.startswith('='):
+            pattern = right
+        else:
+            pattern = '%' + right + '%'
+        return _like(left, pattern)
+    if left is False or left is None:
+        return False
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    if operator == '>':
+        return left > right
+    if operator == '>=':
+        return left >= right
+    raise ValueError('Unsupported operator %r' % (operator,))
+
+
+def _like(text, pattern):
+    parts = pattern.split('%')
+    if len(parts) == 1:
+        return text == pattern
+    if not text.startswith(parts[0]) or not text.endswith(parts[-1]):
+        return False
+    position = len(parts[0])
+    for part in parts[1:-1]:
+        found = text.find(part, position)
+        if found < 0:
+            return False
+        position = found + len(part)
+    return position <= len(text) - len(parts[-1])
+
+
+def _evaluate(domain, get_value):
+    """Evaluate a domain in Polish notation against one record.
+    """
+    stack = []
+    for leaf in reversed(domain):
+        if leaf == '!':
+            stack.append(not stack.pop())
+        elif leaf in ('&', '|'):
+            first, second = stack.pop(), stack.pop()
+            stack.append(first and second if leaf == '&' else first or second)
+        else:
+            field, operator, value = leaf
+            stack.append(_compare(operator, get_value(field), value))
+    return all(stack)
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
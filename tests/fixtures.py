@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+# Post-installation configuration helpers
+# Copyright (C) 2015 OpusVL (<http://opusvl.com/>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""The Dataset the tests and benchmarks run against.
+"""
+
+from collections import OrderedDict
+
+from confutil import confutil
+from tests.fakeodoo import make_registry, add_user_levels
+
+UID = confutil.SUPERUSER_ID
+
+
+class Dataset(object):
+    """A fake registry populated with a realistic amount of configuration data.
+    """
+    ACCOUNTS_PER_COMPANY = 50
+    LEVELS = OrderedDict([
+        ('Sales', ['See Own Leads', 'See all Leads', 'Manager']),
+        ('Accounting & Finance', ['Invoicing & Payments', 'Accountant', 'Financial Manager']),
+        ('Warehouse', ['User', 'Manager']),
+    ])
+
+    def __init__(self, companies=1000, users=500, latency=0.0):
+        self.registry = make_registry(latency=latency)
+        self.cr = self.registry.cursor()
+        self.context = {}
+        registry = self.registry
+
+        self.codes = ['%06d' % (100000 + 100 * i,) for i in range(self.ACCOUNTS_PER_COMPANY)]
+        self.chart_template_id = registry['account.chart.template']._insert({
+            'name': 'Benchmark chart', 'account_codes': self.codes,
+        })
+        self.view_type_id = registry['account.account.type']._insert({'name': 'Root/View'})
+        registry['ir.model.fields']._insert({
+            'model': 'res.partner', 'name': 'property_product_pricelist',
+            'ttype': 'many2one', 'relation': 'product.pricelist',
+        })
+        self.pricelist_id = registry['product.pricelist']._insert({'name': 'Public Pricelist'})
+
+        self.company_ids = []
+        for number in range(companies):
+            company_id = registry['res.company']._insert({'name': 'Company %d' % (number,)})
+            self.company_ids.append(company_id)
+            for code in self.codes:
+                registry['account.account']._insert({
+                    'company_id': company_id, 'code': code, 'name': 'Account %s' % (code,),
+                })
+            for code in ('ST11', 'PT11'):
+                registry['account.tax']._insert({
+                    'company_id': company_id, 'description': code, 'name': code,
+                })
+
+        self.group_ids = add_user_levels(registry, self.LEVELS)
+        self.user_ids = [
+            registry['res.users']._insert({'login': 'user%d' % (number,), 'company_id': self.company_ids[0]})
+            for number in range(users)
+        ]
+
+    def companies(self, limit=None):
+        company_ids = self.company_ids[:limit] if limit else self.company_ids
+        return [self.registry['res.company'].browse(self.cr, UID, company_id) for company_id in company_ids]
+
+    def users(self):
+        return [self.registry['res.users'].browse(self.cr, UID, user_id) for user_id in self.user_ids]
+
+    def lookup(self, **kwargs):
+        return confutil.Lookup(self.cr, self.registry, UID, context={}, **kwargs)
+
+    def new_companies(self, count):
+        """Create companies without charts of accounts, returning their records.
+        """
+        model = self.registry['res.company']
+        return [model.browse(self.cr, UID, model._insert({'name': 'New company %d' % (number,)}))
+                for number in range(count)]
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil.account_setup import create_fiscal_year, create_fiscal_years
+from tests.fixtures import Dataset, UID
+
+
+class CreateFiscalYearsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.company_id = self.data.company_ids[0]
+
+    def fiscal_years(self, company_id):
+        return self.data.registry['account.fiscalyear'].search_read(self.data.cr, UID,
+            [('company_id', '=', company_id)], fields=['date_start', 'date_stop'])
+
+    def test_repeated_year_created_once(self):
+        created = create_fiscal_years(self.data.cr, self.data.registry, UID, [self.company_id], [2015, 2015],
+            context={})
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(self.fiscal_years(self.company_id)), 1)
+
+
+    def test_existing_years_skipped(self):
+        registry, cr = self.data.registry, self.data.cr
+        create_fiscal_years(cr, registry, UID, [self.company_id], [2015], context={})
+        # A fiscal year from April overlaps both 2015 and 2016
+        create_fiscal_year(cr, registry, UID, self.data.company_ids[1], '2015/2016', 'FY2015',
+            '2015-04-01', '2016-03-31', context={})
+        created = create_fiscal_years(cr, registry, UID, self.data.company_ids, [2014, 2015, 2016, 2017],
+            context={})
+        self.assertEqual(len(created), 5)
+        self.assertEqual(sorted(fy['date_start'] for fy in self.fiscal_years(self.company_id)),
+            ['2014-01-01', '2015-01-01', '2016-01-01', '2017-01-01'])
+        self.assertEqual(sorted(fy['date_start'] for fy in self.fiscal_years(self.data.company_ids[1])),
+            ['2014-01-01', '2015-04-01', '2017-01-01'])
+        self.assertEqual(create_fiscal_years(cr, registry, UID, self.data.company_ids, [2016], context={}), [])
+
+    def test_periods(self):
+        [fy_id] = create_fiscal_years(self.data.cr, self.data.registry, UID, [self.company_id], [2015],
+            interval=3, context={})
+        periods = self.data.registry['account.period'].search_read(self.data.cr, UID,
+            [('fiscalyear_id', '=', fy_id)], fields=['code'])
+        self.assertEqual(sorted(period['code'] for period in periods),
+            ['00/2015', '01/2015', '04/2015', '07/2015', '10/2015'])
+
+    def test_use_sql(self):
+        registry, cr = self.data.registry, self.data.cr
+        del cr.queries[:]
+        created = create_fiscal_years(cr, registry, UID, self.data.company_ids, [2015, 2016],
+            use_sql=True, context={})
+        self.assertEqual(len(created), 4)
+        self.assertEqual(registry.calls[('account.fiscalyear', 'create_period')], 0)
+        [(query, params)] = cr.queries
+        self.assertTrue(query.startswith('INSERT INTO account_period '))
+        # 13 periods a year, 9 values each
+        self.assertEqual(len(params), 4 * 13 * 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
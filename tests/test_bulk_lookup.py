@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset
+
+
+class BulkLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.company = self.data.companies(limit=1)[0]
+        self.data.registry.reset_counters()
+
+    def test_account_ids_in_order_with_one_search(self):
+        codes = [self.data.codes[2], self.data.codes[0], self.data.codes[2]]
+        result = self.data.lookup().account_ids(self.company, codes)
+        self.assertEqual(list(result), [self.data.codes[2], self.data.codes[0]])
+        self.assertEqual(self.data.registry.round_trips, 1)
+        single = self.data.lookup()
+        self.assertEqual(result[self.data.codes[0]], single.account_id(self.company, self.data.codes[0]))
+
+    def test_errors_reported_together(self):
+        try:
+            self.data.lookup().account_ids(self.company, [self.data.codes[0], 'missing'])
+        except confutil.BulkLookupError as error:
+            self.assertEqual(list(error.errors), ['missing'])
+            self.assertIsInstance(error.errors['missing'], confutil.NoRecordsError)
+            self.assertEqual(list(error.results), [self.data.codes[0]])
+        else:
+            self.fail('BulkLookupError not raised')
+
+    def test_too_many_matches(self):
+        # Every company has an ST11 tax
+        try:
+            self.data.lookup().tax_ids_by_codes(['ST11'])
+        except confutil.BulkLookupError as error:
+            self.assertIsInstance(error.errors['ST11'], confutil.TooManyRecordsError)
+        else:
+            self.fail('BulkLookupError not raised')
+
+    def test_results_fill_cache(self):
+        lookup = self.data.lookup(cache_size=100)
+        ids = lookup.account_ids(self.company, self.data.codes[:3])
+        self.data.registry.reset_counters()
+        self.assertEqual(lookup.account_id(self.company, self.data.codes[1]), ids[self.data.codes[1]])
+        self.assertEqual(self.data.registry.round_trips, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil.account_setup import setup_chart_of_accounts
+from confutil.chart_snapshot import capture_chart, replay_chart, setup_charts_of_accounts
+from confutil.confutil import SUPERUSER_ID, _unpickle_default
+from tests.fakeodoo import make_registry
+
+RECEIVABLE = ('res.partner', 'property_account_receivable')
+PRICELIST = ('res.partner', 'property_product_pricelist')
+
+
+class ReplayMatchesWizardTest(unittest.TestCase):
+    """A company set up by replaying a snapshot should end up the same as
+    one set up by the wizard.
+    """
+    def setUp(self):
+        self.registry = make_registry()
+        self.cr = self.registry.cursor()
+        registry = self.registry
+        self.template_id = registry['account.chart.template']._insert({
+            'name': 'Test chart',
+            'account_codes': ['100000', '200000', '400000'],
+            'taxes': [
+                {'description': 'ST1', 'name': 'Sales 20%', 'type_tax_use': 'sale', 'account_code': '200000'},
+                {'description': 'PT1', 'name': 'Purchases 20%', 'type_tax_use': 'purchase',
+                 'account_code': '100000'},
+            ],
+            'properties': {RECEIVABLE: '400000'},
+        })
+        registry['ir.model.fields']._insert({
+            'model': RECEIVABLE[0], 'name': RECEIVABLE[1], 'ttype': 'many2one', 'relation': 'account.account',
+        })
+        registry['ir.model.fields']._insert({
+            'model': PRICELIST[0], 'name': PRICELIST[1], 'ttype': 'many2one', 'relation': 'product.pricelist',
+        })
+        registry['wizard.multi.charts.accounts']._defaults['currency_id'] = \
+            registry['res.currency']._insert({'name': 'GBP'})
+        self.reference_id, self.replayed_id, self.wizard_id = [
+            registry['res.company']._insert({'name': name}) for name in ('Reference', 'Replayed', 'Wizard')
+        ]
+
+    def configuration(self, company_id):
+        """Return everything the chart installation gave company_id, minus ids.
+        """
+        registry = self.registry
+        accounts = registry['account.account'].search_read(self.cr, SUPERUSER_ID,
+            [('company_id', '=', company_id)], fields=['code', 'name', 'type'])
+        codes = dict((account['id'], account['code']) for account in accounts)
+        taxes = registry['account.tax'].search_read(self.cr, SUPERUSER_ID,
+            [('company_id', '=', company_id)],
+            fields=['description', 'name', 'type_tax_use', 'account_collected_id'])
+        tax_codes = dict((tax['id'], tax['description']) for tax in taxes)
+        defaults = registry['ir.values'].search_read(self.cr, SUPERUSER_ID,
+            [('model', '=', 'product.template'), ('company_id', '=', company_id)],
+            fields=['name', 'value'])
+        company = registry['res.company'].read(self.cr, SUPERUSER_ID, [company_id],
+            ['currency_id', 'accounts_code_digits'])[0]
+        properties = registry['ir.property'].search_read(self.cr, SUPERUSER_ID,
+            [('company_id', '=', company_id), ('res_id', '=', False)],
+            fields=['name', 'value_reference'])
+        return {
+            'accounts': sorted((a['code'], a['name'], a['type']) for a in accounts),
+            'taxes': sorted(
+                (t['description'], t['name'], t['type_tax_use'], codes.get(_id(t['account_collected_id'])))
+                for t in taxes
+            ),
+            'product_taxes': sorted(
+                (d['name'], [tax_codes.get(tax_id) for tax_id in _unpickle_default(d['value'])])
+                for d in defaults
+            ),
+            'properties': sorted(
+                (p['name'], codes.get(int(p['value_reference'].split(',')[1]), p['value_reference']))
+                for p in properties
+            ),
+            'currency_id': _id(company['currency_id']),
+            'accounts_code_digits': company['accounts_code_digits'],
+        }
+
+    def test_replayed_company_matches_wizard(self):
+        done = setup_charts_of_accounts(self.cr, self.registry, SUPERUSER_ID,
+            [self.reference_id, self.replayed_id], self.template_id, context={})
+        self.assertEqual(done, [self.reference_id, self.replayed_id])
+        setup_chart_of_accounts(self.cr, self.registry, SUPERUSER_ID,
+            self.wizard_id, self.template_id, context={})
+
+        expected = self.configuration(self.wizard_id)
+        self.assertEqual(len(expected['product_taxes']), 2)
+        self.assertEqual(expected['properties'], [(RECEIVABLE[1], '400000')])
+        self.assertTrue(expected['currency_id'])
+        self.assertEqual(self.configuration(self.replayed_id), expected)
+
+    def test_company_pricelist_not_copied(self):
+        registry = self.registry
+        setup_chart_of_accounts(self.cr, registry, SUPERUSER_ID, self.reference_id, self.template_id, context={})
+        pricelists = registry['product.pricelist']
+        own_id = pricelists.create(self.cr, SUPERUSER_ID, {'name': 'Own', 'company_id': self.reference_id})
+        field_id = registry['ir.model.fields'].search(self.cr, SUPERUSER_ID,
+            [('model', '=', PRICELIST[0]), ('name', '=', PRICELIST[1])])[0]
+        registry['ir.property'].create(self.cr, SUPERUSER_ID, {
+            'name': PRICELIST[1], 'company_id': self.reference_id, 'fields_id': field_id, 'res_id': False,
+            'type': 'many2one', 'value_reference': 'product.pricelist,%d' % (own_id,),
+        })
+        snapshot = capture_chart(self.cr, registry, SUPERUSER_ID, self.reference_id, context={})
+        self.assertEqual(snapshot.skipped, {PRICELIST: 'product.pricelist,%d' % (own_id,)})
+        replay_chart(self.cr, registry, SUPERUSER_ID, snapshot, self.replayed_id, context={})
+        self.assertEqual(self.configuration(self.replayed_id)['properties'], [(RECEIVABLE[1], '400000')])
+
+
+def _id(value):
+    return value[0] if isinstance(value, (list, tuple)) else value
+
+
+if __name__ == '__main__':
+    unittest.main()
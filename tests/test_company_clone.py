@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+from confutil.company_clone import clone_company_configuration
+
+FIELD = ('res.partner', 'property_product_pricelist')
+
+
+class CompanyOwnedPropertyTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=3, users=1)
+        self.reference, self.target = self.data.companies(limit=2)
+
+    def clone_pricelist(self, company_id):
+        pricelists = self.data.registry['product.pricelist']
+        pricelist_id = pricelists.create(self.data.cr, UID, {'name': 'Public', 'company_id': company_id})
+        confutil.set_company_default_properties(self.data.cr, self.data.registry, UID,
+            {FIELD: {self.reference: pricelist_id}}, context={})
+        configuration = clone_company_configuration(self.data.cr, self.data.registry, UID,
+            self.reference, [self.target], context={})
+        properties = self.data.registry['ir.property'].search_read(self.data.cr, UID,
+            [('company_id', '=', self.target.id), ('res_id', '=', False)],
+            fields=['value_reference'])
+        return pricelist_id, configuration, [prop['value_reference'] for prop in properties]
+
+    def test_company_pricelist_is_skipped(self):
+        pricelist_id, configuration, target_values = self.clone_pricelist(self.reference.id)
+        self.assertEqual(configuration.skipped, [(FIELD, 'product.pricelist,%d' % pricelist_id)])
+        self.assertNotIn(FIELD, configuration.properties)
+        self.assertEqual(target_values, [])
+
+    def test_shared_pricelist_is_copied(self):
+        pricelist_id, configuration, target_values = self.clone_pricelist(False)
+        self.assertEqual(configuration.skipped, [])
+        self.assertEqual(target_values, ['product.pricelist,%d' % pricelist_id])
+
+
+class AccountSettingsCloneTest(unittest.TestCase):
+    def test_settings_copied(self):
+        data = Dataset(companies=2, users=1)
+        reference, target = data.companies()
+        confutil.set_default_taxes(data.cr, data.registry, UID, reference, 'ST11', 'PT11', context={})
+        configuration = clone_company_configuration(data.cr, data.registry, UID, reference, [target],
+            context={})
+        self.assertEqual(sorted(configuration.account_settings), ['default_purchase_tax', 'default_sale_tax'])
+        current = confutil.current_settings(data.cr, data.registry, UID, 'account.config.settings',
+            ['default_sale_tax'], company=target, context={})
+        self.assertEqual(current, {'default_sale_tax': data.registry['account.tax'].search(data.cr, UID,
+            [('company_id', '=', target.id), ('description', '=', 'ST11')])[0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fakeodoo import FakeColumn
+from tests.fixtures import Dataset, UID
+
+
+class GetMaybeIdTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=1)
+        self.company = self.data.company_ids[0]
+        self.accounts = self.data.registry['account.account']
+        self.domain = [('code', '=', self.data.codes[0]), ('company_id', '=', self.company)]
+        confutil.lookup_path_counts.clear()
+
+    def test_single_match(self):
+        found = confutil.get_maybe_id(self.accounts, self.data.cr, UID, self.domain)
+        self.assertEqual(found, self.accounts._search_ids(self.domain)[0])
+        self.assertEqual(confutil.lookup_path_counts, {'orm': 1})
+
+    def test_no_match(self):
+        domain = [('code', '=', 'nope')]
+        self.assertIsNone(confutil.get_maybe_id(self.accounts, self.data.cr, UID, domain))
+
+    def test_many_matches(self):
+        self.accounts._insert({'code': self.data.codes[0], 'company_id': self.company})
+        self.assertRaises(confutil.TooManyRecordsError,
+            confutil.get_maybe_id, self.accounts, self.data.cr, UID, self.domain)
+
+
+class SqlProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=1)
+        self.company = self.data.company_ids[0]
+        self.accounts = self.data.registry['account.account']
+        self.cr = self.data.cr
+        del self.cr.queries[:]
+        confutil.lookup_path_counts.clear()
+
+    def probe(self, domain, uid=UID, context=None):
+        return confutil.get_maybe_id(self.accounts, self.cr, uid, domain, context=context, use_sql=True)
+
+    def test_simple_domain_uses_sql(self):
+        # The fake cursor has no rows, so the probe finds nothing
+        self.assertIsNone(self.probe([('code', '=', '100000'), ('company_id', '=', self.company)]))
+        self.assertEqual(confutil.lookup_path_counts, {'sql': 1})
+        [(query, params)] = self.cr.queries
+        self.assertEqual(query, 'SELECT id FROM "account_account" WHERE "code" = %s AND "company_id" = %s '
+                                'ORDER BY id LIMIT 2')
+        self.assertEqual(params, ['100000', self.company])
+
+    def test_archived_records_hidden(self):
+        self.accounts._columns['active'] = FakeColumn('boolean')
+        self.probe([('code', '=', '100000')])
+        self.probe([('code', '=', '100000')], context={'active_test': False})
+        self.probe([('code', '=', '100000'), ('active', '=', True)])
+        self.assertEqual([query.count('"active"') for query, params in self.cr.queries], [1, 0, 1])
+
+    def test_falls_back_to_orm(self):
+        self.probe([('code', '=', '100000')], uid=UID + 1)
+        self.probe([('code', 'ilike', '100000')])
+        self.probe([('company_id.name', '=', 'x')])
+        self.probe([('company_id', '=', False)])
+        self.probe(['|', ('code', '=', '1'), ('code', '=', '2')])
+        self.assertEqual(self.cr.queries, [])
+        self.assertEqual(confutil.lookup_path_counts, {'orm': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
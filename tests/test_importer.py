@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tests.fixtures import Dataset, UID
+from confutil.importer import import_account_settings
+
+
+class ImportRowFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=1)
+        self.company = self.data.companies(limit=1)[0]
+        self.code = self.data.codes[0]
+
+    def import_rows(self, *rows):
+        return import_account_settings(self.data.cr, self.data.registry, UID, self.company,
+            list(enumerate(rows, 1)), context={})
+
+    def failures(self, report):
+        return [(line, type(error)) for line, _row, error in report.failed]
+
+    def test_taxes_as_list(self):
+        report = self.import_rows({'code': self.code, 'taxes': ['ST11', 'PT11']})
+        self.assertEqual(report.failed, [])
+        self.assertEqual(report.written, 1)
+
+    def test_bad_rows_fail_alone(self):
+        report = self.import_rows(
+            {'reconcile': 'true'},
+            {'code': self.code, 'taxes': {'ST11': True}},
+            {'code': self.code, 'taxes': ['ST11', 11]},
+            {'code': ['4000'], 'reconcile': 'true'},
+            {'code': self.code, 'reconcile': 'true'},
+        )
+        self.assertEqual(self.failures(report), [(1, ValueError), (2, TypeError), (3, TypeError), (4, TypeError)])
+        self.assertEqual(report.written, 1)
+
+    def test_repeated_code_last_row_wins(self):
+        other = self.data.codes[1]
+        report = self.import_rows(
+            {'code': other, 'name': 'X'},
+            {'code': self.code, 'name': 'Y'},
+            {'code': self.code, 'name': 'X'},
+        )
+        self.assertEqual(report.written, 2)
+        accounts = self.data.registry['account.account']
+        lookup = self.data.lookup()
+        self.assertEqual(accounts.browse(self.data.cr, UID, lookup.account_id(self.company, self.code)).name, 'X')
+        self.assertEqual(accounts.browse(self.data.cr, UID, lookup.account_id(self.company, other)).name, 'X')
+
+
+if __name__ == '__main__':
+    unittest.main()
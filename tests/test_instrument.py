@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from confutil.instrument import Instrumentation, QueryBudgetExceeded, TOTAL
+from tests.fixtures import Dataset, UID
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=1)
+        self.company = self.data.company_ids[0]
+        self.domain = [('code', '=', self.data.codes[0]), ('company_id', '=', self.company)]
+
+    def run_probe(self, instr, count=1):
+        cr = instr.cursor(self.data.cr)
+        registry = instr.registry(self.data.registry)
+        with instr.patch():
+            for _i in range(count):
+                # Through the module attribute, so that the patched version runs
+                confutil.get_maybe_id(registry['account.account'], cr, UID, self.domain, use_sql=True)
+
+    def test_counts(self):
+        instr = Instrumentation()
+        self.run_probe(instr, count=2)
+        report = instr.report()
+        self.assertEqual(report['get_maybe_id']['calls'], 2)
+        self.assertEqual(report['get_maybe_id']['queries'], 2)
+        self.assertEqual(report['get_maybe_id']['max_queries'], 1)
+        # Inclusive: the probe's query counts towards its caller too
+        self.assertEqual(report['_sql_probe_ids']['queries'], 2)
+        self.assertEqual(report[TOTAL]['queries'], 2)
+        self.assertIn('get_maybe_id', instr.format_report())
+
+    def test_orm_calls(self):
+        instr = Instrumentation()
+        registry = instr.registry(self.data.registry)
+        with instr.patch():
+            confutil.get_maybe_id(registry['account.account'], self.data.cr, UID, self.domain)
+        self.assertEqual(instr.report()['get_maybe_id']['orm_calls'], 1)
+        self.assertEqual(instr.report()['get_maybe_id']['queries'], 0)
+
+    def test_within_budget(self):
+        instr = Instrumentation(budgets={'get_maybe_id': 1})
+        self.run_probe(instr, count=3)
+        instr.check_budgets()
+
+    def test_over_budget(self):
+        instr = Instrumentation(budgets={'get_maybe_id': 0})
+        self.assertRaises(QueryBudgetExceeded, self.run_probe, instr)
+
+    def test_check_budgets_after_caught_error(self):
+        instr = Instrumentation(budgets={'_sql_probe_ids': 0})
+        try:
+            self.run_probe(instr)
+        except QueryBudgetExceeded:
+            pass
+        self.assertRaises(QueryBudgetExceeded, instr.check_budgets)
+
+    def test_patch_restores_helpers(self):
+        original = confutil.get_maybe_id
+        original_method = confutil.Lookup.account_id
+        instr = Instrumentation()
+        with instr.patch():
+            self.assertIsNot(confutil.get_maybe_id, original)
+            self.data.lookup().account_id(self.data.companies(limit=1)[0], self.data.codes[0])
+        self.assertIs(confutil.get_maybe_id, original)
+        self.assertEqual(confutil.Lookup.account_id, original_method)
+        self.assertEqual(instr.report()['Lookup.account_id']['calls'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
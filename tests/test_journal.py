@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil.journal import Journal, journal_key
+from tests.fixtures import Dataset, UID
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.company = self.data.companies(limit=1)[0]
+        self.calls = []
+
+    def journal(self, **kwargs):
+        return Journal(self.data.cr, self.data.registry, UID, context={}, **kwargs)
+
+    def configure(self, cr, registry, uid, company, level, context=None):
+        self.calls.append((company.id, level))
+        return {'company': company, 'level': level}
+
+    def other(self, cr, registry, uid, context=None):
+        self.calls.append('other')
+
+    def test_repeated_call_skipped(self):
+        first = self.journal()
+        result = first.call(self.configure, self.company, 'Manager', context={'lang': 'en_GB'})
+        self.assertEqual(result, {'company': self.company, 'level': 'Manager'})
+        # A later run, with a different context, reads the entry back
+        second = self.journal()
+        outcome = second.call(self.configure, self.company, 'Manager', context={})
+        self.assertEqual(self.calls, [(self.company.id, 'Manager')])
+        self.assertEqual(second.skipped, 1)
+        self.assertEqual(outcome, [[u'company', [u'res.company', self.company.id]], [u'level', u'Manager']])
+
+    def test_different_arguments_run(self):
+        journal = self.journal()
+        journal.call(self.configure, self.company, 'Manager')
+        journal.call(self.configure, self.company, 'User')
+        journal.call(self.configure, self.data.companies()[1], 'Manager')
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(journal.skipped, 0)
+
+    def test_browse_records_fingerprinted_by_id(self):
+        again = self.data.registry['res.company'].browse(self.data.cr, UID, self.company.id)
+        self.assertEqual(journal_key('configure', (self.company,), {}), journal_key('configure', (again,), {}))
+        self.assertEqual(journal_key('configure', (), {'batch': object()}), journal_key('configure', (), {}))
+
+    def test_force(self):
+        self.journal().call(self.configure, self.company, 'Manager')
+        forced = self.journal(force=True)
+        forced.call(self.configure, self.company, 'Manager')
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(forced.skipped, 0)
+        # Rewritten, not duplicated
+        self.assertEqual(len(self.journal().entries()), 1)
+
+    def test_forget(self):
+        journal = self.journal()
+        journal.call(self.configure, self.company, 'Manager')
+        journal.call(self.other)
+        self.assertEqual([entry['helper'] for entry in journal.entries()], ['configure', 'other'])
+        self.assertEqual(journal.forget('configure'), 1)
+        self.assertEqual([entry['helper'] for entry in self.journal().entries()], ['other'])
+        self.journal().call(self.configure, self.company, 'Manager')
+        self.journal().call(self.other)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.journal().forget(), 2)
+        self.assertEqual(self.journal().entries(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
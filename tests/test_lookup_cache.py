@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+
+
+class LookupCacheTest(unittest.TestCase):
+    def test_least_recently_used_evicted(self):
+        cache = confutil.LookupCache(object(), 2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertRaises(KeyError, cache.get, 'b')
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.info(), {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2})
+
+    def test_invalidate_model(self):
+        cache = confutil.LookupCache(object(), 10)
+        cache.put(('account.account', ()), 1)
+        cache.put(('account.tax', ()), 2)
+        cache.invalidate('account.account')
+        self.assertRaises(KeyError, cache.get, ('account.account', ()))
+        self.assertEqual(cache.get(('account.tax', ())), 2)
+
+
+class CachedLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.company = self.data.companies(limit=1)[0]
+        self.lookup = self.data.lookup(cache_size=100)
+        self.data.registry.reset_counters()
+
+    def test_repeated_lookup_searches_once(self):
+        first = self.lookup.account_id(self.company, self.data.codes[0])
+        self.assertEqual(self.lookup.account_id(self.company, self.data.codes[0]), first)
+        self.assertEqual(self.data.registry.round_trips, 1)
+
+    def test_missing_record_cached(self):
+        domain = [('company_id', '=', self.company.id), ('code', '=', '999999')]
+        self.assertIsNone(self.lookup.maybe_id('account.account', domain))
+        self.assertIsNone(self.lookup.maybe_id('account.account', domain))
+        self.assertEqual(self.data.registry.round_trips, 1)
+
+    def test_write_invalidates_model(self):
+        self.assertRaises(confutil.NoRecordsError, self.lookup.account_id, self.company, '999999')
+        account_id = confutil.create_consolidation_account(self.data.cr, self.data.registry, UID,
+            self.company, code='999999', name='Consolidation', children=[], context={})
+        self.assertEqual(self.lookup.account_id(self.company, '999999'), account_id)
+
+    def test_other_cursor_keeps_cache(self):
+        self.lookup.account_id(self.company, self.data.codes[0])
+        confutil.invalidate_lookups(self.data.registry.cursor(), 'account.account')
+        self.assertEqual(self.lookup.cache_info()['size'], 1)
+        confutil.invalidate_lookups(self.data.cr)
+        self.assertEqual(self.lookup.cache_info()['size'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
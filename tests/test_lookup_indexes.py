@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from confutil.account_setup import create_fiscal_years
+from tests.fixtures import Dataset, UID
+
+
+class AccountIndexInvalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.lookup = self.data.lookup()
+        self.company = self.data.companies()[0]
+
+    def test_new_account_appears_in_prefix_lookup(self):
+        self.assertEqual(self.lookup.account_ids_by_prefix(self.company, '4'), [])
+        account_id = confutil.create_consolidation_account(self.data.cr, self.data.registry, UID,
+            self.company, code='4999', name='Consolidation', children=[], context={})
+        self.assertEqual(self.lookup.account_ids_by_prefix(self.company, '4'), [account_id])
+        self.assertEqual(self.lookup.account_id(self.company, '4999'), account_id)
+
+    def test_other_cursor_keeps_its_index(self):
+        index = self.lookup.account_index(self.company)
+        confutil.invalidate_lookups(self.data.registry.cursor(), 'account.account')
+        self.assertIs(self.lookup.account_index(self.company), index)
+
+
+class PeriodIndexInvalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.lookup = self.data.lookup()
+        self.company_id = self.data.company_ids[0]
+
+    def test_periods_found_after_creating_fiscal_years(self):
+        self.assertRaises(confutil.NoRecordsError, self.lookup.period_id, self.company_id, '2015-03-15')
+        self.assertRaises(confutil.NoRecordsError, self.lookup.fiscalyear_id, self.company_id, '2015-03-15')
+        create_fiscal_years(self.data.cr, self.data.registry, UID, [self.company_id], [2015], context={})
+        period = self.data.registry['account.period'].browse(self.data.cr, UID,
+            self.lookup.period_id(self.company_id, '2015-03-15'))
+        self.assertEqual(period.date_start, '2015-03-01')
+        self.assertTrue(self.lookup.fiscalyear_id(self.company_id, '2015-03-15'))
+        self.assertEqual(self.lookup.period_index(self.company_id).gaps(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
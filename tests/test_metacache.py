@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+from confutil.metacache import MetadataCache, use_metadata_cache, stop_metadata_cache
+
+FIELD = ('res.partner', 'property_product_pricelist')
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.directory = tempfile.mkdtemp()
+        use_metadata_cache(self.data.cr, self.data.registry, UID, os.path.join(self.directory, 'cache.sqlite'))
+
+    def tearDown(self):
+        stop_metadata_cache(self.data.cr)
+        shutil.rmtree(self.directory)
+
+    def test_property_fields_are_cached(self):
+        company = self.data.companies(limit=1)[0]
+        pricelists = self.data.registry['product.pricelist']
+        for name in ('First', 'Second'):
+            pricelist_id = pricelists.create(self.data.cr, UID, {'name': name})
+            self.data.registry.reset_counters()
+            confutil.set_company_default_properties(self.data.cr, self.data.registry, UID,
+                {FIELD: {company: pricelist_id}}, context={})
+            searches = self.data.registry.calls['ir.model.fields', 'search_read']
+        self.assertEqual(searches, 0)
+
+    def test_group_ids_are_cached_per_language(self):
+        english = confutil._app_group_ids(self.data.cr, self.data.registry, UID,
+            [('Sales', 'Manager')], context={'lang': 'en_US'})
+        self.data.registry.reset_counters()
+        self.assertEqual(confutil._app_group_ids(self.data.cr, self.data.registry, UID,
+            [('Sales', 'Manager')], context={'lang': 'en_US'}), english)
+        self.assertEqual(self.data.registry.calls['res.groups', 'search_read'], 0)
+        confutil._app_group_ids(self.data.cr, self.data.registry, UID,
+            [('Sales', 'Manager')], context={'lang': 'fr_FR'})
+        self.assertEqual(self.data.registry.calls['res.groups', 'search_read'], 1)
+
+
+class ThreadedMetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = MetadataCache(os.path.join(self.directory, 'cache.sqlite'), 'fake', signature='a')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_threads_share_cache(self):
+        self.cache.put(['main'], 1)
+        errors = []
+
+        def work(number):
+            try:
+                self.assertEqual(self.cache.get(['main']), 1)
+                self.cache.put(['thread', number], number)
+            except Exception as error:
+                errors.append(error)
+        threads = [threading.Thread(target=work, args=(number,)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual([self.cache.get(['thread', number]) for number in range(4)], range(4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset
+
+
+class PendingIdTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=1)
+        self.lookup = self.data.lookup(deferred=True)
+        self.company = self.data.companies()[0]
+
+    def account_domain(self, code):
+        return [('company_id', '=', self.company.id), ('code', '=', code)]
+
+    def test_int_of_found_record(self):
+        pending = self.lookup.maybe_id('account.account', self.account_domain(self.data.codes[0]))
+        self.assertIsInstance(pending, confutil.PendingId)
+        self.assertEqual(int(pending), self.data.lookup().account_id(self.company, self.data.codes[0]))
+
+    def test_int_of_missing_record_raises(self):
+        pending = self.lookup.maybe_id('account.account', self.account_domain('no such code'))
+        self.assertIsInstance(pending, confutil.PendingId)
+        self.assertIsNone(pending.value)
+        self.assertRaises(confutil.NoRecordsError, int, pending)
+
+    def test_failed_flush_raises_on_access(self):
+        class QueryFailed(Exception):
+            pass
+
+        def fail(*args, **kwargs):
+            raise QueryFailed()
+        maybe = self.lookup.maybe_id('account.account', self.account_domain(self.data.codes[0]))
+        required = self.lookup.account_id(self.company, self.data.codes[1])
+        self.data.registry['account.account'].search_read = fail
+        self.assertRaises(QueryFailed, lambda: maybe.value)
+        self.assertRaises(QueryFailed, lambda: required.value)
+
+    def test_name_search_is_not_deferred(self):
+        self.assertRaises(confutil.NoRecordsError, self.lookup.exactly_one_id, 'account.account',
+            [('company_id', '=', 'No such company'), ('code', '=', self.data.codes[0])])
+        self.assertEqual(self.lookup.flush(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
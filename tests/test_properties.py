@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+
+PRICELIST = ('res.partner', 'property_product_pricelist')
+COST_METHOD = ('product.template', 'cost_method')
+
+
+class CompanyDefaultPropertiesTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.registry = self.data.registry
+        self.registry['ir.model.fields']._insert({
+            'model': 'product.template', 'name': 'cost_method', 'ttype': 'selection', 'relation': False,
+        })
+        self.companies = self.data.companies()
+        self.other_pricelist_id = self.registry['product.pricelist']._insert({'name': 'Trade'})
+
+    def set(self, properties):
+        return confutil.set_company_default_properties(self.data.cr, self.registry, UID, properties,
+            context={})
+
+    def properties(self):
+        return sorted(
+            (prop['company_id'], prop.get('value_reference') or prop.get('value_text'))
+            for prop in self.registry['ir.property']._records.values()
+        )
+
+    def test_created(self):
+        created = self.set({
+            PRICELIST: dict((company, self.data.pricelist_id) for company in self.companies),
+            COST_METHOD: {self.companies[0].id: 'average'},
+        })
+        self.assertEqual(created, 3)
+        reference = 'product.pricelist,%d' % (self.data.pricelist_id,)
+        self.assertEqual(self.properties(), sorted([
+            (self.companies[0].id, reference),
+            (self.companies[1].id, reference),
+            (self.companies[0].id, 'average'),
+        ]))
+
+    def test_unchanged_skipped(self):
+        properties = {PRICELIST: dict((company, self.data.pricelist_id) for company in self.companies)}
+        self.set(properties)
+        self.registry.reset_counters()
+        self.assertEqual(self.set(properties), 0)
+        self.assertEqual(self.registry.calls[('ir.property', 'create')], 0)
+        self.assertEqual(self.registry.calls[('ir.property', 'unlink')], 0)
+        self.assertEqual(self.registry.calls[('ir.property', 'search_read')], 1)
+
+    def test_changed_replaced(self):
+        self.set({PRICELIST: dict((company, self.data.pricelist_id) for company in self.companies)})
+        self.registry.reset_counters()
+        created = self.set({PRICELIST: {
+            self.companies[0]: self.data.pricelist_id,
+            self.companies[1]: 'product.pricelist,%d' % (self.other_pricelist_id,),
+        }})
+        self.assertEqual(created, 1)
+        self.assertEqual(self.registry.calls[('ir.property', 'unlink')], 1)
+        self.assertEqual(self.properties(), sorted([
+            (self.companies[0].id, 'product.pricelist,%d' % (self.data.pricelist_id,)),
+            (self.companies[1].id, 'product.pricelist,%d' % (self.other_pricelist_id,)),
+        ]))
+
+    def test_unknown_field(self):
+        self.assertRaises(confutil.NoRecordsError, self.set, {('res.partner', 'nope'): {self.companies[0]: 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+from tests.fakeodoo import serve_registry
+from confutil.rpc import RpcConnection
+
+
+class RpcHelpersTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.data.registry['ir.model.data']._insert({
+            'module': 'base', 'name': 'main_company', 'model': 'res.company', 'res_id': self.data.company_ids[0],
+        })
+        self.server = serve_registry(self.data.registry)
+        self.connection = RpcConnection('http://%s:%d' % self.server.server_address, 'fake', 'admin', 'admin')
+        self.cr = self.connection.cursor()
+        self.registry = self.connection.registry()
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_lookup(self):
+        lookup = confutil.Lookup(self.cr, self.registry, self.connection.uid, context={})
+        company = lookup.xmlid('base.main_company')
+        self.assertEqual(company.id, self.data.company_ids[0])
+        self.assertEqual(lookup.account_id(company, self.data.codes[1]),
+            confutil.Lookup(self.data.cr, self.data.registry, UID).account_id(company, self.data.codes[1]))
+
+    def test_deferred_lookup_uses_multicall(self):
+        outcomes = self.connection.multicall_outcomes
+        calls = []
+        self.connection.multicall_outcomes = lambda batch: calls.append(batch) or outcomes(batch)
+        lookup = confutil.Lookup(self.cr, self.registry, self.connection.uid, context={}, deferred=True)
+        company = self.registry['res.company'].browse(self.cr, self.connection.uid, self.data.company_ids[0])
+        account = lookup.account_id(company, self.data.codes[1])
+        tax = lookup.maybe_id('account.tax', [('company_id', '=', company.id), ('description', '=', 'ST11')])
+        local = self.data.lookup()
+        self.assertEqual(account.value, local.account_id(company, self.data.codes[1]))
+        self.assertEqual(tax.value, local.maybe_id('account.tax',
+            [('company_id', '=', company.id), ('description', '=', 'ST11')]))
+        self.assertEqual([[(model, method) for model, method, _args, _kwargs in batch] for batch in calls],
+            [[('account.account', 'search_read'), ('account.tax', 'search_read')]])
+
+    def test_settings(self):
+        company = self.registry['res.company'].browse(self.cr, self.connection.uid, self.data.company_ids[1])
+        confutil.set_default_taxes(self.cr, self.registry, self.connection.uid, company, 'ST11', 'PT11', context={})
+        current = confutil.current_settings(self.cr, self.registry, self.connection.uid, 'account.config.settings',
+            ['default_sale_tax', 'default_purchase_tax'], company=company, context={})
+        self.assertEqual(sorted(current.values()), sorted(self.data.registry['account.tax'].search(
+            self.data.cr, UID, [('company_id', '=', company.id)])))
+        self.assertFalse(confutil.set_settings(self.cr, self.registry, self.connection.uid, 'account.config.settings',
+            changes=current, company=company, context={}))
+
+
+if __name__ == '__main__':
+    unittest.main()
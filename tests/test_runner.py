@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import unittest
+
+from confutil import runner
+from tests.fakeodoo import make_registry
+
+
+def registry_factory(db_name):
+    return make_registry(db_name=db_name)
+
+
+def configure(cr, registry):
+    if cr.dbname.startswith('broken'):
+        raise ValueError('cannot configure %s' % (cr.dbname,))
+    if cr.dbname.startswith('slow'):
+        time.sleep(30)
+    if cr.dbname.startswith('crash'):
+        os._exit(3)
+    if cr.dbname.startswith('unpicklable'):
+        return lambda: None
+    return cr.dbname.upper()
+
+
+class ProvisionDatabasesTest(unittest.TestCase):
+    def provision(self, db_names, **kwargs):
+        return runner.provision_databases(db_names, configure,
+            registry_factory=registry_factory, **kwargs)
+
+    def test_results_in_order(self):
+        report = self.provision(['one', 'broken', 'two'], max_workers=2)
+        self.assertEqual([(r.db_name, r.status) for r in report.results],
+            [('one', 'ok'), ('broken', 'error'), ('two', 'ok')])
+        results = report.by_database()
+        self.assertEqual(results['one'].result, 'ONE')
+        self.assertIsNone(results['one'].error)
+        self.assertIn('ValueError: cannot configure broken', results['broken'].error)
+        self.assertEqual([r.db_name for r in report.failed()], ['broken'])
+        self.assertIn('3 database(s)', report.summary())
+
+    def test_timeout(self):
+        started = time.time()
+        report = self.provision(['slow', 'one'], timeout=0.5)
+        self.assertLess(time.time() - started, 10)
+        slow = report.by_database()['slow']
+        self.assertEqual(slow.status, 'timeout')
+        self.assertIsNone(slow.result)
+        self.assertTrue(report.by_database()['one'].ok)
+
+    def test_worker_exits(self):
+        [result] = self.provision(['crash']).results
+        self.assertEqual(result.status, 'error')
+
+    def test_unpicklable_result(self):
+        [result] = self.provision(['unpicklable']).results
+        self.assertEqual((result.status, result.result), ('ok', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+
+
+class CurrentSettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.company = self.data.companies(limit=1)[0]
+
+    def current(self, fields, company=None):
+        return confutil.current_settings(self.data.cr, self.data.registry, UID, 'account.config.settings',
+            fields, company=company, context={})
+
+    def test_only_asked_fields(self):
+        self.assertEqual(self.current(['group_multi_currency']), {})
+        self.assertEqual(self.current(['module_account_accountant']), {'module_account_accountant': False})
+
+    def test_company_values(self):
+        confutil.set_account_settings(self.data.cr, self.data.registry, UID,
+            {'group_multi_currency': True}, self.company, context={})
+        self.assertEqual(self.current(['group_multi_currency'], company=self.company),
+            {'group_multi_currency': True})
+
+
+class SetSettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=1)
+        self.company = self.data.companies(limit=1)[0]
+        self.registry = self.data.registry
+
+    def set(self, changes, **kwargs):
+        return confutil.set_settings(self.data.cr, self.registry, UID, 'account.config.settings', changes,
+            company=self.company, context={}, **kwargs)
+
+    def test_unchanged_settings_not_executed(self):
+        self.assertTrue(self.set({'group_multi_currency': True}))
+        self.assertFalse(self.set({'group_multi_currency': True}))
+        self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 1)
+
+    def test_changed_settings_executed(self):
+        self.set({'group_multi_currency': True})
+        self.assertTrue(self.set({'group_multi_currency': False}))
+        self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 2)
+
+    def test_force(self):
+        self.set({'group_multi_currency': True})
+        self.assertTrue(self.set({'group_multi_currency': True}, force=True))
+        self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 2)
+
+
+class SettingsBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=2, users=1)
+        self.company = self.data.companies(limit=1)[0]
+        self.batch = confutil.SettingsBatch(self.data.cr, self.data.registry, UID, context={})
+
+    def test_conflict_queues_nothing(self):
+        self.batch.add('account.config.settings', {'group_multi_currency': True}, company=self.company)
+        self.assertRaises(confutil.SettingsConflictError, self.batch.add, 'account.config.settings',
+            {'default_sale_tax': 1, 'group_multi_currency': False}, company=self.company)
+        self.assertEqual(self.batch.pending(),
+            [('account.config.settings', self.company.id, {'group_multi_currency': True})])
+
+    def test_merged_per_form_in_queued_order(self):
+        other = self.data.companies()[1]
+        self.batch.add('base.config.settings', {'module_multi_company': True})
+        self.batch.add('account.config.settings', {'group_multi_currency': True}, company=self.company)
+        self.batch.add('account.config.settings', {'default_sale_tax': 1}, company=other)
+        self.batch.add('account.config.settings', {'default_purchase_tax': 2}, company=self.company)
+        self.batch.add('base.config.settings', {'module_multi_company': True})
+        self.assertEqual(self.batch.pending(), [
+            ('base.config.settings', None, {'module_multi_company': True}),
+            ('account.config.settings', self.company.id, {'group_multi_currency': True, 'default_purchase_tax': 2}),
+            ('account.config.settings', other.id, {'default_sale_tax': 1}),
+        ])
+
+    def test_flush_executes_each_form_once(self):
+        registry = self.data.registry
+        with self.batch:
+            self.batch.add('account.config.settings', {'group_multi_currency': True}, company=self.company)
+            self.batch.add('account.config.settings', {'default_sale_tax': 1}, company=self.company)
+            self.batch.add('base.config.settings', {'module_multi_company': True})
+        self.assertEqual(registry.calls[('account.config.settings', 'execute')], 1)
+        self.assertEqual(registry.calls[('base.config.settings', 'execute')], 1)
+        applied = registry['account.config.settings'].applied_by_company[self.company.id]
+        self.assertEqual((applied['group_multi_currency'], applied['default_sale_tax']), (True, 1))
+        self.assertEqual(self.batch.pending(), [])
+
+    def test_nothing_flushed_if_block_raises(self):
+        def queue_then_fail():
+            with self.batch:
+                self.batch.add('base.config.settings', {'module_multi_company': True})
+                raise ValueError('oops')
+        self.assertRaises(ValueError, queue_then_fail)
+        self.assertEqual(self.data.registry.calls[('base.config.settings', 'execute')], 0)
+        self.assertEqual(self.data.registry['base.config.settings'].applied, {})
+
+    def test_set_settings_with_batch_returns_none(self):
+        self.assertIsNone(confutil.set_account_settings(self.data.cr, self.data.registry, UID,
+            {'group_multi_currency': True}, self.company, context={}, batch=self.batch))
+        self.assertEqual(self.batch.flush(), 1)
+        self.assertEqual(self.batch.pending(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
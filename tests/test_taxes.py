@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+
+
+class CompanyTaxesTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=3, users=1)
+        self.registry = self.data.registry
+        self.companies = self.data.companies()
+        self.codes = dict((company, ('ST11', 'PT11')) for company in self.companies)
+        self.registry.reset_counters()
+
+    def tax_id(self, company, code):
+        return self.registry['account.tax']._search_ids(
+            [('company_id', '=', company.id), ('description', '=', code)])[0]
+
+    def test_company_tax_ids(self):
+        tax_ids = confutil.company_tax_ids(self.data.cr, self.registry, UID, self.codes, context={})
+        self.assertEqual(len(tax_ids), 6)
+        self.assertEqual(tax_ids[self.companies[1].id, 'PT11'], self.tax_id(self.companies[1], 'PT11'))
+        self.assertEqual(self.registry.round_trips, 1)
+
+    def test_company_tax_ids_missing(self):
+        codes = {self.companies[0]: ['ST11', 'ST99']}
+        try:
+            confutil.company_tax_ids(self.data.cr, self.registry, UID, codes, context={})
+        except confutil.BulkLookupError as e:
+            self.assertEqual(list(e.errors), [(self.companies[0].id, 'ST99')])
+        else:
+            self.fail('BulkLookupError not raised')
+
+    def test_default_taxes(self):
+        confutil.set_companies_default_taxes(self.data.cr, self.registry, UID, self.codes, context={})
+        settings = self.registry['account.config.settings']
+        self.assertEqual(self.registry.calls[('account.tax', 'search_read')], 1)
+        self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 3)
+        applied = settings.applied_by_company[self.companies[2].id]
+        self.assertEqual((applied['default_sale_tax'], applied['default_purchase_tax']),
+            (self.tax_id(self.companies[2], 'ST11'), self.tax_id(self.companies[2], 'PT11')))
+
+        self.registry.reset_counters()
+        confutil.set_companies_default_taxes(self.data.cr, self.registry, UID, self.codes, context={})
+        self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 0)
+
+    def test_default_taxes_batched(self):
+        with confutil.SettingsBatch(self.data.cr, self.registry, UID, context={}) as batch:
+            confutil.set_companies_default_taxes(self.data.cr, self.registry, UID, self.codes,
+                context={}, batch=batch)
+            self.assertEqual(len(batch.pending()), 3)
+            self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 0)
+        self.assertEqual(self.registry.calls[('account.config.settings', 'execute')], 3)
+
+    def test_default_product_taxes(self):
+        written = confutil.set_companies_default_product_taxes(self.data.cr, self.registry, UID, self.codes,
+            context={})
+        self.assertEqual(written, 6)
+        defaults = self.registry['ir.values']._search_ids([
+            ('company_id', '=', self.companies[0].id), ('name', '=', 'supplier_taxes_id'),
+        ])
+        self.assertEqual(self.registry['ir.values']._records[defaults[0]]['value'],
+            [self.tax_id(self.companies[0], 'PT11')])
+
+        self.registry.reset_counters()
+        self.assertEqual(confutil.set_companies_default_product_taxes(self.data.cr, self.registry, UID,
+            self.codes, context={}), 0)
+        self.assertEqual(self.registry.calls[('ir.values', 'set_default')], 0)
+
+        changed = {self.companies[0]: ('ST11', 'ST11')}
+        self.assertEqual(confutil.set_companies_default_product_taxes(self.data.cr, self.registry, UID,
+            changed, context={}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from confutil import confutil
+from tests.fixtures import Dataset, UID
+
+
+class UserLevelsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Dataset(companies=1, users=4)
+        self.registry = self.data.registry
+        self.users = self.data.users()
+        self.registry.reset_counters()
+
+    def level_field(self, category):
+        return [field for field, string in self.registry['res.users']._field_strings.items()
+                if string == category][0]
+
+    def values(self, user):
+        return self.registry['res.users']._records[user.id]
+
+    def test_identical_changes_written_together(self):
+        manager = {'Sales': 'Manager', 'Warehouse': 'User'}
+        confutil.select_users_levels(self.data.cr, self.registry, UID, [
+            (self.users[0], manager),
+            (self.users[1], {'Sales': 'See Own Leads'}),
+            (self.users[2], dict(manager)),
+            (self.users[3], manager),
+        ], context={})
+        self.assertEqual(self.registry.calls[('res.users', 'write')], 2)
+        self.assertEqual(self.registry.calls[('res.groups', 'search_read')], 1)
+        sales, warehouse = self.level_field('Sales'), self.level_field('Warehouse')
+        for user in (self.users[0], self.users[2], self.users[3]):
+            self.assertEqual(self.values(user)[sales], self.data.group_ids['Sales', 'Manager'])
+            self.assertEqual(self.values(user)[warehouse], self.data.group_ids['Warehouse', 'User'])
+        self.assertEqual(self.values(self.users[1])[sales], self.data.group_ids['Sales', 'See Own Leads'])
+        self.assertNotIn(warehouse, self.values(self.users[1]))
+
+    def test_no_level(self):
+        confutil.select_user_levels(self.data.cr, self.registry, UID, self.users[0],
+            {'Warehouse': False}, context={})
+        self.assertIs(self.values(self.users[0])[self.level_field('Warehouse')], False)
+
+    def test_access_rights(self):
+        confutil.set_users_access_rights(self.data.cr, self.registry, UID, [
+            (user, [('Warehouse', 'Manager', True), ('Sales', 'Manager', False)])
+            for user in self.users
+        ], context={})
+        self.assertEqual(self.registry.calls[('res.users', 'write')], 1)
+        values = self.values(self.users[3])
+        self.assertIs(values['in_group_%d' % (self.data.group_ids['Warehouse', 'Manager'],)], True)
+        self.assertIs(values['in_group_%d' % (self.data.group_ids['Sales', 'Manager'],)], False)
+
+    def test_sale_levels_use_crm_names_when_needed(self):
+        [sales_category] = self.registry['ir.module.category']._search_ids([('name', '=', 'Sales')])
+        crm_group = self.registry['res.groups']._insert({'name': 'User: All Leads', 'category_id': sales_category})
+        confutil.select_sale_user_levels(self.data.cr, self.registry, UID, [
+            (self.users[0], 'See Own Leads'),
+            (self.users[1], 'User: All Leads'),
+        ], context={})
+        sales = self.level_field('Sales')
+        self.assertEqual(self.values(self.users[0])[sales], self.data.group_ids['Sales', 'See Own Leads'])
+        self.assertEqual(self.values(self.users[1])[sales], crm_group)
+
+
+if __name__ == '__main__':
+    unittest.main()